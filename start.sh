@@ -23,3 +23,6 @@ fi
 
 # Start backend in a new terminal
 gnome-terminal -- bash -c "python3 manage.py runserver; exec bash"
+
+# Start the worker that sends queued device commands to HomeIO in a new terminal
+gnome-terminal -- bash -c "python3 manage.py run_homeio_outbox; exec bash"
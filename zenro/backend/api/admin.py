@@ -6,7 +6,8 @@ from .models import (
     SmartHome, HomeIORoom, SupportedDevice, Room, Device,
     DeviceLog1Min, DeviceLogDaily, DeviceLogMonthly,
     RoomLog1Min, RoomLogDaily, RoomLogMonthly, EnergyGenerationDaily, EnergyGenerationMonthly, EnergyGeneration1Min,
-    UserProfile, RecoveryCode
+    UserProfile, RecoveryCode, MinuteTick,
+    DeviceRunningTotal, RoomRunningTotal, HomeRunningTotal, DailyRollupStatus, HomeIOCommand, Scene
 )
 
 # Create a custom form for Device
@@ -44,3 +45,10 @@ admin.site.register(EnergyGenerationDaily)
 admin.site.register(EnergyGenerationMonthly)
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(RecoveryCode)
+admin.site.register(MinuteTick)
+admin.site.register(DeviceRunningTotal)
+admin.site.register(RoomRunningTotal)
+admin.site.register(HomeRunningTotal)
+admin.site.register(DailyRollupStatus)
+admin.site.register(HomeIOCommand)
+admin.site.register(Scene)
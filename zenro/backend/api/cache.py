@@ -0,0 +1,195 @@
+"""
+Response cache for the endpoints whose data only changes when the minute tick commits.
+
+Entries are keyed by endpoint, home and the tick watermark (the minute of the last
+committed tick). The tick moves the watermark once its transaction commits, so every
+entry computed before it stops being looked up and simply expires. Jobs that rewrite
+minute logs or running totals outside the tick bump the 'minute_logs' version, which
+is keyed in alongside the watermark (see get_tick_version). The cache alias
+is configurable through RESPONSE_CACHE_ALIAS, and the backend through CACHES.
+
+Data that changes on user actions rather than on the tick, such as the HomeIO room
+catalogue, is keyed by a version number instead, bumped by signals (or by the
+rollups) when the underlying rows change. The same watermark or versions give the
+ETags of conditional GET requests (see ConditionalGetMixin), so an unchanged
+response is answered with 304 from cache lookups alone.
+
+Hits, misses and the time spent computing misses are counted per endpoint in the
+cache itself, so the numbers are shared by every worker using the same backend.
+"""
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import quote_etag
+from .models import MinuteTick
+
+WATERMARK_KEY = 'tick:watermark'
+
+# Endpoints served through cached_response, reported by get_stats()
+CACHED_ENDPOINTS = (
+    'dashboard',
+    'room_daily_usage',
+    'room_weekly_usage',
+    'energy_generation',
+    'energy_generation_daily',
+    'energy_generation_monthly',
+    'homeio_rooms',
+)
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+def get_watermark():
+    """
+    Minute of the last committed tick, as an ISO string.
+
+    Falls back to the MinuteTick ledger when the cache has no watermark yet,
+    for example after the cache was cleared.
+    """
+    cache = get_cache()
+    watermark = cache.get(WATERMARK_KEY)
+    if watermark is None:
+        latest = MinuteTick.objects.order_by('-minute').values_list('minute', flat=True).first()
+        watermark = latest.isoformat() if latest else 'none'
+        cache.add(WATERMARK_KEY, watermark, None)
+    return watermark
+
+def set_watermark(minute):
+    """Move the watermark to a committed tick; called by the tick on commit."""
+    get_cache().set(WATERMARK_KEY, minute.isoformat(), None)
+
+def get_version(scope):
+    """
+    Current version number of a scope of data, e.g. one home's rooms.
+
+    New versions start from the current time in milliseconds rather than 1, so a
+    version key that was evicted or expired never comes back as a number older
+    entries used. Version keys expire after CACHE_VERSION_TIMEOUT like any other
+    entry, so scopes that stop being read do not pile up in the cache.
+    """
+    cache = get_cache()
+    key = f"version:{scope}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), getattr(settings, 'CACHE_VERSION_TIMEOUT', 86400))
+        version = cache.get(key)
+    return version
+
+def bump_version(scope):
+    """Invalidate every entry cached under the current version of a scope."""
+    cache = get_cache()
+    try:
+        cache.incr(f"version:{scope}")
+    except ValueError:
+        get_version(scope)
+
+def get_tick_version():
+    """
+    Version of the data the minute tick writes: the tick watermark together with the
+    version of the 'minute_logs' scope, which the room log repair and the retention
+    purge bump when they change minute logs or running totals without a tick.
+    """
+    return f"{get_watermark()}.{get_version('minute_logs')}"
+
+def data_version(scopes=None):
+    """
+    Version string of some data: the tick version when scopes is None, otherwise
+    the current versions of the given scopes joined together.
+    """
+    if scopes is None:
+        return get_tick_version()
+    return '.'.join(str(get_version(scope)) for scope in scopes)
+
+def make_key(endpoint, home_id, params=None, version=None):
+    """
+    Cache key for one endpoint, home and set of request parameters, at the given
+    version or, by default, at the current tick version.
+    """
+    params_hash = hashlib.md5(
+        json.dumps(params or {}, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    version = get_tick_version() if version is None else version
+    return f"response:{endpoint}:{home_id}:{version}:{params_hash}"
+
+def make_etag(request, version):
+    """
+    ETag of a GET response at a data version.
+
+    Besides the version it covers everything else the response depends on: the
+    path, the query string, the user and the negotiated format.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = [
+        version,
+        request.path,
+        sorted(request.query_params.lists()),
+        getattr(request.user, 'pk', None),
+        renderer.media_type if renderer else None,
+    ]
+    return quote_etag(hashlib.md5(json.dumps(parts, default=str).encode()).hexdigest())
+
+def _add_to_stat(endpoint, field, amount):
+    cache = get_cache()
+    key = f"stats:{endpoint}:{field}"
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # First count for this key; if another worker created it meanwhile, add to theirs
+        if not cache.add(key, amount, None):
+            cache.incr(key, amount)
+
+def cached_response(endpoint, home_id, compute, params=None, version=None):
+    """
+    Return the cached data for an endpoint, computing and storing it on a miss.
+
+    Parameters:
+        endpoint: One of CACHED_ENDPOINTS
+        home_id: Home the data belongs to
+        compute: Callable returning the response data; it must be picklable,
+                 and None (e.g. for a missing home) is returned without caching
+        params: Request parameters that change the response, e.g. filters
+        version: Version to key the entry by instead of the tick version
+
+    Returns:
+        The response data
+    """
+    cache = get_cache()
+    key = make_key(endpoint, home_id, params, version)
+    data = cache.get(key)
+    if data is not None:
+        _add_to_stat(endpoint, 'hits', 1)
+        return data
+
+    started = time.perf_counter()
+    data = compute()
+    compute_ms = round((time.perf_counter() - started) * 1000)
+    if data is not None:
+        cache.set(key, data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 120))
+
+    _add_to_stat(endpoint, 'misses', 1)
+    _add_to_stat(endpoint, 'compute_ms', compute_ms)
+    return data
+
+def get_stats():
+    """Hit, miss and compute time counters per cached endpoint."""
+    keys = [
+        f"stats:{endpoint}:{field}"
+        for endpoint in CACHED_ENDPOINTS for field in ('hits', 'misses', 'compute_ms')
+    ]
+    values = get_cache().get_many(keys)
+
+    stats = {}
+    for endpoint in CACHED_ENDPOINTS:
+        hits = values.get(f"stats:{endpoint}:hits", 0)
+        misses = values.get(f"stats:{endpoint}:misses", 0)
+        compute_ms = values.get(f"stats:{endpoint}:compute_ms", 0)
+        stats[endpoint] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0,
+            'compute_ms': compute_ms,
+            'avg_compute_ms': compute_ms / misses if misses else 0
+        }
+    return {'watermark': get_watermark(), 'endpoints': stats}
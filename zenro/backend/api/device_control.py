@@ -0,0 +1,134 @@
+"""
+Batch control of many devices in one request.
+
+apply_device_actions() resolves device and room targets with one query, checks
+them against the user's homes with one more, saves every change with a bulk update
+and queues the HomeIO commands with a bulk insert into the outbox, all in one
+transaction. The outbox worker then sends the commands concurrently (see
+api/outbox.py). The cost is a fixed handful of queries however many devices change.
+"""
+from collections import Counter
+from django.db import models, transaction
+from django.utils import timezone
+from .live import device_event, get_broker
+from .models import Device, SmartHome
+from .outbox import enqueue_device_commands
+
+# Device types with an analogue value (intensity 0-10)
+ANALOGUE_DEVICE_TYPES = ('lighting', 'heating')
+
+# Results reported per device
+RESULT_QUEUED = 'queued'            # Saved, HomeIO command queued
+RESULT_SAVED = 'saved'              # Saved, nothing to send to HomeIO (e.g. dimming a device that is off)
+RESULT_UNCHANGED = 'unchanged'      # Already in the requested state
+RESULT_UNSUPPORTED = 'unsupported'  # Only an analogue value was requested for a device without one
+RESULT_FORBIDDEN = 'forbidden'      # Not in one of the user's homes
+RESULT_NOT_FOUND = 'not_found'      # No such device or room
+
+def _accessible_home_ids(user):
+    return set(SmartHome.objects.filter(
+        models.Q(creator=user) | models.Q(members=user)
+    ).values_list('id', flat=True))
+
+def _publish(devices):
+    broker = get_broker()
+    for device in devices:
+        broker.publish(device.room.smart_home_id, 'device', device_event(device))
+
+def apply_device_actions(user, actions):
+    """
+    Apply device actions for a user.
+
+    Parameters:
+        user: The requesting user; only devices in their homes are changed
+        actions: Validated actions, each with 'device' or 'room' and 'status'
+                 and/or 'analogue_value'; later actions win for the same device
+
+    Returns:
+        {'results': [{'device' or 'room', 'result', 'command_id'}], 'summary': {result: count}}
+    """
+    device_ids = {action['device'] for action in actions if 'device' in action}
+    room_ids = {action['room'] for action in actions if 'room' in action}
+
+    devices = Device.objects.filter(
+        models.Q(id__in=device_ids) | models.Q(room_id__in=room_ids)
+    ).select_related('room', 'supported_device')
+    home_ids = _accessible_home_ids(user)
+
+    by_id = {device.id: device for device in devices}
+    by_room = {}
+    for device in devices:
+        by_room.setdefault(device.room_id, []).append(device)
+
+    # Final requested values per device, in action order
+    requested = {}
+    missing = []
+    for action in actions:
+        if 'device' in action:
+            targets = [by_id[action['device']]] if action['device'] in by_id else []
+            if not targets:
+                missing.append({'device': action['device'], 'result': RESULT_NOT_FOUND, 'command_id': None})
+        else:
+            targets = by_room.get(action['room'], [])
+            if not targets:
+                missing.append({'room': action['room'], 'result': RESULT_NOT_FOUND, 'command_id': None})
+        for device in targets:
+            values = requested.setdefault(device.id, {})
+            for field in ('status', 'analogue_value'):
+                if field in action:
+                    values[field] = action[field]
+
+    results = {}
+    changed = []
+    now = timezone.now()
+    for device_id, values in requested.items():
+        device = by_id[device_id]
+        if device.room is None or device.room.smart_home_id not in home_ids:
+            results[device_id] = RESULT_FORBIDDEN
+            continue
+
+        new_status = values.get('status', device.status)
+        new_analogue = device.analogue_value
+        if 'analogue_value' in values:
+            if device.supported_device.type in ANALOGUE_DEVICE_TYPES:
+                new_analogue = values['analogue_value']
+            elif 'status' not in values:
+                results[device_id] = RESULT_UNSUPPORTED
+                continue
+
+        set_state = new_status != device.status
+        set_analogue = new_analogue != device.analogue_value and new_analogue is not None and bool(new_status)
+        if new_status == device.status and new_analogue == device.analogue_value:
+            results[device_id] = RESULT_UNCHANGED
+            continue
+
+        device.status, device.analogue_value, device.updated_at = new_status, new_analogue, now
+        changed.append((device, set_state, set_analogue))
+
+    commands = {}
+    if changed:
+        with transaction.atomic():
+            Device.objects.bulk_update(
+                [device for device, _, _ in changed], ['status', 'analogue_value', 'updated_at'], batch_size=500
+            )
+            commands = enqueue_device_commands(
+                [change for change in changed if change[1] or change[2]]
+            )
+            if get_broker().has_subscribers():
+                changed_devices = [device for device, _, _ in changed]
+                transaction.on_commit(lambda: _publish(changed_devices))
+        for device, _, _ in changed:
+            results[device.id] = RESULT_QUEUED if device.id in commands else RESULT_SAVED
+
+    report = [
+        {
+            'device': device_id,
+            'result': result,
+            'command_id': commands[device_id].pk if device_id in commands else None
+        }
+        for device_id, result in results.items()
+    ] + missing
+    return {
+        'results': report,
+        'summary': dict(Counter(item['result'] for item in report)),
+    }
@@ -1,51 +1,78 @@
 import logging
-from django.db.models.signals import pre_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
-from .models import Device
-from .home_io.home_io_services import HomeIOService
+from .models import Device, Room
+from .outbox import enqueue_device_command
+from .live import device_event, get_broker
 
 logger = logging.getLogger(__name__)
 
 @receiver(pre_save, sender=Device)
 def update_homeio_on_device_change(sender, instance, **kwargs):
     """
-    When a device's status or analogue_value changes in the database, send an HTTP request to control
-    the corresponding HomeIO device.
+    When a device's status or analogue_value changes in the database, note which
+    HomeIO commands it needs; they are queued once the save succeeds (see
+    queue_homeio_command).
     """
+    instance._homeio_changes = None
+    
     # Skip for new devices (no pk yet)
     if not instance.pk:
         return
         
     try:
-        # Get the original device state from database
-        old_instance = Device.objects.get(pk=instance.pk)
-        service = HomeIOService()
+        # Compare with the values the device was loaded with (see TrackedFieldsMixin),
+        # so no query is needed; only a device built by hand or loaded without these
+        # fields is read from the database
+        if instance.has_loaded('status') and instance.has_loaded('analogue_value'):
+            old_status = instance.initial_value('status')
+            old_analogue_value = instance.initial_value('analogue_value')
+        else:
+            old_status, old_analogue_value = Device.objects.filter(pk=instance.pk).values_list(
+                'status', 'analogue_value'
+            ).get()
         
         # Handle status changes
-        if old_instance.status != instance.status:
+        if old_status != instance.status:
             # Log the change
-            logger.info(f"Device {instance.name} status changed from {old_instance.status} to {instance.status}")
-            
-            # Control the device through HomeIO HTTP
-            success = service.set_device_state(instance)
-            
-            # Handle possible failure
-            if not success:
-                logger.warning(f"Failed to control HomeIO device {instance.name} status")
+            logger.info(f"Device {instance.name} status changed from {old_status} to {instance.status}")
+            instance._homeio_changes = {'set_state': True}
         
         # Handle direct analogue value changes (when status didn't change or changed in other ways)
-        elif old_instance.analogue_value != instance.analogue_value:
+        elif old_analogue_value != instance.analogue_value:
             # Only proceed if the device has an analogue value and is turned on
             if instance.analogue_value is not None and instance.status:
                 # Log the analogue value change
-                logger.info(f"Device {instance.name} analogue value changed from {old_instance.analogue_value} to {instance.analogue_value}")
-                
-                # Control the device through HomeIO HTTP
-                success = service.set_device_analogue_value(instance)
-                
-                # Handle possible failure
-                if not success:
-                    logger.warning(f"Failed to set analogue value for HomeIO device {instance.name}")
+                logger.info(f"Device {instance.name} analogue value changed from {old_analogue_value} to {instance.analogue_value}")
+                instance._homeio_changes = {'set_analogue': True}
             
     except Exception as e:
-        logger.error(f"Error handling device change: {e}")
\ No newline at end of file
+        logger.error(f"Error handling device change: {e}")
+
+@receiver(post_save, sender=Device)
+def queue_homeio_command(sender, instance, **kwargs):
+    """
+    Queue the HomeIO command for a device change in the HomeIO outbox instead of
+    calling HomeIO here, so saving a device never waits on the simulator. The
+    pending command is left on instance.homeio_command for the caller.
+    """
+    changes = getattr(instance, '_homeio_changes', None)
+    instance._homeio_changes = None
+    if changes:
+        instance.homeio_command = enqueue_device_command(instance, **changes)
+
+@receiver(post_save, sender=Device)
+def publish_device_change(sender, instance, **kwargs):
+    """
+    When a device is saved, push its new state to the live event streams of its
+    home once the change is committed (see api/live.py).
+    """
+    broker = get_broker()
+    # Nobody is listening in this process, so skip the lookup of the home
+    if not broker.has_subscribers() or instance.room_id is None:
+        return
+
+    home_id = Room.objects.filter(pk=instance.room_id).values_list('smart_home_id', flat=True).first()
+    data = device_event(instance)
+    transaction.on_commit(lambda: broker.publish(home_id, 'device', data))
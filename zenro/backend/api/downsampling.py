@@ -0,0 +1,129 @@
+"""
+Chart-sized series from the 1-minute log tables.
+
+bucket_series() aggregates the logs into fixed time buckets in SQL, keeping the sum,
+peak, minimum, average and count of every bucket, so a week of minute data comes back
+as a few hundred rows. lttb() then thins a series to a maximum number of points with
+the Largest-Triangle-Three-Buckets algorithm, which keeps the visual shape (spikes and
+dips) that picking every n-th point would lose.
+"""
+from datetime import timedelta
+from django.db import models
+from django.db.models.functions import ExtractMinute, Floor, TruncDay, TruncHour
+
+# Supported bucket sizes, in minutes
+BUCKET_MINUTES = {'5m': 5, '15m': 15, '1h': 60, '1d': 1440}
+
+def bucket_series(queryset, value_field, bucket=None):
+    """
+    Aggregate a log queryset into time buckets with one GROUP BY query.
+
+    Parameters:
+        queryset: Filtered DeviceLog1Min, RoomLog1Min or EnergyGeneration1Min rows
+        value_field: Column to aggregate, e.g. 'energy_usage'
+        bucket: Key of BUCKET_MINUTES, or None for one point per minute
+
+    Returns:
+        List of points ordered by time, each with the bucket start and the total,
+        peak, min, avg and count of the rows that fall in it
+    """
+    minutes = BUCKET_MINUTES[bucket] if bucket else 1
+    if minutes == 1:
+        keys = {'start': models.F('created_at')}
+    elif minutes < 60:
+        # Hour plus the slot of the minute within the hour
+        keys = {
+            'start': TruncHour('created_at'),
+            'slot': Floor(ExtractMinute('created_at') / models.Value(minutes)),
+        }
+    elif minutes == 60:
+        keys = {'start': TruncHour('created_at')}
+    else:
+        keys = {'start': TruncDay('created_at')}
+
+    rows = queryset.order_by().annotate(**keys).values(*keys).annotate(
+        total=models.Sum(value_field),
+        peak=models.Max(value_field),
+        min=models.Min(value_field),
+        avg=models.Avg(value_field),
+        count=models.Count('id')
+    ).order_by(*keys)
+
+    points = []
+    for row in rows:
+        start = row['start'] + timedelta(minutes=int(row.pop('slot', 0)) * minutes)
+        points.append({'start': start, **{key: row[key] for key in ('total', 'peak', 'min', 'avg', 'count')}})
+    return points
+
+def lttb(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Parameters:
+        xs: Increasing x values (e.g. timestamps in seconds)
+        ys: y values
+        threshold: Number of points to keep, at least 3
+
+    Returns:
+        Sorted indices of the points to keep; always includes the first and last
+    """
+    length = len(xs)
+    if threshold >= length or threshold < 3:
+        return list(range(length))
+
+    selected = [0]
+    # The first and last points are kept, the rest is split into threshold - 2 buckets
+    every = (length - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket, the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, length)
+        next_count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / next_count
+        avg_y = sum(ys[next_start:next_end]) / next_count
+
+        # Pick the point of this bucket forming the largest triangle with a and the average
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs(
+                (xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a])
+            )
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+
+    selected.append(length - 1)
+    return selected
+
+def build_series(queryset, value_field, bucket=None, max_points=None):
+    """
+    Chart series for a log queryset: bucketed in SQL, then thinned with LTTB when
+    there are more than max_points buckets.
+
+    The total and peak are computed before thinning, so they stay exact even when
+    the points that carried them are dropped.
+    """
+    points = bucket_series(queryset, value_field, bucket)
+    total = sum(point['total'] or 0 for point in points)
+    peak = max(points, key=lambda point: point['peak'], default=None)
+
+    if max_points and len(points) > max_points:
+        keep = lttb(
+            [point['start'].timestamp() for point in points],
+            [point['total'] or 0 for point in points],
+            max_points
+        )
+        points = [points[index] for index in keep]
+
+    return {
+        'bucket': bucket or '1m',
+        'max_points': max_points,
+        'total': total,
+        'peak': {'start': peak['start'], 'value': peak['peak']} if peak else None,
+        'points': points,
+    }
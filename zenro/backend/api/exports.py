@@ -0,0 +1,116 @@
+"""
+Streaming exports of the 1-minute log tables as CSV or NDJSON.
+
+Rows are read with a chunked iterator and written out line by line, optionally
+through an incremental gzip compressor, so memory use stays flat however long the
+exported range is. Used by the export endpoint and the export_logs command.
+"""
+import csv
+import io
+import json
+import zlib
+from django.conf import settings
+from .models import DeviceLog1Min, RoomLog1Min, EnergyGeneration1Min
+
+# Exportable tables: model, exported columns, and the lookups for entity and home filters
+EXPORTS = {
+    'device': {
+        'model': DeviceLog1Min,
+        'fields': ['created_at', 'device_id', 'status', 'energy_usage'],
+        'entity': 'device_id',
+        'home': 'device__room__smart_home_id',
+    },
+    'room': {
+        'model': RoomLog1Min,
+        'fields': ['created_at', 'room_id', 'energy_usage'],
+        'entity': 'room_id',
+        'home': 'room__smart_home_id',
+    },
+    'generation': {
+        'model': EnergyGeneration1Min,
+        'fields': ['created_at', 'home_id', 'energy_generation'],
+        'entity': 'home_id',
+        'home': 'home_id',
+    },
+}
+
+FORMATS = ('csv', 'ndjson')
+
+# Approximate size of the pieces handed to the response or output file
+OUTPUT_CHUNK_BYTES = 64 * 1024
+
+def export_rows(kind, start_date=None, end_date=None, entity_ids=None, home_ids=None):
+    """
+    Iterate over the rows of one log table in time order without loading them all.
+
+    Parameters:
+        kind: Key of EXPORTS
+        start_date, end_date: Inclusive day range, either may be omitted
+        entity_ids: Only these devices, rooms or homes (depending on kind)
+        home_ids: Only entities in these homes
+
+    Returns:
+        (column names, iterator of value tuples)
+    """
+    export = EXPORTS[kind]
+    queryset = export['model'].objects.for_dates(start_date, end_date)
+    if entity_ids is not None:
+        queryset = queryset.filter(**{f"{export['entity']}__in": entity_ids})
+    if home_ids is not None:
+        queryset = queryset.filter(**{f"{export['home']}__in": home_ids})
+
+    rows = queryset.order_by('created_at', 'id').values_list(*export['fields']).iterator(
+        chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    )
+    return export['fields'], rows
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def _csv_lines(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header alone, when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _ndjson_lines(fields, rows):
+    for row in rows:
+        yield json.dumps({field: _plain(value) for field, value in zip(fields, row)}) + '\n'
+
+def _chunked(lines):
+    """Join short lines into pieces of about OUTPUT_CHUNK_BYTES."""
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode()
+        pending.append(data)
+        size += len(data)
+        if size >= OUTPUT_CHUNK_BYTES:
+            yield b''.join(pending)
+            pending, size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+def _gzipped(chunks):
+    # wbits=31 selects the gzip container, so the output is a regular .gz file
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def stream_export(fields, rows, export_format='csv', compress=False):
+    """Turn export rows into an iterator of encoded (and optionally gzipped) byte chunks."""
+    lines = _csv_lines(fields, rows) if export_format == 'csv' else _ndjson_lines(fields, rows)
+    chunks = _chunked(lines)
+    return _gzipped(chunks) if compress else chunks
+
+def export_filename(kind, export_format, compress=False):
+    return f"{kind}_logs.{export_format}" + ('.gz' if compress else '')
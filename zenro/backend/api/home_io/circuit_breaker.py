@@ -0,0 +1,208 @@
+"""
+Circuit breaker for requests to the HomeIO host.
+
+When HomeIO is down, every request waits for the connect or read timeout. The
+breaker keeps the outcome and latency of the last HOME_IO_BREAKER_WINDOW requests
+and opens once at least HOME_IO_BREAKER_MIN_REQUESTS of them were made and
+HOME_IO_BREAKER_FAILURE_RATE of them failed. While it is open requests are refused
+at once. After HOME_IO_BREAKER_OPEN_SECONDS it turns half-open and lets a single
+probe through: a success closes it again, a failure opens it for twice as long,
+up to HOME_IO_BREAKER_MAX_OPEN_SECONDS.
+
+Each process has its own breaker. Its snapshot (state, failure rate, latency
+percentiles) is written to the shared cache, so the API can report the health of
+HomeIO and refuse control requests while the outbox worker sees it down.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.utils import timezone
+from ..cache import get_cache
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+SNAPSHOT_KEY = 'homeio:breaker'
+# A snapshot not refreshed for this long is stale, e.g. because its worker stopped
+SNAPSHOT_TIMEOUT = 300
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker over a rolling window of request outcomes.
+
+    Callers ask allow_request() for a token before a request and report the request
+    with record_success(token, latency) or record_failure(token, latency). The token
+    is the breaker's generation, which moves on every change of state, so a late
+    result of a request allowed before the change is ignored; in particular, only
+    the probe's own result decides a half-open breaker.
+    """
+    def __init__(self, window=50, min_requests=10, failure_rate=0.5,
+                 open_seconds=5, max_open_seconds=60, publish_seconds=1, clock=time.monotonic):
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.publish_seconds = publish_seconds
+        self.clock = clock
+        self._outcomes = deque(maxlen=window)   # (ok, latency in seconds)
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._open_for = open_seconds
+        self._opened_until = 0.0
+        self._probing = False
+        self._generation = 1
+        self._published = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(self.clock())
+
+    def _current_state(self, now):
+        if self._state == STATE_OPEN and now >= self._opened_until:
+            return STATE_HALF_OPEN
+        return self._state
+
+    def allow_request(self):
+        """
+        A token for sending a request now, or None when it must not be sent. Only one
+        request at a time, the probe, is allowed while half-open.
+        """
+        with self._lock:
+            state = self._current_state(self.clock())
+            if state == STATE_CLOSED:
+                return self._generation
+            if state == STATE_HALF_OPEN and not self._probing:
+                self._change_state(STATE_HALF_OPEN)
+                self._probing = True
+                return self._generation
+            return None
+
+    def record_success(self, token, latency):
+        self._record(token, True, latency)
+
+    def record_failure(self, token, latency):
+        self._record(token, False, latency)
+
+    def _change_state(self, state):
+        self._state = state
+        self._generation += 1
+
+    def _record(self, token, ok, latency):
+        with self._lock:
+            if token != self._generation:
+                # Allowed before the last change of state; its result no longer applies
+                return
+            now = self.clock()
+            self._outcomes.append((ok, latency))
+            changed = False
+            if self._state == STATE_HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self._change_state(STATE_CLOSED)
+                    self._open_for = self.open_seconds
+                    self._outcomes.clear()
+                    self._outcomes.append((ok, latency))
+                else:
+                    self._open(now, min(self._open_for * 2, self.max_open_seconds))
+                changed = True
+            elif self._state == STATE_CLOSED and not ok:
+                failures = sum(1 for outcome, _ in self._outcomes if not outcome)
+                if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.failure_rate:
+                    self._open(now, self.open_seconds)
+                    changed = True
+            publish = changed or self._published is None or now - self._published >= self.publish_seconds
+            if publish:
+                self._published = now
+                snapshot = self._snapshot(now)
+        if publish:
+            self.publish(snapshot)
+
+    def _open(self, now, seconds):
+        self._change_state(STATE_OPEN)
+        self._open_for = seconds
+        self._opened_until = now + seconds
+
+    def _snapshot(self, now):
+        latencies = sorted(latency for _, latency in self._outcomes)
+        failures = sum(1 for ok, _ in self._outcomes if not ok)
+        state = self._current_state(now)
+        return {
+            'state': state,
+            'requests': len(self._outcomes),
+            'failure_rate': round(failures / len(self._outcomes), 3) if self._outcomes else 0.0,
+            'latency_ms': {
+                name: None if value is None else round(value * 1000, 1)
+                for name, value in (
+                    ('p50', _percentile(latencies, 50)),
+                    ('p95', _percentile(latencies, 95)),
+                    ('p99', _percentile(latencies, 99)),
+                )
+            },
+            'retry_in': round(max(self._opened_until - now, 0), 1) if state == STATE_OPEN else 0,
+            'updated_at': timezone.now(),
+            'pid': os.getpid(),
+        }
+
+    def snapshot(self):
+        """State, failure rate and latency percentiles of the rolling window."""
+        with self._lock:
+            return self._snapshot(self.clock())
+
+    def publish(self, snapshot=None):
+        """Write the snapshot to the shared cache for other processes to read."""
+        try:
+            get_cache().set(SNAPSHOT_KEY, snapshot or self.snapshot(), SNAPSHOT_TIMEOUT)
+        except Exception:
+            # Health reporting must never break a HomeIO request
+            pass
+
+def get_breaker():
+    """The process-wide HomeIO circuit breaker, configured from the HOME_IO_BREAKER_* settings."""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    window=getattr(settings, 'HOME_IO_BREAKER_WINDOW', 50),
+                    min_requests=getattr(settings, 'HOME_IO_BREAKER_MIN_REQUESTS', 10),
+                    failure_rate=getattr(settings, 'HOME_IO_BREAKER_FAILURE_RATE', 0.5),
+                    open_seconds=getattr(settings, 'HOME_IO_BREAKER_OPEN_SECONDS', 5),
+                    max_open_seconds=getattr(settings, 'HOME_IO_BREAKER_MAX_OPEN_SECONDS', 60),
+                )
+    return _breaker
+
+def shared_snapshot():
+    """
+    The last breaker snapshot written by any process, or None when no process has
+    talked to HomeIO recently. The state of an open breaker whose open period has
+    since passed is reported as half-open.
+    """
+    snapshot = get_cache().get(SNAPSHOT_KEY)
+    if snapshot is None:
+        return None
+    if snapshot['state'] == STATE_OPEN:
+        elapsed = (timezone.now() - snapshot['updated_at']).total_seconds()
+        retry_in = max(snapshot['retry_in'] - elapsed, 0)
+        snapshot = {**snapshot, 'retry_in': round(retry_in, 1), 'state': STATE_OPEN if retry_in else STATE_HALF_OPEN}
+    return snapshot
+
+def homeio_unavailable():
+    """Seconds until HomeIO may be retried when the shared breaker is open, else None."""
+    snapshot = shared_snapshot()
+    if snapshot is not None and snapshot['state'] == STATE_OPEN:
+        return math.ceil(snapshot['retry_in'])
+    return None
@@ -1,40 +1,165 @@
 import requests
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+from .circuit_breaker import get_breaker
 
 logger = logging.getLogger(__name__)
 
+# Related objects read when building HomeIO URLs; select them with the device
+DEVICE_DETAILS_RELATED = ('supported_device__home_io_room',)
+
+_session = None
+_executor = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    The process-wide HTTP session used for HomeIO requests.
+
+    It keeps up to HOME_IO_POOL_SIZE keep-alive connections to HomeIO, so commands
+    reuse open connections instead of paying a TCP handshake each. Sending requests
+    through one session from several threads is safe; only its creation is locked.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = getattr(settings, 'HOME_IO_POOL_SIZE', 10)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+def get_executor():
+    """
+    The process-wide thread pool sending the requests of bulk commands.
+
+    It has one thread per keep-alive connection of the session (HOME_IO_POOL_SIZE),
+    so concurrent batches and scenes share the open connections instead of each
+    starting threads of its own, and no thread waits for a free connection.
+    """
+    global _executor
+    if _executor is None:
+        with _session_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'HOME_IO_POOL_SIZE', 10),
+                    thread_name_prefix='homeio'
+                )
+    return _executor
+
 class HomeIOService:
     """
     HomeIO service that controls devices via HTTP requests
+    
+    Requests go through the shared keep-alive session (see get_session) with
+    HOME_IO_CONNECT_TIMEOUT and HOME_IO_READ_TIMEOUT. Load devices with
+    select_related(*DEVICE_DETAILS_RELATED) so building their URLs runs no queries.
+    
+    Every request goes through the process-wide circuit breaker (see
+    circuit_breaker.py): while HomeIO keeps failing, requests are refused at once
+    instead of each waiting for the timeout.
     """
     def __init__(self):
         # Get base URL from settings or use default
         self.base_url = getattr(settings, 'HOME_IO_API_URL', 'http://10.101.186.87:9797')
+        self.timeout = (
+            getattr(settings, 'HOME_IO_CONNECT_TIMEOUT', 2),
+            getattr(settings, 'HOME_IO_READ_TIMEOUT', 5)
+        )
+        self.session = get_session()
+        self.breaker = get_breaker()
     
     def _get_device_details(self, device):
         """Helper method to extract common device details"""
-        device_type = device.supported_device.type
-        device_number = device.supported_device.number
-        zone = device.supported_device.home_io_room.zone
+        supported_device = device.supported_device
+        device_type = supported_device.type
+        device_number = supported_device.number
+        zone = supported_device.home_io_room.zone
         return device_type, device_number, zone
     
     def _send_request(self, url, device_name, action_type):
         """Helper method to send HTTP requests to HomeIO"""
+        token = self.breaker.allow_request()
+        if token is None:
+            logger.warning(f"HomeIO circuit breaker is open, not sending: {url}")
+            return False
+        
+        started = time.perf_counter()
         try:
             logger.info(f"Sending HomeIO control request: {url}")
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=self.timeout)
             
             if response.status_code == 200:
+                self.breaker.record_success(token, time.perf_counter() - started)
                 logger.info(f"Successfully controlled device {device_name} ({action_type})")
                 return True
             else:
+                self.breaker.record_failure(token, time.perf_counter() - started)
                 logger.error(f"Failed to control device: {response.status_code}, {response.text}")
                 return False
         except Exception as e:
+            self.breaker.record_failure(token, time.perf_counter() - started)
             logger.error(f"Error controlling HomeIO device: {e}")
             return False
         
+    def state_request(self, device):
+        """
+        Build the HomeIO request for a device's on/off status
+        
+        Returns:
+            (url, action description), or None when the device type has no HTTP control
+        """
+        device_type, device_number, zone = self._get_device_details(device)
+        status = device.status
+        
+        # Handle different device types
+        if device_type == 'lighting':
+            action = "turn_on" if status else "turn_off"
+            url = f"{self.base_url}/swl/{action}/{device_number}/{zone}"
+        elif device_type == 'heating':
+            action = "turn_on" if status else "turn_off"
+            url = f"{self.base_url}/swh/{action}/{zone}"
+        elif device_type == 'shades':
+            action = "up" if status else "down"
+            url = f"{self.base_url}/strs/{device_number}/{action}/{zone}"
+        else:
+            logger.info(f"Device type {device_type} not supported for HTTP control yet")
+            return None
+        
+        return url, f"status: {action}"
+    
+    def analogue_request(self, device):
+        """
+        Build the HomeIO request for a device's analogue value
+        
+        Returns:
+            (url, action description), or None when there is nothing to send
+        """
+        device_type, device_number, zone = self._get_device_details(device)
+        analogue_value = device.analogue_value
+        
+        if analogue_value is None:
+            logger.info(f"Device {device.name} has no analogue value to set")
+            return None
+            
+        # Handle different device types
+        if device_type == 'lighting':
+            url = f"{self.base_url}/stl/{device_number}/{zone}/{analogue_value}"
+        elif device_type == 'heating':
+            url = f"{self.base_url}/sth/{zone}/{analogue_value}"
+        else:
+            logger.info(f"Device type {device_type} does not support analogue control")
+            return None
+        
+        return url, f"analogue value: {analogue_value}"
+        
     def set_device_state(self, device):
         """
         Control a device's on/off status in HomeIO
@@ -43,25 +168,10 @@ class HomeIOService:
             device: Device model instance with status, supported_device, etc.
         """
         try:
-            # Get device details
-            device_type, device_number, zone = self._get_device_details(device)
-            status = device.status
-            
-            # Handle different device types
-            if device_type == 'lighting':
-                action = "turn_on" if status else "turn_off"
-                url = f"{self.base_url}/swl/{action}/{device_number}/{zone}"
-            elif device_type == 'heating':
-                action = "turn_on" if status else "turn_off"
-                url = f"{self.base_url}/swh/{action}/{zone}"
-            elif device_type == 'shades':
-                action = "up" if status else "down"
-                url = f"{self.base_url}/strs/{device_number}/{action}/{zone}"
-            else:
-                logger.info(f"Device type {device_type} not supported for HTTP control yet")
+            request = self.state_request(device)
+            if request is None:
                 return False
-                
-            return self._send_request(url, device.name, f"status: {action}")
+            return self._send_request(request[0], device.name, request[1])
                 
         except Exception as e:
             logger.error(f"Error controlling HomeIO device: {e}")
@@ -75,25 +185,50 @@ class HomeIOService:
             device: Device model instance with analogue_value, supported_device, etc.
         """
         try:
-            # Get device details
-            device_type, device_number, zone = self._get_device_details(device)
-            analogue_value = device.analogue_value
-            
-            if analogue_value is None:
-                logger.info(f"Device {device.name} has no analogue value to set")
-                return False
-                
-            # Handle different device types
-            if device_type == 'lighting':
-                url = f"{self.base_url}/stl/{device_number}/{zone}/{analogue_value}"
-            elif device_type == 'heating':
-                url = f"{self.base_url}/sth/{zone}/{analogue_value}"
-            else:
-                logger.info(f"Device type {device_type} does not support analogue control")
+            request = self.analogue_request(device)
+            if request is None:
                 return False
-                
-            return self._send_request(url, device.name, f"analogue value: {analogue_value}")
+            return self._send_request(request[0], device.name, request[1])
                 
         except Exception as e:
             logger.error(f"Error setting device analogue value: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def apply_many(self, commands):
+        """
+        Send many device commands to HomeIO concurrently
+        
+        The URLs are built up front in the calling thread, so the threads of the
+        shared pool (see get_executor) only do HTTP and never touch the database.
+        
+        Args:
+            commands: Iterable of (device, kind) with kind 'state' or 'analogue'
+        
+        Returns:
+            List with one result per command in order: True when HomeIO accepted it,
+            False when it failed, None when there was nothing to send for it
+        """
+        requests_to_send = []
+        for device, kind in commands:
+            try:
+                build = self.state_request if kind == 'state' else self.analogue_request
+                request = build(device)
+            except Exception as e:
+                logger.error(f"Error building HomeIO request for device {device.name}: {e}")
+                requests_to_send.append((device.name, False))
+                continue
+            requests_to_send.append((device.name, request))
+        
+        results = [None if request is None else False for _, request in requests_to_send]
+        pending = [(index, name, request) for index, (name, request) in enumerate(requests_to_send) if request]
+        if not pending:
+            return results
+        
+        executor = get_executor()
+        futures = {
+            index: executor.submit(self._send_request, request[0], name, request[1])
+            for index, name, request in pending
+        }
+        for index, future in futures.items():
+            results[index] = future.result()
+        return results
\ No newline at end of file
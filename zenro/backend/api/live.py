@@ -0,0 +1,181 @@
+"""
+Server-sent events pushing minute ticks and device changes to open dashboards.
+
+Clients subscribe to one home through /api/live/ and receive an event for every
+committed minute tick (that minute's room, device and generation values for the
+home) and for every device state change, instead of polling the REST endpoints.
+
+The default broker is in-process. Every connection owns a small bounded asyncio
+queue, and an event is serialised once and shared by all the queues of its home,
+so each connection costs a few queued references. A client too slow to keep up
+gets a 'resync' event instead of an ever-growing queue.
+
+The minute tick runs in the cron process, not in the server, so a watcher task
+polls the tick watermark in the shared cache while there are subscribers and
+publishes the new minute once it moves. Device changes are published by a signal
+in the process that saved the device, so with several server processes a broker
+shared between them can be configured through LIVE_BROKER.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+from .cache import get_watermark
+from .models import DeviceLog1Min, RoomLog1Min, EnergyGeneration1Min
+
+_broker = None
+
+def format_event(event, data):
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n".encode()
+
+def device_event(device):
+    """Data of the 'device' event sent when a device's state changes."""
+    return {
+        'id': device.pk,
+        'room': device.room_id,
+        'status': device.status,
+        'analogue_value': device.analogue_value,
+        'is_unlocked': device.is_unlocked,
+    }
+
+def tick_deltas(minute, home_ids):
+    """
+    The values one committed minute tick logged for some homes, with three queries.
+
+    Returns:
+        {home_id: {'minute', 'usage', 'generation', 'rooms', 'devices'}}
+    """
+    deltas = {
+        home_id: {'minute': minute, 'usage': 0.0, 'generation': None, 'rooms': [], 'devices': []}
+        for home_id in home_ids
+    }
+
+    for row in RoomLog1Min.objects.filter(
+        created_at=minute, room__smart_home_id__in=home_ids
+    ).values('room_id', 'room__smart_home_id', 'energy_usage'):
+        delta = deltas[row['room__smart_home_id']]
+        delta['rooms'].append({'id': row['room_id'], 'energy_usage': row['energy_usage']})
+        delta['usage'] += row['energy_usage']
+
+    for row in DeviceLog1Min.objects.filter(
+        created_at=minute, device__room__smart_home_id__in=home_ids
+    ).values('device_id', 'device__room__smart_home_id', 'status', 'energy_usage'):
+        deltas[row['device__room__smart_home_id']]['devices'].append({
+            'id': row['device_id'], 'status': row['status'], 'energy_usage': row['energy_usage']
+        })
+
+    for home_id, generation in EnergyGeneration1Min.objects.filter(
+        created_at=minute, home_id__in=home_ids
+    ).values_list('home_id', 'energy_generation'):
+        deltas[home_id]['generation'] = generation
+
+    return deltas
+
+async def watch_ticks(broker):
+    """Publish every committed minute tick to the subscribed homes, while there are any."""
+    last = await sync_to_async(get_watermark)()
+    while broker.home_ids():
+        await asyncio.sleep(getattr(settings, 'LIVE_POLL_SECONDS', 5))
+        watermark = await sync_to_async(get_watermark)()
+        if watermark in (last, 'none'):
+            continue
+        last = watermark
+
+        home_ids = broker.home_ids()
+        if not home_ids:
+            break
+        try:
+            deltas = await sync_to_async(tick_deltas)(datetime.fromisoformat(watermark), home_ids)
+        except Exception as e:
+            print(f"Error reading tick {watermark} for live events: {e}")
+            continue
+        for home_id, data in deltas.items():
+            broker.publish(home_id, 'tick', data)
+
+class LocalBroker:
+    """
+    In-process publish/subscribe of events per home.
+
+    Subscriptions are made on the server's event loop; publish() may be called from
+    any thread, e.g. from a signal in a synchronous view.
+    """
+    def __init__(self, queue_size=16):
+        self.queue_size = queue_size
+        self._queues = defaultdict(set)
+        self._loop = None
+        self._watcher = None
+
+    def subscribe(self, home_id):
+        """Register a connection for a home and return its queue of encoded events."""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        self._queues[home_id].add(queue)
+        if self._watcher is None or self._watcher.done():
+            self._watcher = self._loop.create_task(watch_ticks(self))
+        return queue
+
+    def unsubscribe(self, home_id, queue):
+        queues = self._queues.get(home_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._queues[home_id]
+
+    def home_ids(self):
+        return list(self._queues)
+
+    def has_subscribers(self, home_id=None):
+        return bool(self._queues) if home_id is None else home_id in self._queues
+
+    def publish(self, home_id, event, data):
+        """Send an event to every connection subscribed to a home."""
+        if self._loop is None or not self.has_subscribers(home_id):
+            return
+        message = format_event(event, data)
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._deliver(home_id, message)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, home_id, message)
+
+    def _deliver(self, home_id, message):
+        for queue in self._queues.get(home_id, ()):
+            if queue.full():
+                # The client fell behind: drop its backlog and tell it to refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(format_event('resync', {}))
+            else:
+                queue.put_nowait(message)
+
+def get_broker():
+    """The process-wide broker, of the class named by LIVE_BROKER."""
+    global _broker
+    if _broker is None:
+        broker_class = import_string(getattr(settings, 'LIVE_BROKER', 'api.live.LocalBroker'))
+        _broker = broker_class(queue_size=getattr(settings, 'LIVE_QUEUE_SIZE', 16))
+    return _broker
+
+async def event_stream(home_id):
+    """Encoded events for one connection, with a keep-alive comment while idle."""
+    broker = get_broker()
+    queue = broker.subscribe(home_id)
+    heartbeat = getattr(settings, 'LIVE_HEARTBEAT_SECONDS', 15)
+    try:
+        # Ask EventSource to reconnect after 5 seconds when the connection drops
+        yield b"retry: 5000\n\n"
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+    finally:
+        broker.unsubscribe(home_id, queue)
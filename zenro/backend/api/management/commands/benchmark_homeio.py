@@ -0,0 +1,99 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from api.home_io import home_io_services
+from api.home_io.home_io_services import HomeIOService
+from api.models import Device, HomeIORoom, SupportedDevice
+
+class FakeHomeIOHandler(BaseHTTPRequestHandler):
+    """Answers every HomeIO control URL with 200 after the configured latency."""
+    protocol_version = 'HTTP/1.1'  # Keep connections open between requests
+    # Headers and body are separate writes; without this, delayed ACKs stall keep-alive clients
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+        time.sleep(server.latency)
+        body = b'OK'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Command(BaseCommand):
+    """
+    Management command to compare ways of sending device commands to HomeIO.
+
+    Starts a local fake HomeIO server and sends the same commands with a bare
+    requests.get per command (the old behaviour), through the shared keep-alive
+    session one at a time, and concurrently with HomeIOService.apply_many. The
+    devices are built in memory, so the database is not touched.
+
+    Example:
+        python manage.py benchmark_homeio --commands 200 --latency 5
+    """
+    help = "Benchmark HomeIO command dispatch against a local fake HomeIO server"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--commands', type=int, default=200, help='Commands sent per run')
+        parser.add_argument('--latency', type=float, default=5, help='Fake server latency per request in ms')
+        parser.add_argument('--workers', type=int, default=8, help='Connections and concurrent requests for apply_many')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeHomeIOHandler)
+        server.daemon_threads = True
+        server.latency = options['latency'] / 1000
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        room = HomeIORoom(name='Benchmark', zone='A')
+        devices = [
+            Device(
+                name=f"Light {number}", status=number % 2 == 0, analogue_value=5,
+                supported_device=SupportedDevice(type='lighting', number=number, home_io_room=room)
+            )
+            for number in range(1, options['commands'] + 1)
+        ]
+
+        try:
+            with override_settings(HOME_IO_API_URL=base_url, HOME_IO_POOL_SIZE=options['workers']):
+                # Start from a fresh pool so connections from earlier use don't count
+                home_io_services._session = None
+                home_io_services._executor = None
+                service = HomeIOService()
+                urls = [service.state_request(device)[0] for device in devices]
+
+                runs = {
+                    'requests.get per command': lambda: [
+                        requests.get(url, timeout=service.timeout).status_code == 200 for url in urls
+                    ],
+                    'pooled session, sequential': lambda: [
+                        service.set_device_state(device) for device in devices
+                    ],
+                    'apply_many': lambda: service.apply_many([(device, 'state') for device in devices]),
+                }
+
+                for name, run in runs.items():
+                    server.requests, server.connections = 0, set()
+                    started = time.perf_counter()
+                    results = run()
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{name:<28} {elapsed * 1000:9.1f} ms  "
+                        f"{elapsed * 1000 / len(devices):6.2f} ms/command  "
+                        f"{sum(results)}/{len(results)} ok  "
+                        f"{len(server.connections)} connections"
+                    )
+        finally:
+            server.shutdown()
+            server.server_close()
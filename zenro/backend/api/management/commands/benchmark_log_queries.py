@@ -0,0 +1,142 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from api.models import (
+    Device, Room, DeviceLog1Min, RoomLog1Min, DeviceLogDaily, RoomLogDaily
+)
+from api.time_windows import day_bounds
+
+# Rows per executemany call while seeding
+SEED_BATCH_SIZE = 10000
+
+class Command(BaseCommand):
+    """
+    Management command to time the dashboard and rollup queries against the log tables.
+
+    With --seed-days it first fills DeviceLog1Min and RoomLog1Min with one row per
+    device (or room) per minute for that many days before --day, so the numbers can
+    be compared on a realistically sized database before and after a schema change
+    (for example by migrating back and forth around an index migration).
+
+    Example:
+        python manage.py benchmark_log_queries --seed-days 14 --day 2025-03-15
+        python manage.py benchmark_log_queries --day 2025-03-15 --repeat 9
+
+    Each query is run --repeat times after one untimed warm-up run, and the median
+    is reported with the fastest and slowest run, so a difference smaller than that
+    spread is noise rather than an effect of the schema.
+    """
+    help = "Time dashboard and rollup queries on the log tables, optionally seeding data first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', default=str(date.today()), help='Day the queries look at (YYYY-MM-DD)')
+        parser.add_argument('--seed-days', type=int, default=0, help='Days of minute logs to seed up to --day')
+        parser.add_argument('--repeat', type=int, default=9, help='Timed runs per query; the median is reported')
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['day'])
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        device_ids = list(Device.objects.values_list('id', flat=True))
+        room_ids = list(Room.objects.values_list('id', flat=True))
+        if not device_ids or not room_ids:
+            raise CommandError("Need at least one room and device to benchmark")
+
+        if options['seed_days'] > 0:
+            self._seed(day, options['seed_days'], device_ids, room_ids)
+
+        self.stdout.write(
+            f"DeviceLog1Min: {DeviceLog1Min.objects.count()} rows, "
+            f"RoomLog1Min: {RoomLog1Min.objects.count()} rows"
+        )
+
+        device_id = device_ids[len(device_ids) // 2]
+        room_id = room_ids[len(room_ids) // 2]
+
+        queries = {
+            'room usage today': lambda: RoomLog1Min.objects.for_day(day).filter(
+                room_id=room_id
+            ).aggregate(total=models.Sum('energy_usage')),
+            'device minute logs for a day': lambda: list(DeviceLog1Min.objects.for_day(day).filter(
+                device_id=device_id
+            ).values_list('created_at', 'energy_usage')),
+            'top devices today': lambda: list(DeviceLog1Min.objects.for_day(day).values('device_id').annotate(
+                total=models.Sum('energy_usage')
+            ).order_by('-total')[:5]),
+            'device daily lookup': lambda: list(DeviceLogDaily.objects.filter(
+                device_id=device_id, date=day
+            )),
+            'room daily lookup': lambda: list(RoomLogDaily.objects.filter(
+                room_id=room_id, date=day
+            )),
+            # The GROUP BY reads behind the nightly rollups; the writes are left out so
+            # the queries can be timed on a schema without the rollup constraints
+            'device daily rollup read': lambda: list(DeviceLog1Min.objects.for_day(day).values('device_id').annotate(
+                total_usage=models.Sum('energy_usage'),
+                uptime_minutes=models.Count('id', filter=models.Q(status=True))
+            ).order_by()),
+            'room daily rollup read': lambda: list(RoomLog1Min.objects.for_day(day).values('room_id').annotate(
+                total=models.Sum('energy_usage')
+            ).order_by()),
+        }
+
+        self.stdout.write(f"  {'query':<32} {'median':>9}    {'min':>9} {'max':>9}")
+        for name, query in queries.items():
+            # Warm the page cache so the first timed run is not an outlier
+            query()
+            times = [self._time(query) * 1000 for _ in range(max(1, options['repeat']))]
+            self.stdout.write(
+                f"  {name:<32} {statistics.median(times):9.1f} ms {min(times):9.1f} {max(times):9.1f}"
+            )
+
+    def _time(self, query):
+        started = time.perf_counter()
+        query()
+        return time.perf_counter() - started
+
+    def _seed(self, day, seed_days, device_ids, room_ids):
+        """Insert one log row per device and room per minute for seed_days days ending on day."""
+        first_minute = day_bounds(day - timedelta(days=seed_days - 1))[0]
+        minutes = seed_days * 24 * 60
+        self.stdout.write(
+            f"Seeding {minutes * len(device_ids)} device and {minutes * len(room_ids)} room rows..."
+        )
+
+        device_sql = (
+            f"INSERT INTO {DeviceLog1Min._meta.db_table} (device_id, status, energy_usage, created_at) "
+            "VALUES (%s, %s, %s, %s)"
+        )
+        room_sql = (
+            f"INSERT INTO {RoomLog1Min._meta.db_table} (room_id, energy_usage, created_at) "
+            "VALUES (%s, %s, %s)"
+        )
+
+        started = time.perf_counter()
+        device_rows, room_rows = [], []
+        with transaction.atomic(), connection.cursor() as cursor:
+            for offset in range(minutes):
+                created_at = first_minute + timedelta(minutes=offset)
+                for device_id in device_ids:
+                    status = random.random() < 0.3
+                    device_rows.append((device_id, status, random.random() if status else 0.0, created_at))
+                for room_id in room_ids:
+                    room_rows.append((room_id, random.random(), created_at))
+
+                if len(device_rows) >= SEED_BATCH_SIZE:
+                    cursor.executemany(device_sql, device_rows)
+                    device_rows = []
+                if len(room_rows) >= SEED_BATCH_SIZE:
+                    cursor.executemany(room_sql, room_rows)
+                    room_rows = []
+
+            if device_rows:
+                cursor.executemany(device_sql, device_rows)
+            if room_rows:
+                cursor.executemany(room_sql, room_rows)
+
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
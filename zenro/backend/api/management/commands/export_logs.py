@@ -0,0 +1,54 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.exports import EXPORTS, FORMATS, export_rows, stream_export
+
+class Command(BaseCommand):
+    """
+    Management command to export 1-minute log history as CSV or NDJSON.
+
+    Rows are streamed from the database in chunks and written as they arrive,
+    optionally gzip-compressed, so a year of logs exports with flat memory use.
+
+    Example:
+        python manage.py export_logs device --from 2025-01-01 --to 2025-12-31 --output device_2025.csv.gz --gzip
+        python manage.py export_logs generation --format ndjson --homes 1 2
+    """
+    help = "Stream 1-minute device, room or generation logs to a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS), help='Which log table to export')
+        parser.add_argument('--from', dest='date_from', help='First day to export (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last day to export (YYYY-MM-DD)')
+        parser.add_argument('--format', dest='export_format', choices=FORMATS, default='csv')
+        parser.add_argument('--ids', nargs='+', type=int, help='Only these device, room or home ids')
+        parser.add_argument('--homes', nargs='+', type=int, help='Only entities in these smart homes')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--output', help='Output file (default: standard output)')
+
+    def handle(self, *args, **options):
+        try:
+            fields, rows = export_rows(
+                options['kind'], options['date_from'], options['date_to'],
+                entity_ids=options['ids'], home_ids=options['homes']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = stream_export(fields, rows, options['export_format'], options['gzip'])
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+
+        started = time.perf_counter()
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written} bytes to {options['output']} in {time.perf_counter() - started:.1f}s"
+            ))
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from api.models import SmartHome, DailyRollupStatus
+from api.rollups import rebuild_day, rebuild_month, WITHOUT_HOME
+
+# Attempts per shard when SQLite reports the database as locked by another worker
+LOCKED_RETRIES = 5
+
+def _init_worker():
+    """Give each pool process a clean Django setup and its own database connections."""
+    import django
+    django.setup()
+    connections.close_all()
+
+def _run_shard(shard):
+    """
+    Rebuild one shard and return (shard id, rows written).
+
+    A shard is ('day', 'YYYY-MM-DD', home_ids) or ('month', 'YYYY-MM', home_ids),
+    where home_ids may be WITHOUT_HOME for the devices that are not in a room.
+    """
+    kind, period, home_ids = shard
+    for attempt in range(LOCKED_RETRIES):
+        try:
+            if kind == 'day':
+                rows = rebuild_day(date.fromisoformat(period), home_ids=home_ids)
+            else:
+                year, month = map(int, period.split('-'))
+                rows = rebuild_month(year, month, home_ids=home_ids)
+            return _shard_id(shard), sum(rows.values())
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == LOCKED_RETRIES - 1:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+def _shard_id(shard):
+    kind, period, home_ids = shard
+    if home_ids == WITHOUT_HOME:
+        return f"{kind}:{period}:{WITHOUT_HOME}"
+    return f"{kind}:{period}:{home_ids[0]}-{home_ids[-1]}"
+
+class Command(BaseCommand):
+    """
+    Management command to recompute the daily and monthly rollup tables for a date range.
+
+    Rebuilds DeviceLogDaily, RoomLogDaily and EnergyGenerationDaily from the 1-minute
+    logs, then DeviceLogMonthly, RoomLogMonthly and EnergyGenerationMonthly for every
+    month the range touches. Rollups are upserts, so running the command again for
+    the same range is safe.
+
+    The work is split into shards of one day (or month) and one range of home ids,
+    and the shards run across a process pool. Without --homes, one more shard per
+    period covers the devices that are not in a room, which still log usage.
+    Finished shards are recorded in a state file, so an interrupted rebuild picks
+    up where it stopped when run again with the same arguments.
+
+    Example:
+        python manage.py rebuild_rollups --from 2025-03-01 --to 2025-03-31
+        python manage.py rebuild_rollups --from 2025-03-01 --to 2025-03-31 --homes 1 2 3 --workers 4
+    """
+    help = "Recompute daily and monthly rollups for a date range, optionally limited to some homes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', required=True, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', required=True, help='Last day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--homes', nargs='+', type=int, help='Only rebuild these smart home ids')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+        parser.add_argument('--home-chunk', type=int, default=100, help='Homes per shard')
+        parser.add_argument(
+            '--state-file',
+            default=os.path.join(settings.BASE_DIR, '.rebuild_rollups_state.json'),
+            help='Where finished shards are recorded for resuming'
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore previously finished shards')
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from'])
+            date_to = date.fromisoformat(options['date_to'])
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        if date_to < date_from:
+            raise CommandError("--to must not be before --from")
+
+        home_ids = SmartHome.objects.order_by('id').values_list('id', flat=True)
+        if options['homes']:
+            home_ids = home_ids.filter(id__in=options['homes'])
+        home_ids = list(home_ids)
+        if options['homes'] and not home_ids:
+            raise CommandError("No smart homes to rebuild")
+
+        chunk = max(1, options['home_chunk'])
+        home_ranges = [home_ids[i:i + chunk] for i in range(0, len(home_ids), chunk)]
+        if not options['homes']:
+            home_ranges.append(WITHOUT_HOME)
+
+        days = [date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1)]
+        months = sorted({f"{day.year:04d}-{day.month:02d}" for day in days})
+
+        run_key = hashlib.sha1(json.dumps(
+            [str(date_from), str(date_to), home_ids, chunk]
+        ).encode()).hexdigest()
+        state_file = options['state_file']
+        state = self._load_state(state_file)
+        done = set() if options['restart'] else set(state.get(run_key, []))
+        if done:
+            self.stdout.write(f"Resuming: {len(done)} shards already finished")
+
+        # Monthly rollups read the daily ones, so all days are rebuilt first
+        phases = [
+            [('day', day.isoformat(), ids) for day in days for ids in home_ranges],
+            [('month', month, ids) for month in months for ids in home_ranges],
+        ]
+
+        started = time.perf_counter()
+        total_shards = total_rows = 0
+        for phase, shards in enumerate(phases):
+            pending = [shard for shard in shards if _shard_id(shard) not in done]
+            for shard_id, rows in self._run(pending, options['workers']):
+                done.add(shard_id)
+                total_shards += 1
+                total_rows += rows
+                state[run_key] = sorted(done)
+                self._save_state(state_file, state)
+                self.stdout.write(f"  {shard_id}: {rows} rows")
+
+            # A full rebuild of a day confirms its rollups for the retention job
+            if phase == 0 and not options['homes']:
+                for day in days:
+                    for table in DailyRollupStatus.ROLLUP_TABLES:
+                        DailyRollupStatus.mark(day, table)
+
+        state.pop(run_key, None)
+        self._save_state(state_file, state)
+
+        elapsed = time.perf_counter() - started
+        rate = total_rows / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {total_shards} shards, {total_rows} rows in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        ))
+
+    def _run(self, shards, workers):
+        """Yield (shard id, rows) as shards finish, in-process or across a pool."""
+        if workers <= 1 or len(shards) <= 1:
+            for shard in shards:
+                yield _run_shard(shard)
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(_run_shard, shard) for shard in shards]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _load_state(self, path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_state(self, path, state):
+        # Write-then-rename so an interruption never leaves a half-written file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
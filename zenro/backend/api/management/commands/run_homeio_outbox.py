@@ -0,0 +1,50 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.home_io.circuit_breaker import get_breaker
+from api.outbox import process_outbox
+
+class Command(BaseCommand):
+    """
+    Management command running the worker that sends queued device commands to HomeIO.
+
+    Device changes are queued as HomeIOCommand rows (see api/outbox.py). The worker
+    claims due commands in batches, sends each batch concurrently through the pooled
+    HomeIO client and sleeps briefly whenever the queue is empty. Several workers can
+    run side by side; each command is claimed by one of them. While the HomeIO
+    circuit breaker is open the worker waits instead of claiming commands.
+
+    Example:
+        python manage.py run_homeio_outbox
+        python manage.py run_homeio_outbox --once
+    """
+    help = "Send queued device commands to HomeIO until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the due commands once and exit')
+        parser.add_argument('--batch-size', type=int, help='Commands claimed per batch')
+
+    def handle(self, *args, **options):
+        poll_seconds = getattr(settings, 'HOME_IO_OUTBOX_POLL_SECONDS', 0.5)
+        if not options['once']:
+            self.stdout.write("HomeIO outbox worker started")
+
+        breaker = get_breaker()
+        breaker_state = breaker.state
+        try:
+            while True:
+                sent, failed = process_outbox(options['batch_size'])
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent} HomeIO commands, {failed} failed")
+                if breaker.state != breaker_state:
+                    breaker_state = breaker.state
+                    self.stdout.write(f"HomeIO circuit breaker {breaker_state}")
+                if options['once']:
+                    # Keep going while full batches come back, then stop
+                    if not sent and not failed:
+                        break
+                    continue
+                if not sent and not failed:
+                    time.sleep(poll_seconds)
+        except KeyboardInterrupt:
+            self.stdout.write("HomeIO outbox worker stopped")
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def strip_minute_logs(apps, schema_editor):
+    """
+    Daily device rows used to carry a copy of every 1-minute log in
+    status_usage_details['logs']. Drop it so only the compact metrics remain.
+    """
+    DeviceLogDaily = apps.get_model('api', 'DeviceLogDaily')
+    for daily_log in DeviceLogDaily.objects.filter(status_usage_details__has_key='logs').iterator():
+        daily_log.status_usage_details.pop('logs', None)
+        daily_log.save(update_fields=['status_usage_details'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_recoverycode'),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_minute_logs, migrations.RunPython.noop),
+    ]
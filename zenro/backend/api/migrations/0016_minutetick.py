@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_strip_devicelogdaily_minute_logs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MinuteTick',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField(unique=True)),
+                ('completed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('device_logs', models.IntegerField(default=0)),
+                ('room_logs', models.IntegerField(default=0)),
+                ('generation_logs', models.IntegerField(default=0)),
+                ('duration_ms', models.FloatField(default=0.0)),
+            ],
+        ),
+    ]
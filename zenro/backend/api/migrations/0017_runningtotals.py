@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_minutetick'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceRunningTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('energy_usage', models.FloatField(default=0.0)),
+                ('on_energy_usage', models.FloatField(default=0.0)),
+                ('minutes', models.IntegerField(default=0)),
+                ('on_minutes', models.IntegerField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='running_totals', to='api.device')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'date'), name='unique_device_running_total')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HomeRunningTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('energy_usage', models.FloatField(default=0.0)),
+                ('energy_generation', models.FloatField(default=0.0)),
+                ('on_minutes', models.IntegerField(default=0)),
+                ('home', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='running_totals', to='api.smarthome')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('home', 'date'), name='unique_home_running_total')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomRunningTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('energy_usage', models.FloatField(default=0.0)),
+                ('on_minutes', models.IntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='running_totals', to='api.room')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('room', 'date'), name='unique_room_running_total')],
+            },
+        ),
+    ]
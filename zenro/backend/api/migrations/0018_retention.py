@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_runningtotals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollupStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('device_logs_at', models.DateTimeField(default=None, null=True)),
+                ('room_logs_at', models.DateTimeField(default=None, null=True)),
+                ('energy_generation_at', models.DateTimeField(default=None, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='devicelog1min',
+            index=models.Index(fields=['created_at'], name='devicelog1min_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='energygeneration1min',
+            index=models.Index(fields=['created_at'], name='energygen1min_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomlog1min',
+            index=models.Index(fields=['created_at'], name='roomlog1min_created_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:43
+
+from django.db import migrations, models
+
+# Rollup tables and the fields that identify one rollup row
+ROLLUP_KEYS = {
+    'DeviceLogDaily': ['device', 'date'],
+    'DeviceLogMonthly': ['device', 'year', 'month'],
+    'RoomLogDaily': ['room', 'date'],
+    'RoomLogMonthly': ['room', 'year', 'month'],
+    'EnergyGenerationDaily': ['home', 'date'],
+    'EnergyGenerationMonthly': ['home', 'year', 'month'],
+}
+
+
+def remove_duplicate_rollups(apps, schema_editor):
+    """
+    update_or_create races could store the same rollup twice. Keep the newest row
+    of each duplicate group so the unique constraints can be added.
+    """
+    for model_name, key_fields in ROLLUP_KEYS.items():
+        model = apps.get_model('api', model_name)
+        duplicates = model.objects.values(*key_fields).annotate(
+            rows=models.Count('id'), keep_id=models.Max('id')
+        ).filter(rows__gt=1)
+        for group in duplicates:
+            model.objects.filter(
+                **{field: group[field] for field in key_fields}
+            ).exclude(id=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_retention'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='devicelog1min',
+            index=models.Index(fields=['device', 'created_at'], name='devicelog1min_device_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='energygeneration1min',
+            index=models.Index(fields=['home', 'created_at'], name='energygen1min_home_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomlog1min',
+            index=models.Index(fields=['room', 'created_at'], name='roomlog1min_room_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='devicelogdaily',
+            constraint=models.UniqueConstraint(fields=('device', 'date'), name='unique_device_log_daily'),
+        ),
+        migrations.AddConstraint(
+            model_name='devicelogmonthly',
+            constraint=models.UniqueConstraint(fields=('device', 'year', 'month'), name='unique_device_log_monthly'),
+        ),
+        migrations.AddConstraint(
+            model_name='energygenerationdaily',
+            constraint=models.UniqueConstraint(fields=('home', 'date'), name='unique_energy_generation_daily'),
+        ),
+        migrations.AddConstraint(
+            model_name='energygenerationmonthly',
+            constraint=models.UniqueConstraint(fields=('home', 'year', 'month'), name='unique_energy_generation_monthly'),
+        ),
+        migrations.AddConstraint(
+            model_name='roomlogdaily',
+            constraint=models.UniqueConstraint(fields=('room', 'date'), name='unique_room_log_daily'),
+        ),
+        migrations.AddConstraint(
+            model_name='roomlogmonthly',
+            constraint=models.UniqueConstraint(fields=('room', 'year', 'month'), name='unique_room_log_monthly'),
+        ),
+    ]
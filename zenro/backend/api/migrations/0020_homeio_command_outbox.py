@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_log_indexes_and_unique_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HomeIOCommand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed'), ('superseded', 'Superseded')], default='pending', max_length=10)),
+                ('set_state', models.BooleanField(default=False)),
+                ('set_analogue', models.BooleanField(default=False)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_at', models.DateTimeField(default=None, null=True)),
+                ('sent_at', models.DateTimeField(default=None, null=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='homeio_commands', to='api.device')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'available_at'], name='homeio_command_queue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('device',), name='unique_pending_homeio_command')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_homeio_command_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Scene',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('actions', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scenes', to=settings.AUTH_USER_MODEL)),
+                ('smart_home', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scenes', to='api.smarthome')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('smart_home', 'name'), name='unique_scene_in_home')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_scene'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyrollupstatus',
+            name='missing_ticks',
+            field=models.IntegerField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,101 @@
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def upsert(model, entity_field, day, totals):
+    """Write one day's counters, replacing any the minute tick already wrote."""
+    if not totals:
+        return
+    fields = sorted({field for values in totals.values() for field in values})
+    model.objects.bulk_create(
+        [model(date=day, **{entity_field: entity_id}, **values) for entity_id, values in totals.items()],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=[entity_field.removesuffix('_id'), 'date'],
+        update_fields=fields
+    )
+
+
+def backfill_running_totals(apps, schema_editor):
+    """
+    The running totals tables were created empty, so the minute ticks before the
+    deploy were missing from the counters read by the dashboard, the room serializers
+    and the nightly rollups. Recompute yesterday's and today's counters from the
+    1-minute logs; yesterday is included in case its rollup has not run yet.
+    """
+    DeviceLog1Min = apps.get_model('api', 'DeviceLog1Min')
+    RoomLog1Min = apps.get_model('api', 'RoomLog1Min')
+    EnergyGeneration1Min = apps.get_model('api', 'EnergyGeneration1Min')
+    DeviceRunningTotal = apps.get_model('api', 'DeviceRunningTotal')
+    RoomRunningTotal = apps.get_model('api', 'RoomRunningTotal')
+    HomeRunningTotal = apps.get_model('api', 'HomeRunningTotal')
+
+    today = timezone.now().date()
+    for day in (today - timedelta(days=1), today):
+        start = datetime.combine(day, time.min)
+        window = {'created_at__gte': start, 'created_at__lt': start + timedelta(days=1)}
+        on = models.Q(status=True)
+
+        device_totals = {
+            device_id: {
+                'energy_usage': usage, 'on_energy_usage': on_usage,
+                'minutes': minutes, 'on_minutes': on_minutes
+            }
+            for device_id, usage, on_usage, minutes, on_minutes in DeviceLog1Min.objects.filter(
+                **window
+            ).values('device_id').annotate(
+                usage=models.Sum('energy_usage'),
+                on_usage=Coalesce(models.Sum('energy_usage', filter=on), 0.0, output_field=models.FloatField()),
+                minute_count=models.Count('id'),
+                on_minute_count=models.Count('id', filter=on)
+            ).order_by().values_list('device_id', 'usage', 'on_usage', 'minute_count', 'on_minute_count')
+        }
+
+        # on_minutes of rooms and homes count device-minutes of devices placed in a room
+        room_on_minutes = dict(DeviceLog1Min.objects.filter(
+            **window, status=True, device__room__isnull=False
+        ).values('device__room_id').annotate(total=models.Count('id')).order_by().values_list(
+            'device__room_id', 'total'
+        ))
+        room_totals = {
+            room_id: {'energy_usage': energy_usage, 'on_minutes': room_on_minutes.get(room_id, 0)}
+            for room_id, energy_usage in RoomLog1Min.objects.filter(**window).values('room_id').annotate(
+                total=models.Sum('energy_usage')
+            ).order_by().values_list('room_id', 'total')
+        }
+
+        home_totals = {}
+        for home_id, energy_generation in EnergyGeneration1Min.objects.filter(**window).values(
+            'home_id'
+        ).annotate(total=models.Sum('energy_generation')).order_by().values_list('home_id', 'total'):
+            home_totals[home_id] = {'energy_usage': 0.0, 'energy_generation': energy_generation, 'on_minutes': 0}
+        for home_id, energy_usage in RoomLog1Min.objects.filter(**window).values(
+            'room__smart_home_id'
+        ).annotate(total=models.Sum('energy_usage')).order_by().values_list('room__smart_home_id', 'total'):
+            home_totals.setdefault(home_id, {'energy_usage': 0.0, 'energy_generation': 0.0, 'on_minutes': 0})
+            home_totals[home_id]['energy_usage'] = energy_usage
+        for home_id, on_minutes in DeviceLog1Min.objects.filter(
+            **window, status=True, device__room__isnull=False
+        ).values('device__room__smart_home_id').annotate(total=models.Count('id')).order_by().values_list(
+            'device__room__smart_home_id', 'total'
+        ):
+            home_totals.setdefault(home_id, {'energy_usage': 0.0, 'energy_generation': 0.0, 'on_minutes': 0})
+            home_totals[home_id]['on_minutes'] = on_minutes
+
+        upsert(DeviceRunningTotal, 'device_id', day, device_totals)
+        upsert(RoomRunningTotal, 'room_id', day, room_totals)
+        upsert(HomeRunningTotal, 'home_id', day, home_totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_daily_rollup_missing_ticks'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_running_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,148 @@
+"""
+Reusable behaviour for the API viewsets.
+"""
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .cache import data_version, make_etag
+from .downsampling import BUCKET_MINUTES, build_series
+from .packing import SeriesTooLong, pack_series
+from .renderers import PackedSeriesRenderer
+from .time_windows import InvalidDate
+
+class InvalidDateMixin:
+    """
+    Answers an InvalidDate raised while filtering by date query parameters with
+    400 and an {'error': ...} body instead of a server error.
+    """
+    def handle_exception(self, exc):
+        if isinstance(exc, InvalidDate):
+            exc = ValidationError({'error': str(exc)})
+        return super().handle_exception(exc)
+
+class TimeSeriesMixin:
+    """
+    Serves chart series from the 1-minute log viewsets.
+
+    With ?bucket=5m|15m|1h|1d and/or ?max_points=N, list requests return the
+    filtered logs aggregated into time buckets (one minute when no bucket is
+    given) and thinned to at most max_points with LTTB, instead of paginated
+    rows (see api/downsampling.py). Filter to one device, room or home for a
+    single series; otherwise each bucket aggregates every matching row.
+    """
+    series_value_field = None
+    max_points_limit = 5000
+
+    def list(self, request, *args, **kwargs):
+        bucket = request.query_params.get('bucket')
+        max_points = request.query_params.get('max_points')
+        if not bucket and not max_points:
+            return super().list(request, *args, **kwargs)
+
+        if bucket and bucket not in BUCKET_MINUTES:
+            raise ValidationError({'bucket': f"Must be one of {', '.join(BUCKET_MINUTES)}"})
+        if max_points:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                max_points = 0
+            if not 3 <= max_points <= self.max_points_limit:
+                raise ValidationError({'max_points': f"Must be between 3 and {self.max_points_limit}"})
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(build_series(queryset, self.series_value_field, bucket or None, max_points or None))
+
+class PackedSeriesMixin:
+    """
+    Serves list requests as a packed binary series (see api/packing.py) when the
+    client asks for it with ?format=bin or Accept: application/vnd.zenro.series.
+
+    The filtered rows are read in time order as plain tuples and packed into
+    float32 values one packed_step apart, plus a status bitmap when
+    packed_status_field is set. Other requests are served as before.
+    """
+    packed_time_field = 'created_at'
+    packed_value_field = None
+    packed_status_field = None
+    packed_step = 60
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, PackedSeriesRenderer]
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != PackedSeriesRenderer.format:
+            return super().list(request, *args, **kwargs)
+
+        fields = [self.packed_time_field, self.packed_value_field]
+        if self.packed_status_field:
+            fields.append(self.packed_status_field)
+        rows = self.filter_queryset(self.get_queryset()).order_by(
+            self.packed_time_field
+        ).values_list(*fields).iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000))
+
+        try:
+            data = pack_series(
+                rows, self.packed_step,
+                with_status=bool(self.packed_status_field),
+                max_values=getattr(settings, 'PACKED_SERIES_MAX_VALUES', 527040)
+            )
+        except SeriesTooLong as e:
+            raise ValidationError(str(e))
+        return HttpResponse(data, content_type=PackedSeriesRenderer.media_type)
+
+def conditional_get(request, version, respond):
+    """
+    Answer a GET request with 304 Not Modified when the client already holds the
+    response for this data version, or call respond() and tag its response.
+
+    Parameters:
+        request: The authenticated DRF request
+        version: Data version of the response, e.g. from cache.data_version()
+        respond: Callable building the full response on a miss
+
+    Returns:
+        A 304 response with no body, or the response of respond() with its ETag
+    """
+    etag = make_etag(request, version)
+    # If-None-Match uses the weak comparison, so W/ prefixes added on the way are ignored
+    client_etags = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+
+    if etag in client_etags or '*' in client_etags:
+        response = Response(status=304)
+    else:
+        response = respond()
+        if response.status_code != 200:
+            return response
+
+    response['ETag'] = etag
+    # Browsers keep the response but revalidate it on every request
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+class ConditionalGetMixin:
+    """
+    Supports conditional GET (If-None-Match) on list and retrieve requests.
+
+    The ETag is derived from the tick version, or from the versions of
+    version_scopes for data that changes outside the tick (see api/cache.py), and
+    checked after authentication but before the view runs, so an unchanged
+    response costs a cache lookup and no queries.
+    """
+    version_scopes = None
+
+    def get_version_scopes(self, request):
+        return self.version_scopes
+
+    def list(self, request, *args, **kwargs):
+        return conditional_get(
+            request, data_version(self.get_version_scopes(request)),
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_get(
+            request, data_version(self.get_version_scopes(request)),
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
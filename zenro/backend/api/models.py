@@ -4,6 +4,101 @@ from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 import random
 import string
+from .time_windows import day_bounds, week_bounds, month_datetime_bounds
+
+class LogQuerySet(models.QuerySet):
+    """
+    Time-window filters for the 1-minute log tables.
+
+    Every window is a half-open range on the raw created_at column, so the
+    queries can use the (entity, created_at) and created_at indexes.
+    """
+    def between(self, start, end):
+        """Logs with start <= created_at < end; either bound may be None."""
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(created_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(created_at__lt=end)
+        return queryset
+
+    def before(self, moment):
+        return self.between(None, moment)
+
+    def for_day(self, day):
+        return self.between(*day_bounds(day))
+
+    def for_dates(self, first_day=None, last_day=None):
+        """Logs from first_day through last_day inclusive; either day may be omitted."""
+        start = day_bounds(first_day)[0] if first_day else None
+        end = day_bounds(last_day)[1] if last_day else None
+        return self.between(start, end)
+
+    def for_week(self, day):
+        """Logs in the Monday-to-Sunday week containing day."""
+        return self.between(*week_bounds(day))
+
+    def for_month(self, year, month):
+        return self.between(*month_datetime_bounds(year, month))
+
+class TrackedFieldsMixin:
+    """
+    Remembers the database values of a model's tracked_fields, so code reacting
+    to a save can tell what changed without reading the old row again.
+
+    The snapshot is taken when an instance is loaded (from_db) and after every
+    save() or refresh_from_db(). pre_save and post_save receivers therefore still
+    compare against the values before the save. Fields are named by attname
+    (e.g. 'room_id' for a foreign key). A tracked field that was not loaded, for
+    example because of only() or defer(), counts as changed.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self, fields=None):
+        if not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        for field in self.tracked_fields:
+            # Deferred fields are missing from __dict__; reading them would query
+            if (fields is None or field in fields) and field in self.__dict__:
+                self._loaded_values[field] = self.__dict__[field]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._snapshot_tracked_fields(
+            None if update_fields is None else {self._meta.get_field(name).attname for name in update_fields}
+        )
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked_fields(
+            None if fields is None else {self._meta.get_field(name).attname for name in fields}
+        )
+
+    def has_loaded(self, field):
+        """Whether the database value of a tracked field is known."""
+        return field in getattr(self, '_loaded_values', {})
+
+    def initial_value(self, field):
+        """The value a tracked field had in the database, or None when it was not loaded."""
+        return getattr(self, '_loaded_values', {}).get(field)
+
+    def has_changed(self, field):
+        """Whether a tracked field differs from its database value; always True for new instances."""
+        if not self.has_loaded(field):
+            return True
+        return getattr(self, field) != self._loaded_values[field]
+
+    @property
+    def changed_fields(self):
+        """Tracked fields that differ from their database values."""
+        return [field for field in self.tracked_fields if self.has_changed(field)]
 
 class SmartHome(models.Model):
     """
@@ -86,7 +181,7 @@ class SupportedDevice(models.Model):
     def __str__(self):
         return f"{self.model_name} ({self.memory_type}, addr={self.address}, {self.data_type})"
 
-class Device(models.Model):
+class Device(TrackedFieldsMixin, models.Model):
     """
     An actual device instance installed in a room of a smart home.
     
@@ -98,8 +193,12 @@ class Device(models.Model):
     "Light Switch" SupportedDevice type.
     
     Devices track their current status (on/off), analog value (0-10 for dimmable
-    devices), and when they were created or last updated.
+    devices), and when they were created or last updated. Changes to the status
+    and analogue value are detected without a query (see TrackedFieldsMixin) to
+    queue the matching HomeIO commands.
     """
+    tracked_fields = ('status', 'analogue_value')
+    
     name = models.CharField(max_length=100)                             
     status = models.BooleanField(default=False)                     
     analogue_value = models.IntegerField(
@@ -137,6 +236,16 @@ class DeviceLog1Min(models.Model):
     energy_usage = models.FloatField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    objects = LogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Lets retention pruning walk the table in time order without a full scan
+            models.Index(fields=['created_at'], name='devicelog1min_created_idx'),
+            # Serves per-device time window queries (charts, exports, daily rollups)
+            models.Index(fields=['device', 'created_at'], name='devicelog1min_device_time_idx')
+        ]
+
 class DeviceLogDaily(models.Model):
     """
     Aggregated daily energy usage for a device.
@@ -152,6 +261,11 @@ class DeviceLogDaily(models.Model):
     total_energy_usage = models.FloatField(default=0.0)
     status_usage_details = models.JSONField(default=dict)  # For storing on/off intervals if needed
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'date'], name='unique_device_log_daily')
+        ]
+
 class DeviceLogMonthly(models.Model):
     """
     Aggregated monthly energy usage for a device.
@@ -166,6 +280,11 @@ class DeviceLogMonthly(models.Model):
     total_energy_usage = models.FloatField(default=0.0)
     daily_summaries = models.JSONField(default=dict)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'year', 'month'], name='unique_device_log_monthly')
+        ]
+
 class RoomLog1Min(models.Model):
     """
     Records the energy usage of an entire room at one-minute intervals.
@@ -177,6 +296,14 @@ class RoomLog1Min(models.Model):
     energy_usage = models.FloatField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    objects = LogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='roomlog1min_created_idx'),
+            models.Index(fields=['room', 'created_at'], name='roomlog1min_room_time_idx')
+        ]
+
 class RoomLogDaily(models.Model):
     """
     Aggregated daily energy usage for a room.
@@ -188,6 +315,11 @@ class RoomLogDaily(models.Model):
     date = models.DateField()
     total_energy_usage = models.FloatField(default=0.0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'date'], name='unique_room_log_daily')
+        ]
+
 class RoomLogMonthly(models.Model):
     """
     Aggregated monthly energy usage for a room.
@@ -200,6 +332,11 @@ class RoomLogMonthly(models.Model):
     year = models.IntegerField()
     total_energy_usage = models.FloatField(default=0.0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'year', 'month'], name='unique_room_log_monthly')
+        ]
+
 class HomeIORoom(models.Model):
     """
     Represents rooms defined in the HomeIO simulation.
@@ -229,6 +366,14 @@ class EnergyGeneration1Min(models.Model):
     energy_generation = models.FloatField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    objects = LogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='energygen1min_created_idx'),
+            models.Index(fields=['home', 'created_at'], name='energygen1min_home_time_idx')
+        ]
+
 class EnergyGenerationDaily(models.Model):
     """
     Aggregated daily energy generation for a smart home.
@@ -240,6 +385,11 @@ class EnergyGenerationDaily(models.Model):
     date = models.DateField()
     total_energy_generation = models.FloatField(default=0.0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['home', 'date'], name='unique_energy_generation_daily')
+        ]
+
 class EnergyGenerationMonthly(models.Model):
     """
     Aggregated monthly energy generation for a smart home.
@@ -252,6 +402,201 @@ class EnergyGenerationMonthly(models.Model):
     year = models.IntegerField()
     total_energy_generation = models.FloatField(default=0.0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['home', 'year', 'month'], name='unique_energy_generation_monthly')
+        ]
+
+class DeviceRunningTotal(models.Model):
+    """
+    Running "today so far" totals for a device, updated by every minute tick.
+    
+    Reading the current day's usage is then a single row lookup instead of a sum
+    over all of today's 1-minute logs, and the nightly rollup can copy the
+    finished day's counters straight into DeviceLogDaily.
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='running_totals')
+    date = models.DateField()
+    energy_usage = models.FloatField(default=0.0)
+    on_energy_usage = models.FloatField(default=0.0)
+    minutes = models.IntegerField(default=0)
+    on_minutes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'date'], name='unique_device_running_total')
+        ]
+
+class RoomRunningTotal(models.Model):
+    """
+    Running "today so far" totals for a room, updated by every minute tick.
+    
+    on_minutes counts device-minutes, so two devices on for an hour add 120.
+    """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='running_totals')
+    date = models.DateField()
+    energy_usage = models.FloatField(default=0.0)
+    on_minutes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'date'], name='unique_room_running_total')
+        ]
+
+class HomeRunningTotal(models.Model):
+    """
+    Running "today so far" usage and generation totals for a smart home,
+    updated by every minute tick.
+    
+    Usage only counts devices placed in one of the home's rooms, matching the
+    sum of the home's room logs.
+    """
+    home = models.ForeignKey(SmartHome, on_delete=models.CASCADE, related_name='running_totals')
+    date = models.DateField()
+    energy_usage = models.FloatField(default=0.0)
+    energy_generation = models.FloatField(default=0.0)
+    on_minutes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['home', 'date'], name='unique_home_running_total')
+        ]
+
+class MinuteTick(models.Model):
+    """
+    Ledger entry recording that the 1-minute logs for one minute were committed.
+    
+    The minute tick writes this row in the same transaction as its device, room
+    and generation logs, so a tick is either fully recorded here or not at all.
+    The nightly rollups read the ledger to start as soon as the last tick of the
+    day is in, and to refuse days with missing ticks instead of aggregating
+    partial data. The unique minute also stops an overlapping run of the same
+    tick from writing duplicate logs.
+    """
+    minute = models.DateTimeField(unique=True)
+    completed_at = models.DateTimeField(default=timezone.now)
+    device_logs = models.IntegerField(default=0)
+    room_logs = models.IntegerField(default=0)
+    generation_logs = models.IntegerField(default=0)
+    duration_ms = models.FloatField(default=0.0)
+
+    def __str__(self):
+        return f"Tick {self.minute:%Y-%m-%d %H:%M}"
+
+class DailyRollupStatus(models.Model):
+    """
+    Records when each nightly rollup finished for a day.
+    
+    The retention job only prunes a day's 1-minute logs once the matching daily
+    rollup is confirmed here, so minute data is never deleted before it has been
+    summarised.
+    
+    A nightly rollup that finds minute ticks missing records the day here with its
+    missing_ticks count and leaves it unconfirmed; retry_deferred_rollups finishes
+    it later. A confirmed day with missing_ticks above zero was rolled up from
+    incomplete minute data.
+    """
+    ROLLUP_TABLES = ['device_logs', 'room_logs', 'energy_generation']
+
+    date = models.DateField(unique=True)
+    device_logs_at = models.DateTimeField(null=True, default=None)
+    room_logs_at = models.DateTimeField(null=True, default=None)
+    energy_generation_at = models.DateTimeField(null=True, default=None)
+    missing_ticks = models.IntegerField(null=True, default=None)  # Minutes without a tick, when last checked
+
+    def __str__(self):
+        return f"Rollups for {self.date}"
+
+    @classmethod
+    def mark(cls, day, table):
+        """Confirm that the daily rollup of one table ('device_logs', 'room_logs' or 'energy_generation') is done."""
+        cls.objects.update_or_create(date=day, defaults={f'{table}_at': timezone.now()})
+
+    @classmethod
+    def defer(cls, day, missing_ticks):
+        """Record a day whose rollups were put off because minute ticks were missing."""
+        cls.objects.update_or_create(date=day, defaults={'missing_ticks': missing_ticks})
+
+    @classmethod
+    def unconfirmed(cls):
+        """Days with at least one daily rollup not confirmed."""
+        query = models.Q()
+        for table in cls.ROLLUP_TABLES:
+            query |= models.Q(**{f'{table}_at__isnull': True})
+        return cls.objects.filter(query)
+
+class HomeIOCommand(models.Model):
+    """
+    Outbox entry for a device change still to be sent to HomeIO.
+    
+    Saving a device writes one of these in the same transaction instead of calling
+    HomeIO inline, and the run_homeio_outbox worker sends them in the background
+    (see api/outbox.py). A device has at most one pending command: further changes
+    before it is sent are merged into it, and the worker sends the device's state
+    as it is at sending time, so rapid toggles end in a single request for the
+    final state.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_SUPERSEDED = 'superseded'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_SUPERSEDED, 'Superseded'),
+    ]
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='homeio_commands')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    set_state = models.BooleanField(default=False)      # Send the on/off status
+    set_analogue = models.BooleanField(default=False)   # Send the analogue value
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    available_at = models.DateTimeField(default=timezone.now)  # Not sent before, for retries
+    claimed_at = models.DateTimeField(null=True, default=None)
+    sent_at = models.DateTimeField(null=True, default=None)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device'], condition=models.Q(status='pending'),
+                name='unique_pending_homeio_command'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='homeio_command_queue_idx')
+        ]
+
+    def __str__(self):
+        return f"HomeIO command {self.pk} for device {self.device_id} ({self.status})"
+
+class Scene(models.Model):
+    """
+    A named set of device actions for one smart home, e.g. "Away" turning every
+    room off, applied in one go through the batch control endpoint.
+    
+    actions holds the same action objects the endpoint accepts: a device or room
+    target plus the status and/or analogue value to set. Later actions win over
+    earlier ones for the same device.
+    """
+    name = models.CharField(max_length=100)
+    smart_home = models.ForeignKey(SmartHome, on_delete=models.CASCADE, related_name='scenes')
+    actions = models.JSONField(default=list)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='scenes')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['smart_home', 'name'], name='unique_scene_in_home')
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.smart_home})"
+
 class UserProfile(models.Model):
     """
     Extends the built-in User model with additional profile information.
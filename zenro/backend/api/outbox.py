@@ -0,0 +1,226 @@
+"""
+Outbox of device commands for HomeIO.
+
+Device changes are recorded as HomeIOCommand rows in the same transaction as the
+device itself, so the request that made the change returns without waiting for
+HomeIO, and no change is lost if HomeIO is down. The run_homeio_outbox worker
+claims pending commands in batches and sends them concurrently through the pooled
+HomeIO client, retrying failures with a growing delay.
+
+A device has at most one pending command (a partial unique constraint), so changes
+made while one is waiting are merged into it. A change made while a command is
+being sent starts a new pending command, which is sent after it.
+
+While the HomeIO circuit breaker is open the worker claims nothing, so commands
+wait in the queue without using up their attempts, and once it turns half-open a
+single command is sent as the probe.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .home_io.circuit_breaker import get_breaker, STATE_OPEN, STATE_HALF_OPEN
+from .home_io.home_io_services import HomeIOService, DEVICE_DETAILS_RELATED
+from .models import HomeIOCommand
+
+def enqueue_device_command(device, set_state=False, set_analogue=False):
+    """
+    Record that a device's status and/or analogue value must be sent to HomeIO.
+
+    Merges into the device's pending command when there is one.
+
+    Returns:
+        The pending HomeIOCommand
+    """
+    for _ in range(2):
+        command = HomeIOCommand.objects.filter(
+            device=device, status=HomeIOCommand.STATUS_PENDING
+        ).first()
+        if command is not None:
+            command.set_state = command.set_state or set_state
+            command.set_analogue = command.set_analogue or set_analogue
+            command.save(update_fields=['set_state', 'set_analogue'])
+            return command
+        try:
+            # Savepoint, so a concurrent insert only undoes this statement
+            with transaction.atomic():
+                return HomeIOCommand.objects.create(
+                    device=device, set_state=set_state, set_analogue=set_analogue
+                )
+        except IntegrityError:
+            # Another request created the pending command first; merge into it
+            continue
+    raise RuntimeError(f"Could not enqueue a HomeIO command for device {device.pk}")
+
+def enqueue_device_commands(changes):
+    """
+    Queue commands for many devices at once, e.g. for batch control.
+
+    Same merging as enqueue_device_command, with one query for the pending commands
+    to merge into, one bulk update and one bulk insert.
+
+    Parameters:
+        changes: List of (device, set_state, set_analogue)
+
+    Returns:
+        {device id: pending HomeIOCommand}
+    """
+    pending = {
+        command.device_id: command
+        for command in HomeIOCommand.objects.filter(
+            device_id__in=[device.pk for device, _, _ in changes], status=HomeIOCommand.STATUS_PENDING
+        )
+    }
+    merged, created = [], []
+    for device, set_state, set_analogue in changes:
+        command = pending.get(device.pk)
+        if command is not None:
+            command.set_state = command.set_state or set_state
+            command.set_analogue = command.set_analogue or set_analogue
+            merged.append(command)
+        else:
+            command = HomeIOCommand(device=device, set_state=set_state, set_analogue=set_analogue)
+            created.append(command)
+            pending[device.pk] = command
+
+    if merged:
+        HomeIOCommand.objects.bulk_update(merged, ['set_state', 'set_analogue'])
+    if created:
+        try:
+            with transaction.atomic():
+                HomeIOCommand.objects.bulk_create(created)
+        except IntegrityError:
+            # Another request queued commands for some of these devices meanwhile
+            for command in created:
+                pending[command.device_id] = enqueue_device_command(
+                    command.device, command.set_state, command.set_analogue
+                )
+    return pending
+
+def requeue_stale_commands():
+    """
+    Return commands claimed by a worker that died before finishing them to the queue.
+
+    Returns:
+        Number of commands requeued or superseded
+    """
+    stale = HomeIOCommand.objects.filter(
+        status=HomeIOCommand.STATUS_SENDING,
+        claimed_at__lt=timezone.now() - timedelta(seconds=getattr(settings, 'HOME_IO_COMMAND_CLAIM_TIMEOUT', 60))
+    )
+    return sum(_retry_later(command, 'Worker stopped before sending') for command in stale)
+
+def claim_commands(limit):
+    """
+    Mark up to limit due pending commands as being sent by this worker.
+
+    The conditional update makes sure two workers never claim the same command.
+
+    Returns:
+        List of claimed commands with their devices and HomeIO details loaded
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(HomeIOCommand.objects.filter(
+            status=HomeIOCommand.STATUS_PENDING, available_at__lte=now
+        ).order_by('id').values_list('id', flat=True)[:limit])
+        HomeIOCommand.objects.filter(id__in=ids, status=HomeIOCommand.STATUS_PENDING).update(
+            status=HomeIOCommand.STATUS_SENDING, claimed_at=now
+        )
+    return list(HomeIOCommand.objects.filter(
+        id__in=ids, status=HomeIOCommand.STATUS_SENDING, claimed_at=now
+    ).select_related(*[f'device__{related}' for related in DEVICE_DETAILS_RELATED]))
+
+def _retry_later(command, error):
+    """
+    Put a command that could not be sent back in the queue, or give up on it after
+    HOME_IO_COMMAND_MAX_ATTEMPTS. If the device got a newer pending command meanwhile,
+    this one is merged into it instead.
+
+    Returns:
+        1, for counting
+    """
+    command.error = error
+    max_attempts = getattr(settings, 'HOME_IO_COMMAND_MAX_ATTEMPTS', 5)
+    if command.attempts >= max_attempts:
+        command.status = HomeIOCommand.STATUS_FAILED
+        command.save(update_fields=['status', 'attempts', 'error'])
+        return 1
+
+    with transaction.atomic():
+        newer = HomeIOCommand.objects.filter(
+            device_id=command.device_id, status=HomeIOCommand.STATUS_PENDING
+        ).first()
+        if newer is not None:
+            newer.set_state = newer.set_state or command.set_state
+            newer.set_analogue = newer.set_analogue or command.set_analogue
+            newer.save(update_fields=['set_state', 'set_analogue'])
+            command.status = HomeIOCommand.STATUS_SUPERSEDED
+        else:
+            command.status = HomeIOCommand.STATUS_PENDING
+            # 2, 4, 8... seconds between attempts
+            command.available_at = timezone.now() + timedelta(seconds=2 ** max(command.attempts, 1))
+        command.save(update_fields=['status', 'attempts', 'error', 'available_at'])
+    return 1
+
+def send_commands(commands, service=None):
+    """
+    Send claimed commands to HomeIO and record the outcome of each.
+
+    The on/off commands go out first and the analogue values after them, so a
+    device turned on and dimmed in one command gets both in that order. Within
+    each pass requests are sent concurrently (see HomeIOService.apply_many).
+
+    Returns:
+        (number sent, number failed)
+    """
+    if not commands:
+        return 0, 0
+    service = service or HomeIOService()
+    ok = {command.pk: True for command in commands}
+
+    for kind, field in (('state', 'set_state'), ('analogue', 'set_analogue')):
+        batch = [command for command in commands if getattr(command, field)]
+        # An analogue value only applies to a device that is on
+        if kind == 'analogue':
+            batch = [command for command in batch if command.device.status]
+        results = service.apply_many([(command.device, kind) for command in batch])
+        for command, result in zip(batch, results):
+            # None means there was nothing to send for this device type
+            ok[command.pk] = ok[command.pk] and result is not False
+
+    sent = failed = 0
+    now = timezone.now()
+    for command in commands:
+        command.attempts += 1
+        if ok[command.pk]:
+            command.status = HomeIOCommand.STATUS_SENT
+            command.sent_at = now
+            command.error = ''
+            command.save(update_fields=['status', 'attempts', 'sent_at', 'error'])
+            sent += 1
+        else:
+            failed += _retry_later(command, 'HomeIO did not accept the command')
+    return sent, failed
+
+def process_outbox(limit=None, service=None):
+    """
+    Requeue stale commands, then claim and send one batch of due commands.
+
+    Nothing is claimed while the HomeIO circuit breaker is open, and only one
+    command while it is half-open.
+
+    Returns:
+        (number sent, number failed)
+    """
+    requeue_stale_commands()
+    state = get_breaker().state
+    if state == STATE_OPEN:
+        return 0, 0
+    limit = limit or getattr(settings, 'HOME_IO_OUTBOX_BATCH_SIZE', 50)
+    commands = claim_commands(1 if state == STATE_HALF_OPEN else limit)
+    result = send_commands(commands, service)
+    if commands:
+        # Keep the health snapshot current with the batch just sent
+        get_breaker().publish()
+    return result
@@ -0,0 +1,109 @@
+"""
+Column-oriented binary encoding of log series for bulk chart loads.
+
+A series is a start time, a fixed step and one float32 per step, with an optional
+status bitmap, instead of one JSON object per row. A device-day (1440 minutes) takes
+about 6 KB instead of well over 100 KB of JSON, and a client reads it straight into
+a Float32Array without parsing.
+
+Layout (little-endian):
+    magic       4s   b'ZSER'
+    version     B    1
+    flags       B    bit 0 set when a status bitmap follows the values
+    reserved    H    0
+    start       q    first timestamp, seconds since 1970-01-01 of the server's wall clock
+    step        i    seconds between values
+    count       I    number of values
+    values      count x float32; NaN for steps without data
+    status      ceil(count / 8) bytes, bit i (least significant first) set when on
+
+Rows sharing a step (e.g. several devices in one minute) are summed, and their
+statuses OR-ed, so an unfiltered request packs the combined series.
+"""
+import math
+import struct
+import sys
+from array import array
+from calendar import timegm
+from datetime import datetime, time
+
+MAGIC = b'ZSER'
+VERSION = 1
+FLAG_STATUS = 0x01
+HEADER = struct.Struct('<4sBBHqiI')
+
+class SeriesTooLong(ValueError):
+    """The requested range would pack more than the allowed number of values."""
+
+def _seconds(moment):
+    if not isinstance(moment, datetime):
+        moment = datetime.combine(moment, time.min)
+    return timegm(moment.timetuple())
+
+def pack_series(rows, step, with_status=False, max_values=None):
+    """
+    Pack (timestamp, value[, status]) rows ordered by time into the binary layout.
+
+    Parameters:
+        rows: Iterable of tuples; timestamps are datetimes or dates
+        step: Seconds between consecutive values (60 for minute logs, 86400 for daily)
+        with_status: Whether rows carry a third status item to put in the bitmap
+        max_values: Raise SeriesTooLong when the series would be longer
+
+    Returns:
+        The packed bytes
+    """
+    start = None
+    values = array('f')
+    status = bytearray()
+
+    for row in rows:
+        seconds = _seconds(row[0])
+        if start is None:
+            start = seconds
+        index = (seconds - start) // step
+
+        if index >= len(values):
+            if max_values is not None and index >= max_values:
+                raise SeriesTooLong(f"Series is longer than {max_values} values")
+            values.extend([math.nan] * (index + 1 - len(values)))
+        values[index] = row[1] if math.isnan(values[index]) else values[index] + row[1]
+
+        if with_status and row[2]:
+            byte = index // 8
+            if byte >= len(status):
+                status.extend(bytes(byte + 1 - len(status)))
+            status[byte] |= 1 << (index % 8)
+
+    count = len(values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    payload = [HEADER.pack(
+        MAGIC, VERSION, FLAG_STATUS if with_status else 0, 0, start or 0, step, count
+    ), values.tobytes()]
+    if with_status:
+        status.extend(bytes((count + 7) // 8 - len(status)))
+        payload.append(bytes(status))
+    return b''.join(payload)
+
+def unpack_series(data):
+    """
+    Decode packed bytes back into (start, step, values, statuses).
+
+    Mostly useful for tests and Python clients; statuses is None without a bitmap.
+    """
+    magic, version, flags, _, start, step, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a packed series")
+
+    values = array('f')
+    values.frombytes(data[HEADER.size:HEADER.size + 4 * count])
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    statuses = None
+    if flags & FLAG_STATUS:
+        bitmap = data[HEADER.size + 4 * count:]
+        statuses = [bool(bitmap[i // 8] & (1 << (i % 8))) for i in range(count)]
+    return start, step, list(values), statuses
@@ -0,0 +1,108 @@
+"""
+Keyset (cursor) pagination for the 1-minute log endpoints.
+
+Pages are ordered by (created_at, id) and each page starts strictly after the last
+row of the previous one, so walking a month of logs never uses OFFSET and every page
+is a range scan on the created_at indexes, however deep into the data it is.
+"""
+import base64
+from datetime import datetime
+from django.conf import settings
+from django.db import models
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+class LogCursorPagination(BasePagination):
+    """
+    Query parameters:
+    - page_size: Rows per page (default LOG_PAGE_SIZE, at most LOG_MAX_PAGE_SIZE)
+    - order: 'desc' for newest first (default) or 'asc'
+    - cursor: Opaque position returned as next_cursor by the previous page
+
+    Responses have the form {'next': url, 'next_cursor': str, 'results': [...]},
+    with next and next_cursor set to None on the last page.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    order_query_param = 'order'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'LOG_PAGE_SIZE', 1000)
+        maximum = getattr(settings, 'LOG_MAX_PAGE_SIZE', 10000)
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, default))
+        except ValueError:
+            page_size = default
+        return min(max(page_size, 1), maximum)
+
+    def encode_cursor(self, row):
+        position = f"{row.created_at.isoformat()}|{row.pk}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            return datetime.fromisoformat(created_at), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        descending = request.query_params.get(self.order_query_param, 'desc') != 'asc'
+
+        if descending:
+            queryset = queryset.order_by('-created_at', '-id')
+        else:
+            queryset = queryset.order_by('created_at', 'id')
+
+        cursor = self.decode_cursor(request)
+        if cursor:
+            created_at, pk = cursor
+            # The created_at bound drives the index range scan; the id only breaks ties
+            if descending:
+                queryset = queryset.filter(
+                    models.Q(created_at__lt=created_at) | models.Q(created_at=created_at, id__lt=pk),
+                    created_at__lte=created_at
+                )
+            else:
+                queryset = queryset.filter(
+                    models.Q(created_at__gt=created_at) | models.Q(created_at=created_at, id__gt=pk),
+                    created_at__gte=created_at
+                )
+
+        # Fetch one extra row to know whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,34 @@
+"""
+Renderers for the non-JSON formats the API can serve.
+
+They let DRF's content negotiation select a format from ?format= or the Accept
+header. Views answering in these formats build their own response body (a stream,
+or packed bytes), so the renderers themselves only ever render error payloads,
+which they send as JSON, labelled application/json.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+class _RawFormatRenderer(BaseRenderer):
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # The response already carries this format's content type; the body is JSON
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+class CSVRenderer(_RawFormatRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+class NDJSONRenderer(_RawFormatRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+class PackedSeriesRenderer(_RawFormatRenderer):
+    """Column-oriented binary series, see api/packing.py."""
+    media_type = 'application/vnd.zenro.series'
+    format = 'bin'
@@ -0,0 +1,142 @@
+"""
+Retention policy for the 1-minute log tables.
+
+Minute data is kept for LOG_RETENTION_DAYS. Older days are deleted only once their
+daily rollup is confirmed in DailyRollupStatus, and always in small chunks, each in
+its own short transaction, so the SQLite write lock is released between chunks and
+the per-minute tick is never stalled behind a long delete.
+"""
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+from .cache import bump_version
+from .models import (
+    DeviceLog1Min, RoomLog1Min, EnergyGeneration1Min, DailyRollupStatus, MinuteTick,
+    DeviceRunningTotal, RoomRunningTotal, HomeRunningTotal
+)
+from .time_windows import day_bounds
+
+logger = logging.getLogger(__name__)
+
+# Each minute log table and the DailyRollupStatus column confirming its rollup
+MINUTE_LOG_TABLES = [
+    (DeviceLog1Min, 'device_logs'),
+    (RoomLog1Min, 'room_logs'),
+    (EnergyGeneration1Min, 'energy_generation'),
+]
+
+# Each running total table and the rollup that may copy it
+RUNNING_TOTAL_TABLES = [
+    (DeviceRunningTotal, 'device_logs'),
+    (RoomRunningTotal, 'room_logs'),
+    (HomeRunningTotal, 'energy_generation'),
+]
+
+def get_retention_cutoff(today=None):
+    """First day whose minute data must be kept under the retention policy."""
+    today = today or timezone.now().date()
+    return today - timedelta(days=getattr(settings, 'LOG_RETENTION_DAYS', 90))
+
+def delete_in_chunks(queryset, order_field):
+    """
+    Delete every row of a queryset in bounded chunks.
+
+    Each chunk selects at most LOG_PRUNE_CHUNK_SIZE primary keys through the
+    order_field index and deletes them in a separate transaction, pausing for
+    LOG_PRUNE_PAUSE_SECONDS between chunks so other writers can get the lock.
+
+    Returns:
+        Number of rows deleted
+    """
+    chunk_size = getattr(settings, 'LOG_PRUNE_CHUNK_SIZE', 500)
+    pause = getattr(settings, 'LOG_PRUNE_PAUSE_SECONDS', 0.05)
+    model = queryset.model
+    deleted = 0
+
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by(order_field).values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            model.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
+        time.sleep(pause)
+
+    return deleted
+
+def prune_minute_logs(today=None):
+    """
+    Delete 1-minute logs older than the retention window whose daily rollup is confirmed.
+
+    Days past the window without a confirmed rollup are kept and reported, so they
+    can be rebuilt (see the rebuild_rollups command) before the next run prunes them.
+    The same goes for the running totals, which a deferred rollup may still copy,
+    and for the tick ledger, which it counts: a day's running totals are deleted
+    once their rollup is confirmed, its ticks once every rollup of the day is. The
+    'minute_logs' version is bumped when anything was deleted.
+
+    Returns:
+        Dictionary of rows deleted per table
+    """
+    cutoff = get_retention_cutoff(today)
+    cutoff_start, _ = day_bounds(cutoff)
+    report = {}
+
+    confirmed_days = {
+        table: set(DailyRollupStatus.objects.filter(
+            date__lt=cutoff, **{f'{table}_at__isnull': False}
+        ).values_list('date', flat=True))
+        for table in DailyRollupStatus.ROLLUP_TABLES
+    }
+
+    for model, rollup_table in MINUTE_LOG_TABLES:
+        oldest = model.objects.before(cutoff_start).aggregate(
+            oldest=models.Min('created_at')
+        )['oldest']
+        deleted = 0
+
+        if oldest is not None:
+            day = oldest.date()
+            while day < cutoff:
+                day_logs = model.objects.for_day(day)
+                if day in confirmed_days[rollup_table]:
+                    deleted += delete_in_chunks(day_logs, 'created_at')
+                elif day_logs.exists():
+                    logger.warning(f"Keeping {model.__name__} rows for {day}: daily rollup not confirmed")
+                day += timedelta(days=1)
+
+        report[model.__name__] = deleted
+
+    for model, rollup_table in RUNNING_TOTAL_TABLES:
+        report[model.__name__] = delete_in_chunks(
+            model.objects.filter(
+                date__lt=cutoff,
+                date__in=DailyRollupStatus.objects.filter(
+                    **{f'{rollup_table}_at__isnull': False}
+                ).values('date')
+            ),
+            'date'
+        )
+
+    fully_confirmed = set.intersection(*confirmed_days.values())
+    oldest_tick = MinuteTick.objects.filter(minute__lt=cutoff_start).aggregate(
+        oldest=models.Min('minute')
+    )['oldest']
+    ticks = 0
+    if oldest_tick is not None:
+        day = oldest_tick.date()
+        while day < cutoff:
+            if day in fully_confirmed:
+                start, end = day_bounds(day)
+                ticks += delete_in_chunks(MinuteTick.objects.filter(minute__gte=start, minute__lt=end), 'minute')
+            day += timedelta(days=1)
+    report[MinuteTick.__name__] = ticks
+
+    # Responses and ETags of the minute logs are keyed by the tick, which has not moved
+    if any(report.values()):
+        bump_version('minute_logs')
+
+    return report
@@ -0,0 +1,296 @@
+"""
+Set-based rollups from the 1-minute log tables into the daily and monthly tables.
+
+Each rollup computes the totals of every device, room or home for a period with a
+single GROUP BY query and writes them back in bulk, so a nightly run costs a fixed
+number of queries per table instead of a few round trips per entity.
+
+Every write bumps the 'log_rollups' version once committed, which changes the ETags
+(and cache keys) of the daily and monthly log endpoints.
+"""
+from itertools import groupby
+from django.db import models, transaction
+from .cache import bump_version
+from .models import (
+    DeviceLog1Min, DeviceLogDaily, DeviceLogMonthly,
+    RoomLog1Min, RoomLogDaily, RoomLogMonthly,
+    EnergyGeneration1Min, EnergyGenerationDaily, EnergyGenerationMonthly,
+    DeviceRunningTotal, RoomRunningTotal, HomeRunningTotal
+)
+from .time_windows import month_bounds
+
+# Rows per statement for bulk writes, kept well under SQLite's variable limit
+BULK_BATCH_SIZE = 500
+
+# home_ids selecting what belongs to no home: the devices that are not in a room
+WITHOUT_HOME = 'without_home'
+
+def _sum_by_entity(queryset, entity_field, value_field):
+    """Run one GROUP BY query and return {entity_id: total}."""
+    rows = queryset.values(entity_field).annotate(
+        total=models.Sum(value_field)
+    ).order_by()
+    return {row[entity_field]: row['total'] or 0 for row in rows}
+
+def _write_rollup(target_model, key_fields, rows, total_fields):
+    """
+    Upsert one period's rollup rows in bulk.
+
+    Relies on the unique constraint over key_fields (entity plus date, or entity
+    plus year and month), so entities without source data keep whatever was
+    stored before.
+    """
+    target_model.objects.bulk_create(
+        rows,
+        batch_size=BULK_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=key_fields,
+        update_fields=total_fields
+    )
+    if rows:
+        transaction.on_commit(lambda: bump_version('log_rollups'))
+    return len(rows)
+
+def _for_homes(home_lookup, home_ids):
+    """
+    Filter kwargs restricting a rollup to some homes, to the rows outside every home
+    (WITHOUT_HOME), or no filter for all homes.
+    """
+    if home_ids is None:
+        return {}
+    if home_ids == WITHOUT_HOME:
+        return {f'{home_lookup}__isnull': True}
+    return {f'{home_lookup}__in': list(home_ids)}
+
+def _sum_day_by_entity(source_model, entity_field, value_field, day, home_filter):
+    return _sum_by_entity(
+        source_model.objects.for_day(day).filter(**home_filter),
+        entity_field, value_field
+    )
+
+def _running_totals_by_entity(running_total_model, entity_field, value_field, day, home_filter):
+    return dict(
+        running_total_model.objects.filter(date=day, **home_filter).values_list(entity_field, value_field)
+    )
+
+def _write_day(target_model, total_field, entity_field, day, totals):
+    rows = [
+        target_model(**{entity_field: entity_id, total_field: total}, date=day)
+        for entity_id, total in totals.items()
+    ]
+    return _write_rollup(target_model, [entity_field.removesuffix('_id'), 'date'], rows, [total_field])
+
+def _rollup_month(source_model, target_model, total_field, entity_field, year, month, home_filter):
+    first_day, last_day = month_bounds(year, month)
+    totals = _sum_by_entity(
+        source_model.objects.filter(date__gte=first_day, date__lte=last_day, **home_filter),
+        entity_field, total_field
+    )
+    rows = [
+        target_model(**{entity_field: entity_id, total_field: total}, year=year, month=month)
+        for entity_id, total in totals.items()
+    ]
+    return _write_rollup(
+        target_model, [entity_field.removesuffix('_id'), 'year', 'month'], rows, [total_field]
+    )
+
+def calculate_device_metrics(row):
+    """
+    Build the compact daily metrics stored in DeviceLogDaily.status_usage_details.
+    
+    Parameters:
+        row: One device's aggregates from rollup_device_daily(), with minute counts
+             and usage sums for the whole day, uptime and downtime
+    
+    Returns:
+        Dictionary with total usage, average usage, and separate metrics for
+        periods when the device was on vs. off. The per-minute logs are not
+        copied in; they are served on request from DeviceLog1Min.
+    """
+    def period_metrics(minutes, usage):
+        seconds = minutes * 60  # Reported in seconds for consistency
+        return {
+            'duration': seconds,
+            'total_usage': usage or 0,
+            'avg_usage_per_second': (usage or 0) / seconds if seconds > 0 else 0
+        }
+
+    total_usage = row['total_usage'] or 0
+    usage_duration = row['minutes'] * 60
+
+    return {
+        'total_usage': total_usage,
+        'avg_usage_per_second': total_usage / usage_duration if usage_duration > 0 else 0,
+        'uptime': period_metrics(row['uptime_minutes'], row['uptime_usage']),
+        'downtime': period_metrics(row['downtime_minutes'], row['downtime_usage'])
+    }
+
+def calculate_monthly_metrics(daily_logs):
+    """
+    Calculate monthly metrics from daily logs.
+    
+    Parameters:
+        daily_logs: One device's DeviceLogDaily rows for the month, as dictionaries
+                    with date, total_energy_usage and status_usage_details
+        
+    Returns:
+        Dictionary with daily summaries and monthly totals/averages
+    """
+    total_days = len(daily_logs)
+    if total_days == 0:
+        return {}
+        
+    total_usage = 0
+    total_uptime_usage = 0
+    total_downtime_usage = 0
+    daily_summaries = {}
+    
+    for log in daily_logs:
+        details = log['status_usage_details']
+        total_usage += log['total_energy_usage']
+        total_uptime_usage += details.get('uptime', {}).get('total_usage', 0)
+        total_downtime_usage += details.get('downtime', {}).get('total_usage', 0)
+        
+        daily_summaries[str(log['date'])] = {
+            'total_usage': log['total_energy_usage'],
+            'uptime': details.get('uptime', {}),
+            'downtime': details.get('downtime', {})
+        }
+    
+    return {
+        'daily_summaries': daily_summaries,
+        'monthly_totals': {
+            'total_usage': total_usage,
+            'uptime_usage': total_uptime_usage,
+            'downtime_usage': total_downtime_usage
+        },
+        'monthly_averages': {
+            'avg_daily_usage': total_usage / total_days,
+            'avg_daily_uptime_usage': total_uptime_usage / total_days,
+            'avg_daily_downtime_usage': total_downtime_usage / total_days
+        }
+    }
+
+def rollup_device_daily(day, from_running_totals=False, home_ids=None):
+    """
+    Write DeviceLogDaily rows for every device with DeviceLog1Min data on the given day.
+    
+    Uptime and downtime counts and sums for all devices come from one
+    conditional-aggregation query. With from_running_totals, the finished day's
+    DeviceRunningTotal counters are copied instead of re-reading the minute logs.
+    Passing home_ids limits the rollup to devices in those homes.
+    """
+    home_filter = _for_homes('device__room__smart_home_id', home_ids)
+    if from_running_totals:
+        device_totals = DeviceRunningTotal.objects.filter(date=day, **home_filter).values(
+            'device_id',
+            'minutes',
+            total_usage=models.F('energy_usage'),
+            uptime_minutes=models.F('on_minutes'),
+            uptime_usage=models.F('on_energy_usage'),
+            downtime_minutes=models.F('minutes') - models.F('on_minutes'),
+            downtime_usage=models.F('energy_usage') - models.F('on_energy_usage')
+        )
+    else:
+        uptime = models.Q(status=True)
+        downtime = models.Q(status=False)
+
+        device_totals = DeviceLog1Min.objects.for_day(day).filter(**home_filter).values('device_id').annotate(
+            total_usage=models.Sum('energy_usage'),
+            minutes=models.Count('id'),
+            uptime_minutes=models.Count('id', filter=uptime),
+            uptime_usage=models.Sum('energy_usage', filter=uptime),
+            downtime_minutes=models.Count('id', filter=downtime),
+            downtime_usage=models.Sum('energy_usage', filter=downtime)
+        ).order_by()
+
+    rows = []
+    for row in device_totals:
+        metrics = calculate_device_metrics(row)
+        rows.append(DeviceLogDaily(
+            device_id=row['device_id'],
+            date=day,
+            total_energy_usage=metrics['total_usage'],
+            status_usage_details=metrics
+        ))
+    return _write_rollup(
+        DeviceLogDaily, ['device', 'date'], rows, ['total_energy_usage', 'status_usage_details']
+    )
+
+def rollup_device_monthly(year, month, home_ids=None):
+    """Write DeviceLogMonthly rows for every device with DeviceLogDaily data in the given month."""
+    first_day, last_day = month_bounds(year, month)
+    daily_logs = DeviceLogDaily.objects.filter(
+        date__gte=first_day, date__lte=last_day,
+        **_for_homes('device__room__smart_home_id', home_ids)
+    ).values(
+        'device_id', 'date', 'total_energy_usage', 'status_usage_details'
+    ).order_by('device_id', 'date')
+
+    rows = []
+    for device_id, device_logs in groupby(daily_logs, key=lambda log: log['device_id']):
+        monthly_metrics = calculate_monthly_metrics(list(device_logs))
+        rows.append(DeviceLogMonthly(
+            device_id=device_id,
+            year=year,
+            month=month,
+            total_energy_usage=monthly_metrics['monthly_totals']['total_usage'],
+            daily_summaries=monthly_metrics
+        ))
+    return _write_rollup(
+        DeviceLogMonthly, ['device', 'year', 'month'], rows, ['total_energy_usage', 'daily_summaries']
+    )
+
+def rollup_room_daily(day, from_running_totals=False, home_ids=None):
+    """
+    Write RoomLogDaily rows for every room with RoomLog1Min data on the given day,
+    or copy them from the day's RoomRunningTotal counters.
+    """
+    home_filter = _for_homes('room__smart_home_id', home_ids)
+    if from_running_totals:
+        totals = _running_totals_by_entity(RoomRunningTotal, 'room_id', 'energy_usage', day, home_filter)
+    else:
+        totals = _sum_day_by_entity(RoomLog1Min, 'room_id', 'energy_usage', day, home_filter)
+    return _write_day(RoomLogDaily, 'total_energy_usage', 'room_id', day, totals)
+
+def rollup_room_monthly(year, month, home_ids=None):
+    """Write RoomLogMonthly rows for every room with RoomLogDaily data in the given month."""
+    return _rollup_month(
+        RoomLogDaily, RoomLogMonthly, 'total_energy_usage', 'room_id', year, month,
+        _for_homes('room__smart_home_id', home_ids)
+    )
+
+def rollup_energy_generation_daily(day, from_running_totals=False, home_ids=None):
+    """
+    Write EnergyGenerationDaily rows for every home with generation data on the given day,
+    or copy them from the day's HomeRunningTotal counters.
+    """
+    home_filter = _for_homes('home_id', home_ids)
+    if from_running_totals:
+        totals = _running_totals_by_entity(HomeRunningTotal, 'home_id', 'energy_generation', day, home_filter)
+    else:
+        totals = _sum_day_by_entity(EnergyGeneration1Min, 'home_id', 'energy_generation', day, home_filter)
+    return _write_day(EnergyGenerationDaily, 'total_energy_generation', 'home_id', day, totals)
+
+def rollup_energy_generation_monthly(year, month, home_ids=None):
+    """Write EnergyGenerationMonthly rows for every home with daily generation in the given month."""
+    return _rollup_month(
+        EnergyGenerationDaily, EnergyGenerationMonthly, 'total_energy_generation',
+        'home_id', year, month, _for_homes('home_id', home_ids)
+    )
+
+def rebuild_day(day, home_ids=None):
+    """Recompute every daily rollup table for one day from the 1-minute logs."""
+    return {
+        'device_daily': rollup_device_daily(day, home_ids=home_ids),
+        'room_daily': rollup_room_daily(day, home_ids=home_ids),
+        'generation_daily': rollup_energy_generation_daily(day, home_ids=home_ids),
+    }
+
+def rebuild_month(year, month, home_ids=None):
+    """Recompute every monthly rollup table for one month from the daily rollups."""
+    return {
+        'device_monthly': rollup_device_monthly(year, month, home_ids=home_ids),
+        'room_monthly': rollup_room_monthly(year, month, home_ids=home_ids),
+        'generation_monthly': rollup_energy_generation_monthly(year, month, home_ids=home_ids),
+    }
@@ -0,0 +1,100 @@
+"""
+Maintenance of the "today so far" counters (DeviceRunningTotal, RoomRunningTotal,
+HomeRunningTotal) that the minute tick updates as it writes its logs, and their
+repair when minute logs are rewritten afterwards.
+"""
+from django.db import models
+from .models import DeviceRunningTotal, RoomRunningTotal, HomeRunningTotal, RoomLog1Min, Room
+
+# Rows per statement for bulk writes, kept well under SQLite's variable limit
+BULK_BATCH_SIZE = 500
+
+def add_to_running_totals(model, entity_field, day, increments):
+    """
+    Add one tick's increments to a running total table in a fixed number of queries.
+
+    Must be called inside the tick's transaction after its logs are written, so the
+    write lock is already held and the read-modify-write cannot interleave with
+    another writer.
+
+    Parameters:
+        model: DeviceRunningTotal, RoomRunningTotal or HomeRunningTotal
+        entity_field: Foreign key attribute of the entity, e.g. 'room_id'
+        day: Date the counters belong to
+        increments: {entity_id: {field: amount to add}}
+
+    Returns:
+        Number of counter rows written
+    """
+    if not increments:
+        return 0
+
+    fields = sorted({field for deltas in increments.values() for field in deltas})
+    current = {
+        row[entity_field]: row
+        for row in model.objects.filter(date=day).values(entity_field, *fields)
+    }
+
+    rows = []
+    for entity_id, deltas in increments.items():
+        values = current.get(entity_id, {})
+        rows.append(model(
+            date=day,
+            **{entity_field: entity_id},
+            **{field: values.get(field, 0) + deltas.get(field, 0) for field in fields}
+        ))
+
+    model.objects.bulk_create(
+        rows,
+        batch_size=BULK_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=[entity_field.removesuffix('_id'), 'date'],
+        update_fields=fields
+    )
+    return len(rows)
+
+def update_running_totals(day, device_increments, room_increments, home_increments):
+    """Apply one tick's device, room and home increments to today's counters."""
+    return {
+        'devices': add_to_running_totals(DeviceRunningTotal, 'device_id', day, device_increments),
+        'rooms': add_to_running_totals(RoomRunningTotal, 'room_id', day, room_increments),
+        'homes': add_to_running_totals(HomeRunningTotal, 'home_id', day, home_increments),
+    }
+
+def resync_usage_running_totals(day, room_ids):
+    """
+    Recompute the energy usage counters of some rooms, and of their homes, from the
+    day's RoomLog1Min rows, after those were rewritten outside the minute tick.
+
+    Home usage is the sum of the home's room logs, as in the tick.
+
+    Returns:
+        Number of counter rows written
+    """
+    home_ids = set(Room.objects.filter(id__in=room_ids).values_list('smart_home_id', flat=True))
+    day_logs = RoomLog1Min.objects.for_day(day)
+    room_usage = dict(day_logs.filter(room_id__in=room_ids).values('room_id').annotate(
+        total=models.Sum('energy_usage')
+    ).order_by().values_list('room_id', 'total'))
+    home_usage = dict(day_logs.filter(room__smart_home_id__in=home_ids).values('room__smart_home_id').annotate(
+        total=models.Sum('energy_usage')
+    ).order_by().values_list('room__smart_home_id', 'total'))
+
+    written = 0
+    for model, entity_field, usage in (
+        (RoomRunningTotal, 'room_id', {room_id: room_usage.get(room_id, 0.0) for room_id in room_ids}),
+        (HomeRunningTotal, 'home_id', {home_id: home_usage.get(home_id, 0.0) for home_id in home_ids}),
+    ):
+        rows = [
+            model(date=day, energy_usage=energy_usage, **{entity_field: entity_id})
+            for entity_id, energy_usage in usage.items()
+        ]
+        model.objects.bulk_create(
+            rows,
+            batch_size=BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=[entity_field.removesuffix('_id'), 'date'],
+            update_fields=['energy_usage']
+        )
+        written += len(rows)
+    return written
@@ -1,129 +1,229 @@
+import logging
 import random
 import time 
+from django.conf import settings
 from django.db import models, transaction
 from django.utils import timezone
 from datetime import timedelta
-from .models import Room, RoomLog1Min, RoomLogDaily, RoomLogMonthly, Device, DeviceLog1Min, DeviceLogDaily, DeviceLogMonthly, SmartHome, EnergyGeneration1Min, EnergyGenerationDaily, EnergyGenerationMonthly
+from .models import RoomLog1Min, Device, DeviceLog1Min, SmartHome, EnergyGeneration1Min, MinuteTick, DailyRollupStatus
+from .cache import set_watermark, bump_version
+from .retention import prune_minute_logs
+from .running_totals import update_running_totals, resync_usage_running_totals
+from .rollups import (
+    rollup_device_daily, rollup_device_monthly,
+    rollup_room_daily, rollup_room_monthly,
+    rollup_energy_generation_daily, rollup_energy_generation_monthly
+)
+from .time_windows import day_bounds
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT statement for bulk_create, kept well under SQLite's variable limit
+BULK_BATCH_SIZE = 500
 
 def is_first_day_of_month(date):
     """Check if given date is the first day of the month."""
     return date.day == 1
 
+def get_metered_devices():
+    """
+    Devices that produce a 1-minute log: unlocked, with a known consumption rate,
+    and not one of the analogue sensor channels.
+    """
+    return Device.objects.filter(
+        is_unlocked=True,
+        supported_device__consumption_rate__isnull=False
+    ).exclude(name__contains="Analogue")
+
+def calculate_minute_energy_usage(status, consumption_rate):
+    """Energy used by a device over one minute, in kWh."""
+    if status:
+        # Calculate energy usage in kWh for 1 minute period
+        return consumption_rate * 60 / 3600 / 1000
+    # Standby draw while the device is off
+    return random.uniform(0, 0.00017)
+
 def generate_minute_data():
     """
-    Generate 1-minute device logs for all unlocked devices.
+    Generate 1-minute energy generation and device logs for the current minute.
     Uses a uniform timestamp for all logs created in this batch.
+    
+    The whole tick runs in one transaction with a fixed number of queries,
+    regardless of how many homes or devices exist.
+    
+    Process:
+    1. Load all home ids, and all metered devices with their consumption rates, in one query each
+    2. Build EnergyGeneration1Min and DeviceLog1Min rows in memory
+    3. Sum each room's and home's device usage in the same pass to build the RoomLog1Min rows
+    4. Write all three sets of rows with bulk_create
+    5. Add the tick's usage, generation and on-minutes to today's running totals
+    6. Record the tick in the MinuteTick ledger, committed together with the logs
+    7. Once committed, move the response cache watermark to this minute
+    
+    Returns:
+        Dictionary reporting the tick timestamp, rows written per table and duration
     """
+    started = time.perf_counter()
+
     # Get the current minute timestamp (rounded down to the minute)
     now = timezone.now()
     current_minute = now.replace(second=0, microsecond=0)
     
-    homes = SmartHome.objects.all()
-    for home in homes:
-        energy_gen = random.uniform(0, 0.083)
-        EnergyGeneration1Min.objects.create(
-            home=home,
-            energy_generation=energy_gen,
-            created_at=current_minute  # Use the uniform timestamp
-        )
-
-    devices = Device.objects.all()
-    for device in devices:
-        if (device.is_unlocked and device.supported_device.consumption_rate != None and "Analogue" not in device.name):
-            if device.status:
-                # Calculate energy usage in kWh for 1 minute period
-                energy_usage = device.supported_device.consumption_rate * 60 / 3600 / 1000 # in kWh
-            else:
-                energy_usage = random.uniform(0, 0.00017)
-            DeviceLog1Min.objects.create(
-                device=device,
-                status=device.status,
-                energy_usage=energy_usage,
-                created_at=current_minute  # Use the uniform timestamp
+    try:
+        with transaction.atomic():
+            generation_logs = [
+                EnergyGeneration1Min(
+                    home_id=home_id,
+                    energy_generation=random.uniform(0, 0.083),
+                    created_at=current_minute  # Use the uniform timestamp
+                )
+                for home_id in SmartHome.objects.values_list('id', flat=True)
+            ]
+            home_totals = {
+                log.home_id: {'energy_generation': log.energy_generation, 'energy_usage': 0.0, 'on_minutes': 0}
+                for log in generation_logs
+            }
+
+            devices = get_metered_devices().values_list(
+                'id', 'room_id', 'room__smart_home_id', 'status', 'supported_device__consumption_rate'
             )
-        else: 
-            continue
+            device_logs = []
+            device_totals = {}
+            room_totals = {}
+            for device_id, room_id, home_id, status, consumption_rate in devices:
+                energy_usage = calculate_minute_energy_usage(status, consumption_rate)
+                device_logs.append(DeviceLog1Min(
+                    device_id=device_id,
+                    status=status,
+                    energy_usage=energy_usage,
+                    created_at=current_minute  # Use the uniform timestamp
+                ))
+                device_totals[device_id] = {
+                    'energy_usage': energy_usage,
+                    'on_energy_usage': energy_usage if status else 0.0,
+                    'minutes': 1,
+                    'on_minutes': 1 if status else 0
+                }
+
+                # Skip devices that are not assigned to a room
+                if room_id is None:
+                    continue
+                for totals, key in ((room_totals, room_id), (home_totals, home_id)):
+                    entity_totals = totals.setdefault(key, {'energy_usage': 0.0, 'on_minutes': 0})
+                    entity_totals['energy_usage'] += energy_usage
+                    entity_totals['on_minutes'] += 1 if status else 0
+
+            room_logs = [
+                RoomLog1Min(
+                    room_id=room_id,
+                    energy_usage=totals['energy_usage'],
+                    created_at=current_minute  # Use the same uniform timestamp
+                )
+                for room_id, totals in room_totals.items()
+            ]
+
+            EnergyGeneration1Min.objects.bulk_create(generation_logs, batch_size=BULK_BATCH_SIZE)
+            DeviceLog1Min.objects.bulk_create(device_logs, batch_size=BULK_BATCH_SIZE)
+            RoomLog1Min.objects.bulk_create(room_logs, batch_size=BULK_BATCH_SIZE)
+
+            update_running_totals(current_minute.date(), device_totals, room_totals, home_totals)
+
+            tick = MinuteTick.objects.create(
+                minute=current_minute,
+                device_logs=len(device_logs),
+                room_logs=len(room_logs),
+                generation_logs=len(generation_logs),
+                duration_ms=round((time.perf_counter() - started) * 1000, 2)
+            )
+
+            # Cached responses are keyed by the watermark, so moving it invalidates them
+            transaction.on_commit(lambda: set_watermark(current_minute))
+
+    except Exception as e:
+        print(f"Error in generate_minute_data: {e}")
+        raise
+
+    report = {
+        'minute': current_minute.isoformat(),
+        'generation_logs': tick.generation_logs,
+        'device_logs': tick.device_logs,
+        'room_logs': tick.room_logs,
+        'duration_ms': tick.duration_ms,
+    }
+    logger.info(
+        f"Minute tick {report['minute']}: {report['generation_logs']} generation logs, "
+        f"{report['device_logs']} device logs, {report['room_logs']} room logs in {report['duration_ms']} ms"
+    )
+    return report
+
+def count_missing_ticks(day):
+    """Number of minutes of a day without a committed tick in the MinuteTick ledger."""
+    start, end = day_bounds(day)
+    expected_ticks = int((end - start).total_seconds() // 60)
+    return expected_ticks - MinuteTick.objects.filter(minute__gte=start, minute__lt=end).count()
+
+def wait_for_day_ticks(day):
+    """
+    Wait until the minute ticks for a day are committed and check them for gaps.
+    
+    Polls the MinuteTick ledger until the day's last tick (23:59), or any later
+    tick, is recorded, for at most ROLLUP_TICK_WAIT_SECONDS. Then counts the
+    day's ticks against the number of minutes in the day. A day with missing
+    ticks is recorded in DailyRollupStatus, so retry_deferred_rollups rolls it
+    up later.
     
-    aggregate_device_to_room_logs(current_minute)  # Pass the timestamp to make aggregation more efficient
+    Returns:
+        True if every minute of the day has a committed tick, False otherwise
+    """
+    start, end = day_bounds(day)
+    last_minute = end - timedelta(minutes=1)
+    deadline = time.monotonic() + getattr(settings, 'ROLLUP_TICK_WAIT_SECONDS', 120)
+    poll_interval = getattr(settings, 'ROLLUP_TICK_POLL_SECONDS', 1)
+
+    while not MinuteTick.objects.filter(minute__gte=last_minute).exists():
+        if time.monotonic() >= deadline:
+            logger.warning(f"Last minute tick of {day} was not committed in time")
+            break
+        time.sleep(poll_interval)
+
+    missing_ticks = count_missing_ticks(day)
+    if missing_ticks:
+        logger.warning(f"{missing_ticks} minute ticks missing for {day}, deferring its rollups")
+        DailyRollupStatus.defer(day, missing_ticks)
+        return False
+    return True
 
 def aggregate_energy_generation():
     """
     Aggregates energy generation data into daily and monthly summaries for all Smart Homes.
-    This function runs as a scheduled task at 00:05 daily and processes data from the previous day.
+    This function runs as a scheduled task at 00:02 daily and processes data from the previous day.
     It also creates monthly aggregations at the beginning of each month.
     Process flow:
-    1. Waits 30 seconds to ensure all 1-minute logs have been generated
+    1. Waits for the last minute tick of the previous day to be committed, and
+       defers the run to retry_deferred_rollups if the tick ledger shows missing minutes
     2. For daily aggregation:
-       - Iterates through all Smart Homes
-       - Collects all 1-minute energy generation logs from previous day
-       - Calculates total generation for each home
-       - Creates or updates EnergyGenerationDaily records
+       - Copies every home's running generation total for the previous day
+       - Upserts the EnergyGenerationDaily records in bulk
     3. For monthly aggregation (only on first day of month):
-       - Iterates through all Smart Homes
-       - Collects all daily energy logs from the previous month
-       - Calculates total generation for the month
-       - Creates or updates EnergyGenerationMonthly records
-    All database operations are wrapped in a transaction to ensure data integrity.
+       - Sums every home's daily energy logs from the previous month in one GROUP BY query
+       - Upserts the EnergyGenerationMonthly records in bulk
+    Each table is written in its own short transaction (see api.rollups).
     Raises:
         Exception: Re-raises any exceptions that occur during processing after logging
     """
-    time.sleep(30) # Delay to ensure all 1-minute logs are generated
-    
     try:
-        with transaction.atomic():
-            today = timezone.now().date()
-            yesterday = today - timedelta(days=1)
-
-            # Step 1: Iterate over all homes
-            # Step 2: Filter and sum all energy generation yesterday
-            # Step 3: Save to EnergyGenerationDaily
-            homes = SmartHome.objects.all()
-            for home in homes:
-                daily_logs = EnergyGeneration1Min.objects.filter(
-                    home=home,
-                    created_at__date=yesterday
-                ).order_by('created_at')
-                
-                if not daily_logs.exists():
-                    continue # No logs to aggregate
-                else: 
-                    total_generation = daily_logs.aggregate(
-                        models.Sum('energy_generation')
-                    )['energy_generation__sum'] or 0
-                    
-                    EnergyGenerationDaily.objects.update_or_create(
-                        home=home,
-                        date=yesterday,
-                        defaults={'total_energy_generation': total_generation}
-                    )
-
-            # Step 1: Check if today is first of month
-            # Step 2: Iterate over all homes
-            # Step 3: Filter and sum previous month's daily logs
-            # Step 4: Save to EnergyGenerationMonthly
-            if is_first_day_of_month(today):
-                first_of_prev_month = yesterday.replace(day=1)
-                
-                for home in homes:
-                    monthly_logs = EnergyGenerationDaily.objects.filter(
-                        home=home,
-                        date__gte=first_of_prev_month,
-                        date__lte=yesterday
-                    ).order_by('date')
-                    
-                    if not monthly_logs.exists():
-                        continue  # No logs to aggregate
-                    else:
-                        total_generation = monthly_logs.aggregate(
-                            models.Sum('total_energy_generation')
-                        )['total_energy_generation__sum'] or 0
-                        
-                        EnergyGenerationMonthly.objects.update_or_create(
-                            home=home,
-                            month=yesterday.month,
-                            year=yesterday.year,
-                            defaults={'total_energy_generation': total_generation}
-                        )
+        today = timezone.now().date()
+        yesterday = today - timedelta(days=1)
+
+        if not wait_for_day_ticks(yesterday):
+            logger.warning(f"Deferring energy generation rollup for {yesterday}: minute ticks incomplete")
+            return
+
+        rollup_energy_generation_daily(yesterday, from_running_totals=True)
+        DailyRollupStatus.mark(yesterday, 'energy_generation')
+
+        if is_first_day_of_month(today):
+            rollup_energy_generation_monthly(yesterday.year, yesterday.month)
 
     except Exception as e:
         print(f"Error in aggregate_energy_generation: {e}")
@@ -135,249 +235,154 @@ def aggregate_room_logs():
     Runs at 00:05 daily to handle data from the previous day or month.
     
     Process:
-    1. For each room, aggregate all 1-minute logs from yesterday into a daily entry
-    2. On first day of month, aggregate previous month's daily logs into a monthly entry
+    1. Wait for yesterday's minute ticks to be committed; defer the run to retry_deferred_rollups if any are missing
+    2. Copy every room's running total for yesterday and upsert the daily entries
+    3. On first day of month, sum every room's daily logs from the previous month and upsert the monthly entries
     """
-    time.sleep(30) # Delay to ensure all 1-minute logs are generated
-
     try:
-        with transaction.atomic():
-            today = timezone.now().date()
-            yesterday = today - timedelta(days=1)
-
-            # Step 1: Iterate over all rooms
-            # Step 2: Filter and sum all energy usage yesterday
-            # Step 3: Save to RoomLogDaily
-            rooms = Room.objects.all()
-            for room in rooms:
-                daily_logs = RoomLog1Min.objects.filter(
-                    room=room,
-                    created_at__date=yesterday
-                ).order_by('created_at')
-                
-                if not daily_logs.exists():
-                    continue # No logs to aggregate
-                else: 
-                    total_usage = daily_logs.aggregate(
-                        models.Sum('energy_usage')
-                    )['energy_usage__sum'] or 0
-                    
-                    RoomLogDaily.objects.update_or_create(
-                        room=room,
-                        date=yesterday,
-                        defaults={'total_energy_usage': total_usage}
-                    )
-
-            # Step 1: Check if today is first of month
-            # Step 2: Iterate over all rooms
-            # Step 3: Filter and sum previous month's daily logs
-            # Step 4: Save to RoomLogMonthly
-            if is_first_day_of_month(today):
-                first_of_prev_month = yesterday.replace(day=1)
-                
-                for room in rooms:
-                    monthly_logs = RoomLogDaily.objects.filter(
-                        room=room,
-                        date__gte=first_of_prev_month,
-                        date__lte=yesterday
-                    ).order_by('date')
-                    
-                    if not monthly_logs.exists():
-                        continue  # No logs to aggregate
-                    else:
-                        total_usage = monthly_logs.aggregate(
-                            models.Sum('total_energy_usage')
-                        )['total_energy_usage__sum'] or 0
-                        
-                        RoomLogMonthly.objects.update_or_create(
-                            room=room,
-                            month=yesterday.month,
-                            year=yesterday.year,
-                            defaults={'total_energy_usage': total_usage}
-                        )
+        today = timezone.now().date()
+        yesterday = today - timedelta(days=1)
+
+        if not wait_for_day_ticks(yesterday):
+            logger.warning(f"Deferring room log rollup for {yesterday}: minute ticks incomplete")
+            return
+
+        rollup_room_daily(yesterday, from_running_totals=True)
+        DailyRollupStatus.mark(yesterday, 'room_logs')
+
+        if is_first_day_of_month(today):
+            rollup_room_monthly(yesterday.year, yesterday.month)
 
     except Exception as e:
         print(f"Error in aggregate_room_logs: {e}")
         raise
 
-def calculate_device_metrics(logs):
+def aggregate_device_logs():
     """
-    Calculate device metrics from 1-minute logs.
-    
-    Parameters:
-        logs: QuerySet of DeviceLog1Min entries
+    Aggregate device logs at 00:07 daily.
     
-    Returns:
-        Dictionary with metrics including total usage, average usage,
-        and separate metrics for periods when the device was on vs. off
+    Process:
+    1. Wait for yesterday's minute ticks to be committed; defer the run to retry_deferred_rollups if any are missing
+    2. Copy previous day's running device counters into daily status metrics for all devices
+    3. On first day of month, aggregate previous month's daily logs to monthly
     """
-    # Overall metrics
-    total_usage = logs.aggregate(models.Sum('energy_usage'))['energy_usage__sum'] or 0
-    usage_duration = logs.count() * 60 # Convert to seconds for consistent metrics
-    avg_usage_per_second = total_usage / usage_duration  # per second for whole day
-    
-    # Uptime metrics
-    uptime_logs = logs.filter(status=True)
-    uptime_count = uptime_logs.count()
-    uptime_seconds = uptime_count * 60  # Convert to seconds for consistent metrics
-    uptime_usage = uptime_logs.aggregate(models.Sum('energy_usage'))['energy_usage__sum'] or 0
-    avg_uptime_usage = uptime_usage / uptime_seconds if uptime_seconds > 0 else 0
-    
-    # Downtime metrics
-    downtime_logs = logs.filter(status=False)
-    downtime_count = downtime_logs.count()
-    downtime_seconds = downtime_count * 60  # Convert to seconds for consistent metrics
-    downtime_usage = downtime_logs.aggregate(models.Sum('energy_usage'))['energy_usage__sum'] or 0
-    avg_downtime_usage = downtime_usage / downtime_seconds if downtime_seconds > 0 else 0
-    
-    return {
-        'total_usage': total_usage,
-        'avg_usage_per_second': avg_usage_per_second,
-        'uptime': {
-            'duration': uptime_seconds,  # Reported in seconds for consistency
-            'total_usage': uptime_usage,
-            'avg_usage_per_second': avg_uptime_usage
-        },
-        'downtime': {
-            'duration': downtime_seconds,  # Reported in seconds for consistency
-            'total_usage': downtime_usage,
-            'avg_usage_per_second': avg_downtime_usage
-        },
-        'logs': [
-            {
-                'timestamp': log.created_at.isoformat(),
-                'status': log.status,
-                'energy_usage': log.energy_usage
-            } for log in logs
-        ]
-    }
+    try:
+        today = timezone.now().date()
+        yesterday = today - timedelta(days=1)
+
+        if not wait_for_day_ticks(yesterday):
+            logger.warning(f"Deferring device log rollup for {yesterday}: minute ticks incomplete")
+            return
+
+        rollup_device_daily(yesterday, from_running_totals=True)
+        DailyRollupStatus.mark(yesterday, 'device_logs')
+
+        if is_first_day_of_month(today):
+            rollup_device_monthly(yesterday.year, yesterday.month)
 
-def calculate_monthly_metrics(daily_logs):
+    except Exception as e:
+        print(f"Error in aggregate_device_logs: {e}")
+        raise
+
+# Daily and monthly rollup of each table confirmed in DailyRollupStatus
+DAILY_ROLLUPS = {
+    'energy_generation': (rollup_energy_generation_daily, rollup_energy_generation_monthly),
+    'room_logs': (rollup_room_daily, rollup_room_monthly),
+    'device_logs': (rollup_device_daily, rollup_device_monthly),
+}
+
+def retry_deferred_rollups():
     """
-    Calculate monthly metrics from daily logs.
+    Finish the daily rollups that were deferred or failed on earlier days.
+    Runs hourly at minute 45, away from the nightly rollups.
+    
+    Process:
+    1. Find past days with an unconfirmed rollup in DailyRollupStatus
+    2. Count each day's minute ticks again; late ticks may have been committed since
+    3. Roll up a day once it has every tick, or once it ended more than
+       ROLLUP_DEFER_HOURS ago: ticks missing by then are never written (the tick
+       only logs the current minute), so the day is rolled up from the minute logs
+       there are and keeps its missing_ticks count to mark it incomplete. Complete
+       days are copied from the running totals as at night; those of an incomplete
+       day are not trusted
+    4. Redo the monthly rollups of months that are already over
     
-    Parameters:
-        daily_logs: QuerySet of DeviceLogDaily entries
-        
     Returns:
-        Dictionary with daily summaries and monthly totals/averages
+        List of the days rolled up
     """
-    total_days = daily_logs.count()
-    if total_days == 0:
-        return {}
-        
-    total_usage = 0
-    total_uptime_usage = 0
-    total_downtime_usage = 0
-    daily_summaries = {}
-    
-    for log in daily_logs:
-        details = log.status_usage_details
-        total_usage += log.total_energy_usage
-        total_uptime_usage += details.get('uptime', {}).get('total_usage', 0)
-        total_downtime_usage += details.get('downtime', {}).get('total_usage', 0)
-        
-        daily_summaries[str(log.date)] = {
-            'total_usage': log.total_energy_usage,
-            'uptime': details.get('uptime', {}),
-            'downtime': details.get('downtime', {})
-        }
-    
-    return {
-        'daily_summaries': daily_summaries,
-        'monthly_totals': {
-            'total_usage': total_usage,
-            'uptime_usage': total_uptime_usage,
-            'downtime_usage': total_downtime_usage
-        },
-        'monthly_averages': {
-            'avg_daily_usage': total_usage / total_days,
-            'avg_daily_uptime_usage': total_uptime_usage / total_days,
-            'avg_daily_downtime_usage': total_downtime_usage / total_days
-        }
-    }
+    try:
+        now = timezone.now()
+        today = now.date()
+        defer_hours = getattr(settings, 'ROLLUP_DEFER_HOURS', 6)
+        finished = []
 
-def aggregate_device_logs():
+        for status in DailyRollupStatus.unconfirmed().filter(date__lt=today).order_by('date'):
+            day = status.date
+            missing_ticks = count_missing_ticks(day)
+            if missing_ticks and now < day_bounds(day)[1] + timedelta(hours=defer_hours):
+                continue
+            if missing_ticks:
+                logger.warning(f"Rolling up {day} with {missing_ticks} minute ticks missing")
+
+            month_over = (day.year, day.month) != (today.year, today.month)
+            for table, (rollup_daily, rollup_monthly) in DAILY_ROLLUPS.items():
+                if getattr(status, f'{table}_at') is not None:
+                    continue
+                rollup_daily(day, from_running_totals=not missing_ticks)
+                DailyRollupStatus.mark(day, table)
+                if month_over:
+                    rollup_monthly(day.year, day.month)
+            DailyRollupStatus.objects.filter(date=day).update(missing_ticks=missing_ticks)
+            finished.append(day)
+
+        return finished
+
+    except Exception as e:
+        print(f"Error in retry_deferred_rollups: {e}")
+        raise
+
+def prune_old_minute_logs():
     """
-    Aggregate device logs at 00:05 daily.
+    Enforce the retention policy on the 1-minute log tables.
+    Runs at 03:30 daily, well away from the midnight rollups.
     
-    Process:
-    1. Aggregate previous day's 1-minute logs to daily with detailed status metrics
-    2. On first day of month, aggregate previous month's daily logs to monthly
+    Deletes minute logs older than LOG_RETENTION_DAYS for days whose daily rollups
+    are confirmed, in small chunks so the minute tick is never blocked for long.
     """
-    time.sleep(30) # Delay to ensure all 1-minute logs are generated
-
     try:
-        with transaction.atomic():
-            today = timezone.now().date()
-            yesterday = today - timedelta(days=1)
-
-            # Step 1: Aggregate DeviceLog1Min to DeviceLogDaily
-            devices = Device.objects.all()
-            for device in devices:
-                # Get yesterday's logs
-                daily_logs = DeviceLog1Min.objects.filter(
-                    device=device,
-                    created_at__date=yesterday
-                ).order_by('created_at')
-                
-                if not daily_logs.exists():
-                    continue  # No logs to aggregate
-                else:
-                    metrics = calculate_device_metrics(daily_logs)
-                    
-                    DeviceLogDaily.objects.update_or_create(
-                        device=device,
-                        date=yesterday,
-                        defaults={
-                            'total_energy_usage': metrics['total_usage'],
-                            'status_usage_details': metrics
-                        }
-                    )
-
-            # Step 2: If first of month, aggregate to monthly
-            if is_first_day_of_month(today):
-                first_of_prev_month = yesterday.replace(day=1)
-                
-                for device in devices:
-                    monthly_logs = DeviceLogDaily.objects.filter(
-                        device=device,
-                        date__gte=first_of_prev_month,
-                        date__lte=yesterday
-                    ).order_by('date')
-                    
-                    if not monthly_logs.exists():
-                        continue  # No logs to aggregate
-                    else:
-                        monthly_metrics = calculate_monthly_metrics(monthly_logs)
-                        
-                        DeviceLogMonthly.objects.update_or_create(
-                            device=device,
-                            month=yesterday.month,
-                            year=yesterday.year,
-                            defaults={
-                                'total_energy_usage': monthly_metrics['monthly_totals']['total_usage'],
-                                'daily_summaries': monthly_metrics
-                            }
-                        )
-
+        report = prune_minute_logs()
+        logger.info(f"Pruned minute logs: {report}")
+        return report
     except Exception as e:
-        print(f"Error in aggregate_device_logs: {e}")
+        print(f"Error in prune_old_minute_logs: {e}")
         raise
 
 def aggregate_device_to_room_logs(current_minute=None):
     """
-    Aggregates 1-minute device logs (DeviceLog1Min) into a single 1-minute room log (RoomLog1Min)
-    for each room. This function is called immediately after generate_device_logs().
+    Rebuilds the 1-minute room logs (RoomLog1Min) for one minute from the device logs
+    (DeviceLog1Min) already stored for that minute.
+    
+    generate_minute_data() computes room logs in memory as it writes the device logs,
+    so this is only needed as a repair mode, e.g. after device logs for a tick were
+    corrected or the room logs for it are missing.
+    
+    The nightly rollups copy the day's running totals, so the energy usage of the
+    affected rooms' RoomRunningTotal and HomeRunningTotal is recomputed from the
+    day's room logs as well (see resync_usage_running_totals). Their on_minutes
+    counters are not stored in the room logs and stay as they are.
     
     Parameters:
-        current_minute: Timestamp to use for filtering logs. If not provided,
+        current_minute: Timestamp of the tick to rebuild. If not provided,
                         the function will determine it based on the current time.
                         
     Process:
-    1. Get all device logs with the exact timestamp
-    2. Group the logs by room and sum their energy usage
-    3. Create a room log for each room with the same timestamp
+    1. Sum the device logs with the exact timestamp per room in one GROUP BY query
+    2. Replace any existing room logs for that timestamp with the recomputed ones
+    3. Recompute the day's usage running totals of the affected rooms and their homes
+    4. Once committed, bump the 'minute_logs' version of cached responses and ETags
+    
+    Returns:
+        Number of room logs written
     """
     try:
         with transaction.atomic():
@@ -386,36 +391,34 @@ def aggregate_device_to_room_logs(current_minute=None):
                 now = timezone.now()
                 current_minute = now.replace(second=0, microsecond=0)
             
-            # Get device logs with the exact current_minute timestamp
-            current_device_logs = DeviceLog1Min.objects.filter(
-                created_at=current_minute
-            ).select_related('device__room')
-            
-            if not current_device_logs.exists():
-                return  # No logs to aggregate
-
-            # Group logs by room
-            room_energy_usage = {}
-            for dev_log in current_device_logs:
-                room = dev_log.device.room
-                if room is None:
-                    # Skip devices that are not assigned to a room
-                    continue
-                    
-                if room.id not in room_energy_usage:
-                    room_energy_usage[room.id] = {
-                        'room': room,
-                        'total_usage': 0.0
-                    }
-                room_energy_usage[room.id]['total_usage'] += dev_log.energy_usage
-
-            # Create room logs for each room (using the same timestamp)
-            for room_data in room_energy_usage.values():
-                RoomLog1Min.objects.create(
-                    room=room_data['room'],
-                    energy_usage=room_data['total_usage'],
+            # Group device logs with the exact timestamp by room,
+            # skipping devices that are not assigned to a room
+            room_energy_usage = DeviceLog1Min.objects.filter(
+                created_at=current_minute,
+                device__room__isnull=False
+            ).values('device__room_id').annotate(
+                total_usage=models.Sum('energy_usage')
+            ).order_by()
+
+            room_logs = [
+                RoomLog1Min(
+                    room_id=row['device__room_id'],
+                    energy_usage=row['total_usage'],
                     created_at=current_minute  # Use the same uniform timestamp
                 )
+                for row in room_energy_usage
+            ]
+
+            # Replace the tick's room logs so the repair can be run repeatedly
+            room_ids = set(RoomLog1Min.objects.filter(created_at=current_minute).values_list('room_id', flat=True))
+            room_ids.update(log.room_id for log in room_logs)
+            RoomLog1Min.objects.filter(created_at=current_minute).delete()
+            RoomLog1Min.objects.bulk_create(room_logs, batch_size=BULK_BATCH_SIZE)
+
+            resync_usage_running_totals(current_minute.date(), room_ids)
+            # The tick watermark does not move, so cached responses and ETags need a new version
+            transaction.on_commit(lambda: bump_version('minute_logs'))
+            return len(room_logs)
 
     except Exception as e:
         print(f"Error in aggregate_device_to_room_logs: {e}")
@@ -448,22 +451,14 @@ def calculate_realtime_energy_usage(room_id=None, device_id=None, hours=24):
     
     if room_id:
         # Calculate room-level energy usage
-        logs = RoomLog1Min.objects.filter(
-            room_id=room_id,
-            created_at__gte=start_time,
-            created_at__lte=end_time
-        )
+        logs = RoomLog1Min.objects.between(start_time, end_time).filter(room_id=room_id)
         result['total_usage'] = logs.aggregate(
             models.Sum('energy_usage')
         )['energy_usage__sum'] or 0
         
     elif device_id:
         # Calculate device-level energy usage
-        logs = DeviceLog1Min.objects.filter(
-            device_id=device_id,
-            created_at__gte=start_time,
-            created_at__lte=end_time
-        )
+        logs = DeviceLog1Min.objects.between(start_time, end_time).filter(device_id=device_id)
         result['total_usage'] = logs.aggregate(
             models.Sum('energy_usage')
         )['energy_usage__sum'] or 0
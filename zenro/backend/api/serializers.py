@@ -7,7 +7,7 @@ from .models import (
     User, SmartHome, SupportedDevice, Device, Room, DeviceLog1Min, 
     DeviceLogDaily, DeviceLogMonthly, RoomLog1Min, RoomLogDaily, 
     RoomLogMonthly, HomeIORoom, EnergyGeneration1Min, EnergyGenerationDaily, 
-    EnergyGenerationMonthly, UserProfile, RecoveryCode 
+    EnergyGenerationMonthly, UserProfile, RecoveryCode, RoomRunningTotal, HomeIOCommand, Scene
 )
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -181,10 +181,16 @@ class RoomSerializer(serializers.ModelSerializer):
                  'is_unlocked', 'home_io_room', 'home_io_room_name']
 
     def get_daily_usage(self, obj):
+        # RoomViewSet annotates today's usage; other callers fall back to one query
+        if hasattr(obj, 'today_usage'):
+            return obj.today_usage
+
+        # Today's usage so far is kept up to date by the minute tick
         today = timezone.now().date()
-        logs = RoomLog1Min.objects.filter(room=obj, created_at__date=today)
-        total_usage = logs.aggregate(models.Sum('energy_usage'))['energy_usage__sum'] or 0
-        return total_usage
+        total_usage = RoomRunningTotal.objects.filter(
+            room=obj, date=today
+        ).values_list('energy_usage', flat=True).first()
+        return total_usage or 0
 
 class RoomLog1MinSerializer(serializers.ModelSerializer):
     class Meta:
@@ -199,6 +205,10 @@ class HomeIORoomSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'zone', 'unlock_order', 'is_unlocked']
     
     def get_is_unlocked(self, obj):
+        # HomeIORoomViewSet annotates the flag for the requested home
+        if hasattr(obj, 'is_unlocked'):
+            return obj.is_unlocked
+
         # Check if this HomeIORoom is linked to any Room
         return Room.objects.filter(home_io_room=obj).exists()
 
@@ -247,6 +257,68 @@ class DeviceControlSerializer(serializers.Serializer):
             )
         return data
 
+class HomeIOCommandSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HomeIOCommand
+        fields = [
+            'id', 'device', 'status', 'set_state', 'set_analogue', 'attempts',
+            'error', 'created_at', 'sent_at'
+        ]
+
+class DeviceActionSerializer(serializers.Serializer):
+    """
+    One action of a batch control request or scene: a device or every device of
+    a room as target, and the status and/or analogue value to set.
+    """
+    device = serializers.IntegerField(required=False)
+    room = serializers.IntegerField(required=False)
+    status = serializers.BooleanField(required=False)
+    analogue_value = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        max_value=10
+    )
+    
+    def validate(self, data):
+        if ('device' in data) == ('room' in data):
+            raise serializers.ValidationError("Exactly one of device or room must be provided")
+        if 'status' not in data and 'analogue_value' not in data:
+            raise serializers.ValidationError("Either status or analogue_value must be provided")
+        return data
+
+class BatchControlSerializer(serializers.Serializer):
+    actions = DeviceActionSerializer(many=True, required=False)
+    scene = serializers.IntegerField(required=False)
+    
+    def validate(self, data):
+        """
+        Check that there is something to apply, within the size limit
+        """
+        if not data.get('actions') and 'scene' not in data:
+            raise serializers.ValidationError("Either actions or scene must be provided")
+        if len(data.get('actions', [])) > 500:
+            raise serializers.ValidationError("At most 500 actions per request")
+        return data
+
+class SceneSerializer(serializers.ModelSerializer):
+    actions = DeviceActionSerializer(many=True)
+    
+    class Meta:
+        model = Scene
+        fields = ['id', 'name', 'smart_home', 'actions', 'created_by', 'created_at']
+        read_only_fields = ['created_by', 'created_at']
+    
+    def validate_smart_home(self, smart_home):
+        """
+        Check that the user can control the scene's home
+        """
+        user = self.context['request'].user
+        if not SmartHome.objects.filter(
+            models.Q(creator=user) | models.Q(members=user), id=smart_home.id
+        ).exists():
+            raise serializers.ValidationError("You don't have access to this smart home")
+        return smart_home
+
 class JoinHomeSerializer(serializers.Serializer):
     join_password = serializers.CharField(required=True)
 
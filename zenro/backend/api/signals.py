@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from api.models import SmartHome, HomeIORoom, SupportedDevice, Room, Device, UserProfile, User
+from api.cache import bump_version
 
 @receiver(post_save, sender=SmartHome)
 def create_home_layout(sender, instance, created, **kwargs):
@@ -38,4 +39,29 @@ def create_user_profile(sender, instance, created, **kwargs):
     When a new User is created, this signal handler creates a UserProfile for them.
     """
     if created:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        UserProfile.objects.create(user=instance)
+
+# Signals to invalidate the cached HomeIO room catalogue (see HomeIORoomViewSet)
+@receiver([post_save, post_delete], sender=Room)
+def invalidate_room_unlock_status(sender, instance, **kwargs):
+    """
+    When a Room is saved or deleted, the unlock status its home (and the global
+    view across all homes) reports for its HomeIO room may have changed.
+    """
+    bump_version(f"homeio_rooms:{instance.smart_home_id}")
+    bump_version("homeio_rooms:all")
+
+@receiver([post_save, post_delete], sender=HomeIORoom)
+def invalidate_homeio_room_catalogue(sender, instance, **kwargs):
+    """
+    When a HomeIORoom is saved or deleted, the catalogue itself has changed for every home.
+    """
+    bump_version("homeio_rooms:catalogue")
+
+@receiver([post_save, post_delete], sender=SupportedDevice)
+def invalidate_supported_devices(sender, instance, **kwargs):
+    """
+    When a SupportedDevice is saved or deleted, the ETag of the supported device
+    endpoint must change (see SupportedDeviceViewSet).
+    """
+    bump_version("supported_devices")
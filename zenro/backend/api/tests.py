@@ -1,3 +1,1752 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import math
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest import mock
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from . import outbox
+from .live import LocalBroker, event_stream, format_event, tick_deltas
+from .device_control import (
+    apply_device_actions, RESULT_QUEUED, RESULT_SAVED, RESULT_UNCHANGED,
+    RESULT_UNSUPPORTED, RESULT_FORBIDDEN, RESULT_NOT_FOUND
+)
+from .cache import get_cache, cached_response, bump_version, data_version, set_watermark, get_stats
+from .downsampling import bucket_series, lttb
+from .packing import pack_series, unpack_series, SeriesTooLong
+from .home_io.home_io_services import HomeIOService, get_executor, DEVICE_DETAILS_RELATED
+from .home_io.circuit_breaker import (
+    CircuitBreaker, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN, shared_snapshot, homeio_unavailable
+)
+from .models import (
+    HomeIORoom, SupportedDevice, SmartHome, Room, Device, HomeIOCommand, MinuteTick,
+    DailyRollupStatus, RoomLogDaily, DeviceLogDaily, EnergyGenerationDaily, RoomRunningTotal,
+    DeviceLog1Min, DeviceLogMonthly, RoomLog1Min, HomeRunningTotal, Scene,
+    DeviceRunningTotal, EnergyGeneration1Min, RoomLogMonthly, EnergyGenerationMonthly
+)
+from .scheduled_scripts import (
+    generate_minute_data, aggregate_room_logs, aggregate_device_logs,
+    aggregate_energy_generation, retry_deferred_rollups, aggregate_device_to_room_logs
+)
+from .retention import prune_minute_logs, delete_in_chunks
+from .rollups import rollup_room_daily, rollup_room_monthly, rebuild_day, rebuild_month
 
-# Create your tests here.
+# Keep the tests away from the shared file cache of the development server
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+def create_layout(rooms=1, devices_per_room=2, device_type='lighting', consumption_rate=100):
+    """
+    HomeIO template rooms with their supported devices. Every SmartHome created
+    afterwards gets a copy of them (see signals.create_home_layout).
+    """
+    address = 0
+    for room_number in range(rooms):
+        home_io_room = HomeIORoom.objects.create(
+            name=f"Room {room_number}", zone=chr(ord('A') + room_number), unlock_order=room_number
+        )
+        for number in range(1, devices_per_room + 1):
+            address += 1
+            SupportedDevice.objects.create(
+                model_name=f"Device {room_number}.{number}", type=device_type, number=number,
+                home_io_room=home_io_room, address=address, data_type='bool',
+                memory_type='output', consumption_rate=consumption_rate
+            )
+
+def create_home(username='owner', **layout):
+    """A user and a smart home of their own, copied from a fresh template layout."""
+    if not HomeIORoom.objects.exists():
+        create_layout(**layout)
+    user = User.objects.create_user(username, password='password')
+    home = SmartHome.objects.create(name=f"{username}'s home", creator=user)
+    return user, home
+
+def filter_missing_first(real_filter):
+    """
+    A replacement for HomeIOCommand.objects.filter whose first call finds nothing,
+    as if another request created the pending command just after it looked.
+    """
+    calls = []
+    def fake_filter(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            return HomeIOCommand.objects.none()
+        return real_filter(*args, **kwargs)
+    return fake_filter
+
+def run_tick(minute):
+    """Run the minute tick as if the clock showed the given minute."""
+    with mock.patch('django.utils.timezone.now', return_value=minute):
+        return generate_minute_data()
+
+def record_ticks(minutes):
+    """Record minutes in the tick ledger without logging anything for them."""
+    MinuteTick.objects.bulk_create([MinuteTick(minute=minute) for minute in minutes])
+
+class FakeHomeIOService:
+    """Stands in for HomeIOService, answering every command with the given result."""
+    def __init__(self, result=True):
+        self.result = result
+        self.sent = []
+
+    def apply_many(self, commands):
+        commands = list(commands)
+        self.sent.extend((device.pk, kind) for device, kind in commands)
+        return [self.result] * len(commands)
+
+@override_settings(CACHES=TEST_CACHES, HOME_IO_COMMAND_MAX_ATTEMPTS=3, HOME_IO_COMMAND_CLAIM_TIMEOUT=60)
+class HomeIOOutboxTests(TestCase):
+    def setUp(self):
+        self.user, self.home = create_home()
+        self.device, self.other = Device.objects.order_by('id')[:2]
+
+    def test_saves_coalesce_into_one_pending_command(self):
+        for status in (True, False, True):
+            self.device.status = status
+            self.device.save()
+        self.device.analogue_value = 4
+        self.device.save()
+
+        command = HomeIOCommand.objects.get(device=self.device)
+        self.assertEqual(command.status, HomeIOCommand.STATUS_PENDING)
+        self.assertTrue(command.set_state)
+        self.assertTrue(command.set_analogue)
+        self.assertEqual(self.device.homeio_command, command)
+
+    def test_save_without_changes_queues_nothing(self):
+        self.device.name = 'Renamed'
+        self.device.save()
+        self.assertFalse(HomeIOCommand.objects.exists())
+
+    def test_enqueue_merges_into_command_created_concurrently(self):
+        existing = HomeIOCommand.objects.create(device=self.device, set_analogue=True)
+        real_filter = HomeIOCommand.objects.filter
+        with mock.patch.object(HomeIOCommand.objects, 'filter', side_effect=filter_missing_first(real_filter)):
+            command = outbox.enqueue_device_command(self.device, set_state=True)
+
+        self.assertEqual(command.pk, existing.pk)
+        command.refresh_from_db()
+        self.assertTrue(command.set_state)
+        self.assertTrue(command.set_analogue)
+        self.assertEqual(HomeIOCommand.objects.filter(device=self.device).count(), 1)
+
+    def test_bulk_enqueue_merges_into_commands_created_concurrently(self):
+        existing = HomeIOCommand.objects.create(device=self.device, set_analogue=True)
+        real_filter = HomeIOCommand.objects.filter
+        with mock.patch.object(HomeIOCommand.objects, 'filter', side_effect=filter_missing_first(real_filter)):
+            commands = outbox.enqueue_device_commands([
+                (self.device, True, False), (self.other, True, False)
+            ])
+
+        self.assertEqual(commands[self.device.pk].pk, existing.pk)
+        existing.refresh_from_db()
+        self.assertTrue(existing.set_state and existing.set_analogue)
+        self.assertEqual(HomeIOCommand.objects.filter(status=HomeIOCommand.STATUS_PENDING).count(), 2)
+
+    def test_bulk_enqueue_merges_into_pending_commands(self):
+        existing = HomeIOCommand.objects.create(device=self.device, set_state=True)
+        commands = outbox.enqueue_device_commands([
+            (self.device, False, True), (self.other, True, False)
+        ])
+
+        self.assertEqual(commands[self.device.pk].pk, existing.pk)
+        existing.refresh_from_db()
+        self.assertTrue(existing.set_state and existing.set_analogue)
+        self.assertEqual(HomeIOCommand.objects.count(), 2)
+
+    def test_pending_command_is_unique_per_device(self):
+        HomeIOCommand.objects.create(device=self.device)
+        with self.assertRaises(IntegrityError):
+            HomeIOCommand.objects.create(device=self.device)
+
+    def test_claim_never_claims_a_command_twice(self):
+        devices = list(Device.objects.all())
+        for device in devices:
+            HomeIOCommand.objects.create(device=device, set_state=True)
+        HomeIOCommand.objects.filter(device=devices[-1]).update(
+            available_at=timezone.now() + timedelta(minutes=1)
+        )
+
+        first = outbox.claim_commands(1)
+        second = outbox.claim_commands(10)
+        third = outbox.claim_commands(10)
+
+        claimed = [command.pk for command in first + second]
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(len(claimed), len(devices) - 1)
+        self.assertEqual(third, [])
+        self.assertTrue(all(command.status == HomeIOCommand.STATUS_SENDING for command in first + second))
+
+    def test_retry_backs_off_then_fails(self):
+        command = HomeIOCommand.objects.create(device=self.device, set_state=True)
+        for attempts, delay in ((1, 2), (2, 4)):
+            command.status, command.attempts = HomeIOCommand.STATUS_SENDING, attempts
+            command.save()
+            before = timezone.now()
+            outbox._retry_later(command, 'HomeIO did not accept the command')
+            command.refresh_from_db()
+            self.assertEqual(command.status, HomeIOCommand.STATUS_PENDING)
+            self.assertGreaterEqual(command.available_at, before + timedelta(seconds=delay))
+            self.assertLess(command.available_at, before + timedelta(seconds=delay + 1))
+
+        command.status, command.attempts = HomeIOCommand.STATUS_SENDING, 3
+        command.save()
+        outbox._retry_later(command, 'HomeIO did not accept the command')
+        command.refresh_from_db()
+        self.assertEqual(command.status, HomeIOCommand.STATUS_FAILED)
+        self.assertEqual(command.error, 'HomeIO did not accept the command')
+
+    def test_retry_is_merged_into_newer_pending_command(self):
+        sending = HomeIOCommand.objects.create(
+            device=self.device, set_state=True, status=HomeIOCommand.STATUS_SENDING, attempts=1
+        )
+        newer = HomeIOCommand.objects.create(device=self.device, set_analogue=True)
+
+        outbox._retry_later(sending, 'HomeIO did not accept the command')
+
+        sending.refresh_from_db()
+        newer.refresh_from_db()
+        self.assertEqual(sending.status, HomeIOCommand.STATUS_SUPERSEDED)
+        self.assertTrue(newer.set_state and newer.set_analogue)
+
+    def test_requeue_stale_commands(self):
+        now = timezone.now()
+        stale = HomeIOCommand.objects.create(
+            device=self.device, set_state=True, status=HomeIOCommand.STATUS_SENDING,
+            claimed_at=now - timedelta(seconds=120)
+        )
+        fresh = HomeIOCommand.objects.create(
+            device=self.other, set_state=True, status=HomeIOCommand.STATUS_SENDING, claimed_at=now
+        )
+
+        self.assertEqual(outbox.requeue_stale_commands(), 1)
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, HomeIOCommand.STATUS_PENDING)
+        self.assertEqual(stale.error, 'Worker stopped before sending')
+        self.assertEqual(fresh.status, HomeIOCommand.STATUS_SENDING)
+
+    def test_send_commands_records_outcomes(self):
+        HomeIOCommand.objects.create(device=self.device, set_state=True)
+        HomeIOCommand.objects.create(device=self.other, set_state=True)
+
+        self.assertEqual(outbox.send_commands(outbox.claim_commands(10), FakeHomeIOService(True)), (2, 0))
+        self.assertEqual(
+            set(HomeIOCommand.objects.values_list('status', 'attempts')), {(HomeIOCommand.STATUS_SENT, 1)}
+        )
+
+        HomeIOCommand.objects.create(device=self.device, set_state=True)
+        self.assertEqual(outbox.send_commands(outbox.claim_commands(10), FakeHomeIOService(False)), (0, 1))
+        retried = HomeIOCommand.objects.get(device=self.device, status=HomeIOCommand.STATUS_PENDING)
+        self.assertEqual(retried.attempts, 1)
+
+    def test_analogue_value_is_only_sent_to_devices_that_are_on(self):
+        HomeIOCommand.objects.create(device=self.device, set_analogue=True)
+        service = FakeHomeIOService()
+
+        outbox.send_commands(outbox.claim_commands(10), service)
+
+        self.assertEqual(service.sent, [])
+        self.assertEqual(HomeIOCommand.objects.get().status, HomeIOCommand.STATUS_SENT)
+
+@override_settings(CACHES=TEST_CACHES)
+class InvalidDateTests(TestCase):
+    def setUp(self):
+        self.user, self.home = create_home()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_invalid_dates_are_rejected_with_400(self):
+        for url in (
+            '/api/roomlogs1min/?date=foo',
+            '/api/devicelogs1min/?start_date=2024-13-01',
+            '/api/devicelogs1min/?end_date=2024-02-30',
+            '/api/energy-generation/?start_date=yesterday',
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('expected YYYY-MM-DD', response.json()['error'])
+
+    def test_valid_dates_are_accepted(self):
+        response = self.client.get('/api/roomlogs1min/?date=2024-02-29')
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_command_reports_invalid_dates(self):
+        for option in ('--from', '--to'):
+            with self.subTest(option=option), self.assertRaisesMessage(CommandError, "Invalid date 'foo'"):
+                call_command('export_logs', 'device', option, 'foo', stdout=StringIO())
+
+@override_settings(CACHES=TEST_CACHES)
+class MinuteTickTests(TestCase):
+    minute = datetime(2025, 3, 10, 12, 0)
+
+    def setUp(self):
+        self.user, self.home = create_home(rooms=2)
+        Device.objects.update(is_unlocked=True, status=True)
+        devices = list(Device.objects.order_by('id'))
+        self.off, self.locked = devices[0], devices[-1]
+        Device.objects.filter(pk=self.off.pk).update(status=False)
+        Device.objects.filter(pk=self.locked.pk).update(is_unlocked=False)
+        self.metered = Device.objects.exclude(pk=self.locked.pk)
+
+    def usage(self, **filters):
+        return sum(DeviceLog1Min.objects.filter(**filters).values_list('energy_usage', flat=True))
+
+    def test_tick_logs_every_metered_device_and_updates_totals(self):
+        report = run_tick(self.minute.replace(second=42))
+
+        self.assertEqual(report['device_logs'], self.metered.count())
+        self.assertEqual(
+            sorted(DeviceLog1Min.objects.filter(created_at=self.minute).values_list('device_id', flat=True)),
+            sorted(self.metered.values_list('id', flat=True))
+        )
+        self.assertFalse(DeviceLog1Min.objects.filter(device=self.locked).exists())
+        self.assertFalse(DeviceLog1Min.objects.get(device=self.off).status)
+        on_log = DeviceLog1Min.objects.filter(status=True).first()
+        self.assertAlmostEqual(on_log.energy_usage, 100 * 60 / 3600 / 1000)
+
+        for room in Room.objects.all():
+            room_log = RoomLog1Min.objects.get(room=room, created_at=self.minute)
+            self.assertAlmostEqual(room_log.energy_usage, self.usage(device__room=room))
+            running_total = RoomRunningTotal.objects.get(room=room, date=self.minute.date())
+            self.assertAlmostEqual(running_total.energy_usage, room_log.energy_usage)
+            self.assertEqual(running_total.on_minutes, self.metered.filter(room=room, status=True).count())
+
+        home_total = HomeRunningTotal.objects.get(home=self.home, date=self.minute.date())
+        self.assertAlmostEqual(home_total.energy_usage, self.usage())
+        self.assertEqual(home_total.on_minutes, self.metered.filter(status=True).count())
+        self.assertAlmostEqual(
+            home_total.energy_generation,
+            EnergyGeneration1Min.objects.get(home=self.home, created_at=self.minute).energy_generation
+        )
+        self.assertEqual(DeviceRunningTotal.objects.get(device=self.off).on_minutes, 0)
+
+        tick = MinuteTick.objects.get(minute=self.minute)
+        self.assertEqual(
+            (tick.device_logs, tick.room_logs, tick.generation_logs),
+            (self.metered.count(), Room.objects.count(), 1)
+        )
+
+    def test_repeated_tick_writes_nothing(self):
+        run_tick(self.minute)
+        home_total = HomeRunningTotal.objects.get(home=self.home).energy_usage
+
+        with self.assertRaises(IntegrityError), mock.patch('builtins.print'):
+            run_tick(self.minute + timedelta(seconds=30))
+
+        self.assertEqual(DeviceLog1Min.objects.count(), self.metered.count())
+        self.assertEqual(RoomLog1Min.objects.count(), Room.objects.count())
+        self.assertEqual(EnergyGeneration1Min.objects.count(), 1)
+        self.assertEqual(MinuteTick.objects.count(), 1)
+        self.assertAlmostEqual(HomeRunningTotal.objects.get(home=self.home).energy_usage, home_total)
+
+    def test_running_totals_add_up_across_ticks(self):
+        for minute in range(3):
+            run_tick(self.minute + timedelta(minutes=minute))
+
+        self.assertEqual(DeviceRunningTotal.objects.count(), self.metered.count())
+        for running_total in DeviceRunningTotal.objects.all():
+            self.assertEqual(running_total.minutes, 3)
+            self.assertAlmostEqual(running_total.energy_usage, self.usage(device=running_total.device_id))
+        self.assertAlmostEqual(HomeRunningTotal.objects.get(home=self.home).energy_usage, self.usage())
+        self.assertEqual(RoomLog1Min.objects.count(), 3 * Room.objects.count())
+
+@override_settings(CACHES=TEST_CACHES)
+class RollupUpsertTests(TestCase):
+    day = date(2025, 3, 10)
+
+    def setUp(self):
+        self.user, self.home = create_home(rooms=2)
+        Device.objects.update(is_unlocked=True, status=True)
+        for minute in range(3):
+            run_tick(datetime(2025, 3, 10, 12, minute))
+
+    def rollup_tables(self):
+        return {
+            model.__name__: sorted(model.objects.values_list(*fields))
+            for model, fields in (
+                (DeviceLogDaily, ('device_id', 'date', 'total_energy_usage')),
+                (RoomLogDaily, ('room_id', 'date', 'total_energy_usage')),
+                (EnergyGenerationDaily, ('home_id', 'date', 'total_energy_generation')),
+                (DeviceLogMonthly, ('device_id', 'year', 'month', 'total_energy_usage')),
+                (RoomLogMonthly, ('room_id', 'year', 'month', 'total_energy_usage')),
+                (EnergyGenerationMonthly, ('home_id', 'year', 'month', 'total_energy_generation')),
+            )
+        }
+
+    def test_rollups_run_twice_write_each_row_once(self):
+        rebuild_day(self.day)
+        rebuild_month(2025, 3)
+        first = self.rollup_tables()
+
+        rebuild_day(self.day)
+        rebuild_month(2025, 3)
+
+        self.assertEqual(self.rollup_tables(), first)
+        self.assertEqual(len(first['DeviceLogDaily']), Device.objects.count())
+        self.assertEqual(len(first['RoomLogMonthly']), Room.objects.count())
+        self.assertEqual(len(first['EnergyGenerationMonthly']), 1)
+
+    def test_rerun_updates_rows_in_place(self):
+        rebuild_day(self.day)
+        room_log = RoomLogDaily.objects.first()
+        run_tick(datetime(2025, 3, 10, 12, 3))
+
+        rollup_room_daily(self.day, from_running_totals=True)
+        rollup_room_monthly(2025, 3)
+
+        self.assertEqual(RoomLogDaily.objects.count(), Room.objects.count())
+        updated = RoomLogDaily.objects.get(pk=room_log.pk)
+        self.assertAlmostEqual(
+            updated.total_energy_usage,
+            sum(RoomLog1Min.objects.filter(room_id=room_log.room_id).values_list('energy_usage', flat=True))
+        )
+        self.assertAlmostEqual(
+            RoomLogMonthly.objects.get(room_id=room_log.room_id, year=2025, month=3).total_energy_usage,
+            updated.total_energy_usage
+        )
+
+@override_settings(CACHES=TEST_CACHES, ROLLUP_TICK_WAIT_SECONDS=0, ROLLUP_DEFER_HOURS=6)
+class DeferredRollupTests(TestCase):
+    day = date(2025, 3, 10)
+    start = datetime(2025, 3, 10)
+
+    def setUp(self):
+        self.user, self.home = create_home()
+        Device.objects.update(is_unlocked=True, status=True)
+        # Two real ticks, every other minute but midnight only in the ledger
+        run_tick(self.start + timedelta(minutes=1))
+        run_tick(self.start + timedelta(minutes=2))
+        record_ticks(self.start + timedelta(minutes=minute) for minute in range(3, 24 * 60))
+
+    def run_nightly(self, now):
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            aggregate_energy_generation()
+            aggregate_room_logs()
+            aggregate_device_logs()
+
+    def retry(self, now):
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            return retry_deferred_rollups()
+
+    def test_missing_tick_defers_rollup_until_retry(self):
+        self.run_nightly(datetime(2025, 3, 11, 0, 5))
+
+        self.assertFalse(RoomLogDaily.objects.exists())
+        status = DailyRollupStatus.objects.get(date=self.day)
+        self.assertEqual(status.missing_ticks, 1)
+        self.assertIsNone(status.room_logs_at)
+        self.assertEqual(list(DailyRollupStatus.unconfirmed()), [status])
+
+        # Still incomplete and within ROLLUP_DEFER_HOURS: left for a later retry
+        self.assertEqual(self.retry(datetime(2025, 3, 11, 0, 45)), [])
+
+        # The late tick is committed, so the next retry completes the day
+        record_ticks([self.start])
+        self.assertEqual(self.retry(datetime(2025, 3, 11, 1, 45)), [self.day])
+
+        status.refresh_from_db()
+        self.assertEqual(status.missing_ticks, 0)
+        self.assertTrue(all(getattr(status, f'{table}_at') for table in DailyRollupStatus.ROLLUP_TABLES))
+        self.assertEqual(RoomLogDaily.objects.count(), Room.objects.count())
+        self.assertEqual(DeviceLogDaily.objects.count(), Device.objects.count())
+        self.assertEqual(EnergyGenerationDaily.objects.count(), 1)
+        room_log = RoomLogDaily.objects.first()
+        self.assertAlmostEqual(
+            room_log.total_energy_usage,
+            RoomRunningTotal.objects.get(room_id=room_log.room_id, date=self.day).energy_usage
+        )
+        self.assertFalse(DailyRollupStatus.unconfirmed().exists())
+
+    def test_day_still_missing_ticks_is_rolled_up_as_incomplete(self):
+        self.run_nightly(datetime(2025, 3, 11, 0, 5))
+        # The counters of an incomplete day are not trusted; the minute logs are used
+        RoomRunningTotal.objects.update(energy_usage=0.0)
+        HomeRunningTotal.objects.update(energy_generation=0.0)
+
+        self.assertEqual(self.retry(datetime(2025, 3, 11, 6, 45)), [self.day])
+
+        for daily in RoomLogDaily.objects.all():
+            self.assertAlmostEqual(
+                daily.total_energy_usage,
+                sum(RoomLog1Min.objects.filter(room_id=daily.room_id).values_list('energy_usage', flat=True))
+            )
+            self.assertGreater(daily.total_energy_usage, 0)
+        self.assertAlmostEqual(
+            EnergyGenerationDaily.objects.get(home=self.home).total_energy_generation,
+            sum(EnergyGeneration1Min.objects.values_list('energy_generation', flat=True))
+        )
+        device_log = DeviceLogDaily.objects.get(device=Device.objects.first())
+        self.assertEqual(device_log.status_usage_details['uptime']['duration'], 2 * 60)
+
+        status = DailyRollupStatus.objects.get(date=self.day)
+        self.assertEqual(status.missing_ticks, 1)
+        self.assertIsNotNone(status.device_logs_at)
+        self.assertEqual(RoomLogDaily.objects.count(), Room.objects.count())
+
+    def test_complete_day_is_rolled_up_at_night(self):
+        record_ticks([self.start])
+        self.run_nightly(datetime(2025, 3, 11, 0, 5))
+
+        self.assertEqual(RoomLogDaily.objects.count(), Room.objects.count())
+        self.assertFalse(DailyRollupStatus.unconfirmed().exists())
+        self.assertEqual(self.retry(datetime(2025, 3, 11, 0, 45)), [])
+
+@override_settings(CACHES=TEST_CACHES)
+class RebuildRollupsTests(TestCase):
+    day = date(2025, 3, 10)
+
+    def setUp(self):
+        self.user, self.home = create_home()
+        self.roomless = Device.objects.create(
+            name='Spare plug', room=None, supported_device=SupportedDevice.objects.first()
+        )
+        Device.objects.update(is_unlocked=True, status=True)
+        for minute in range(3):
+            run_tick(datetime(2025, 3, 10, 12, minute))
+
+    def rebuild(self, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command(
+                'rebuild_rollups', '--from', str(self.day), '--to', str(self.day), '--workers', '1',
+                '--state-file', os.path.join(directory, 'state.json'), *args, stdout=StringIO()
+            )
+
+    def test_full_rebuild_includes_devices_without_a_room(self):
+        self.rebuild()
+
+        self.assertEqual(DeviceLogDaily.objects.count(), Device.objects.count())
+        daily = DeviceLogDaily.objects.get(device=self.roomless, date=self.day)
+        self.assertAlmostEqual(
+            daily.total_energy_usage,
+            sum(DeviceLog1Min.objects.filter(device=self.roomless).values_list('energy_usage', flat=True))
+        )
+        self.assertEqual(daily.status_usage_details['uptime']['duration'], 3 * 60)
+        self.assertTrue(DeviceLogMonthly.objects.filter(device=self.roomless, year=2025, month=3).exists())
+        self.assertEqual(RoomLogDaily.objects.count(), Room.objects.count())
+        self.assertFalse(DailyRollupStatus.unconfirmed().exists())
+
+    def test_rebuild_of_some_homes_leaves_devices_without_a_room_alone(self):
+        self.rebuild('--homes', str(self.home.pk))
+
+        self.assertFalse(DeviceLogDaily.objects.filter(device=self.roomless).exists())
+        self.assertEqual(DeviceLogDaily.objects.count(), Device.objects.count() - 1)
+
+@override_settings(CACHES=TEST_CACHES)
+class RoomLogRepairTests(TestCase):
+    minute = datetime(2025, 3, 10, 12, 0)
+
+    def setUp(self):
+        self.user, self.home = create_home(rooms=2)
+        Device.objects.update(is_unlocked=True, status=True)
+        run_tick(self.minute)
+        run_tick(self.minute + timedelta(minutes=1))
+
+    def room_total(self, room_id):
+        return RoomRunningTotal.objects.get(room_id=room_id, date=self.minute.date()).energy_usage
+
+    def test_repair_moves_running_totals_with_the_room_logs(self):
+        room_log = RoomLog1Min.objects.filter(created_at=self.minute).first()
+        room_before = self.room_total(room_log.room_id)
+        home_before = HomeRunningTotal.objects.get(home=self.home).energy_usage
+
+        # Correct one device log of the tick, then repair twice
+        device_log = DeviceLog1Min.objects.filter(
+            created_at=self.minute, device__room_id=room_log.room_id
+        ).first()
+        DeviceLog1Min.objects.filter(pk=device_log.pk).update(energy_usage=device_log.energy_usage + 1)
+        for _ in range(2):
+            self.assertEqual(aggregate_device_to_room_logs(self.minute), Room.objects.count())
+
+        self.assertAlmostEqual(
+            RoomLog1Min.objects.get(pk__isnull=False, room_id=room_log.room_id, created_at=self.minute).energy_usage,
+            room_log.energy_usage + 1
+        )
+        self.assertAlmostEqual(self.room_total(room_log.room_id), room_before + 1)
+        self.assertAlmostEqual(HomeRunningTotal.objects.get(home=self.home).energy_usage, home_before + 1)
+
+        # The nightly rollup copies the running totals, so it sees the repair
+        rollup_room_daily(self.minute.date(), from_running_totals=True)
+        for daily in RoomLogDaily.objects.all():
+            self.assertAlmostEqual(
+                daily.total_energy_usage,
+                sum(RoomLog1Min.objects.filter(room_id=daily.room_id).values_list('energy_usage', flat=True))
+            )
+
+    def test_repair_restores_missing_room_logs(self):
+        expected = self.room_total(Room.objects.first().pk)
+        RoomLog1Min.objects.filter(created_at=self.minute).delete()
+
+        aggregate_device_to_room_logs(self.minute)
+
+        self.assertEqual(RoomLog1Min.objects.filter(created_at=self.minute).count(), Room.objects.count())
+        # The totals already counted the minute, and the restored logs match them
+        self.assertAlmostEqual(self.room_total(Room.objects.first().pk), expected)
+
+@override_settings(CACHES=TEST_CACHES)
+class BatchControlTests(TestCase):
+    def setUp(self):
+        self.user, self.home = create_home(rooms=2, devices_per_room=5)
+        self.other_user, self.other_home = create_home('neighbour')
+        self.devices = list(Device.objects.filter(room__smart_home=self.home).order_by('id'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def results(self, actions):
+        report = apply_device_actions(self.user, actions)
+        return {item.get('device', item.get('room')): item for item in report['results']}
+
+    def test_devices_outside_the_users_homes_are_forbidden(self):
+        foreign = Device.objects.filter(room__smart_home=self.other_home).first()
+        results = self.results([
+            {'device': foreign.pk, 'status': True},
+            {'device': self.devices[0].pk, 'status': True},
+            {'device': 999999, 'status': True},
+            {'room': 999999, 'status': True},
+        ])
+
+        self.assertEqual(results[foreign.pk]['result'], RESULT_FORBIDDEN)
+        self.assertEqual(results[self.devices[0].pk]['result'], RESULT_QUEUED)
+        self.assertEqual(results[999999]['result'], RESULT_NOT_FOUND)
+        foreign.refresh_from_db()
+        self.assertFalse(foreign.status)
+        self.assertFalse(HomeIOCommand.objects.filter(device=foreign).exists())
+
+    def test_later_actions_win_for_the_same_device(self):
+        device = self.devices[0]
+        room_devices = [other for other in self.devices if other.room_id == device.room_id]
+        results = self.results([
+            {'room': device.room_id, 'status': True},
+            {'device': device.pk, 'status': False},
+        ])
+
+        self.assertEqual(results[device.pk]['result'], RESULT_UNCHANGED)
+        for other in room_devices[1:]:
+            self.assertEqual(results[other.pk]['result'], RESULT_QUEUED)
+        device.refresh_from_db()
+        self.assertFalse(device.status)
+
+    def test_analogue_value_of_device_without_one_is_unsupported(self):
+        device = self.devices[0]
+        SupportedDevice.objects.filter(pk=device.supported_device_id).update(type='shades')
+
+        self.assertEqual(self.results([{'device': device.pk, 'analogue_value': 3}])[device.pk]['result'], RESULT_UNSUPPORTED)
+
+        result = self.results([{'device': device.pk, 'status': True, 'analogue_value': 3}])[device.pk]
+        self.assertEqual(result['result'], RESULT_QUEUED)
+        device.refresh_from_db()
+        self.assertTrue(device.status)
+        self.assertEqual(device.analogue_value, 10)
+
+    def test_saved_without_command_when_nothing_to_send(self):
+        device, other = self.devices[:2]
+        results = self.results([
+            {'device': device.pk, 'analogue_value': 3},
+            {'device': other.pk, 'status': True, 'analogue_value': 3},
+        ])
+
+        # Dimming a device that is off is saved but not sent to HomeIO
+        self.assertEqual(results[device.pk]['result'], RESULT_SAVED)
+        self.assertIsNone(results[device.pk]['command_id'])
+        self.assertEqual(results[other.pk]['result'], RESULT_QUEUED)
+        command = HomeIOCommand.objects.get(pk=results[other.pk]['command_id'])
+        self.assertTrue(command.set_state and command.set_analogue)
+        device.refresh_from_db()
+        self.assertEqual(device.analogue_value, 3)
+        self.assertFalse(HomeIOCommand.objects.filter(device=device).exists())
+
+    def test_queries_do_not_grow_with_the_number_of_devices(self):
+        def count_queries(devices, status):
+            with CaptureQueriesContext(connection) as queries:
+                report = apply_device_actions(self.user, [
+                    {'device': device.pk, 'status': status} for device in devices
+                ])
+            self.assertEqual(report['summary'], {RESULT_QUEUED: len(devices)})
+            return len(queries)
+
+        # New commands for one device, then for all the others
+        self.assertEqual(count_queries(self.devices[:1], True), count_queries(self.devices[1:], True))
+        # Changes merged into the pending commands
+        self.assertEqual(count_queries(self.devices[:1], False), count_queries(self.devices[1:], False))
+
+    def test_batch_control_endpoint(self):
+        response = self.client.post('/api/devices/batch-control/', {
+            'actions': [{'device': self.devices[0].pk, 'status': True}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary'], {RESULT_QUEUED: 1})
+        self.assertEqual(self.client.post('/api/devices/batch-control/', {}, format='json').status_code, 400)
+
+    def test_scenes_are_limited_to_the_users_homes(self):
+        actions = [{'room': self.devices[0].room_id, 'status': True}]
+        response = self.client.post('/api/scenes/', {
+            'name': 'Evening', 'smart_home': self.home.pk, 'actions': actions
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        scene_id = response.json()['id']
+        self.assertEqual(Scene.objects.get(pk=scene_id).created_by, self.user)
+
+        response = self.client.post('/api/scenes/', {
+            'name': 'Evening', 'smart_home': self.other_home.pk, 'actions': actions
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        neighbour = APIClient()
+        neighbour.force_authenticate(self.other_user)
+        self.assertEqual(neighbour.get('/api/scenes/').json(), [])
+        self.assertEqual(
+            neighbour.post('/api/devices/batch-control/', {'scene': scene_id}, format='json').status_code, 404
+        )
+
+    def test_running_a_scene(self):
+        scene = Scene.objects.create(
+            name='Evening', smart_home=self.home, created_by=self.user,
+            actions=[{'room': self.devices[0].room_id, 'status': True}]
+        )
+        room_devices = Device.objects.filter(room_id=self.devices[0].room_id)
+
+        response = self.client.post('/api/devices/batch-control/', {
+            'scene': scene.pk, 'actions': [{'device': room_devices[0].pk, 'status': False}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary'], {
+            RESULT_QUEUED: room_devices.count() - 1, RESULT_UNCHANGED: 1
+        })
+        self.assertEqual(room_devices.filter(status=True).count(), room_devices.count() - 1)
+
+    def test_changes_are_queued_while_homeio_is_unavailable(self):
+        device, other = self.devices[:2]
+        with mock.patch('api.views.homeio_unavailable', return_value=5):
+            response = self.client.post(f'/api/devices/{device.pk}/control/', {'status': True}, format='json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['homeio'], {'state': STATE_OPEN, 'retry_in': 5})
+            self.assertTrue(HomeIOCommand.objects.filter(pk=response.json()['command_id'], device=device).exists())
+
+            response = self.client.post('/api/devices/batch-control/', {
+                'actions': [{'device': other.pk, 'status': True}]
+            }, format='json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['summary'], {RESULT_QUEUED: 1})
+            self.assertEqual(response.json()['homeio'], {'state': STATE_OPEN, 'retry_in': 5})
+
+        other.refresh_from_db()
+        self.assertTrue(other.status)
+        self.assertTrue(HomeIOCommand.objects.filter(device=other).exists())
+
+    def test_homeio_state_is_null_while_available(self):
+        device = self.devices[0]
+        response = self.client.post(f'/api/devices/{device.pk}/control/', {'status': True}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(response.json()['homeio'])
+
+        # Nothing to send, so nothing is queued
+        response = self.client.post(f'/api/devices/{device.pk}/control/', {'status': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['command_id'])
+
+        response = self.client.post('/api/devices/batch-control/', {
+            'actions': [{'device': self.devices[1].pk, 'status': True}]
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['homeio'])
+
+class FakeClock:
+    """A monotonic clock moved by hand."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@override_settings(CACHES=TEST_CACHES)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            window=10, min_requests=4, failure_rate=0.5, open_seconds=5, max_open_seconds=15, clock=self.clock
+        )
+        get_cache().clear()
+
+    def record_failures(self, times=1):
+        for _ in range(times):
+            self.breaker.record_failure(self.breaker.allow_request(), 0.1)
+
+    def record_successes(self, times=1):
+        for _ in range(times):
+            self.breaker.record_success(self.breaker.allow_request(), 0.01)
+
+    def test_opens_once_enough_requests_fail(self):
+        self.record_failures(3)
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.record_failures()
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        self.assertIsNone(self.breaker.allow_request())
+
+    def test_stays_closed_below_the_failure_rate(self):
+        self.record_successes(6)
+        self.record_failures(4)
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.record_failures()
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+
+    def test_half_open_lets_a_single_probe_through(self):
+        self.record_failures(4)
+        self.clock.now += 5
+        self.assertEqual(self.breaker.state, STATE_HALF_OPEN)
+
+        probe = self.breaker.allow_request()
+        self.assertIsNotNone(probe)
+        self.assertIsNone(self.breaker.allow_request())
+
+        self.breaker.record_success(probe, 0.01)
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.assertIsNotNone(self.breaker.allow_request())
+
+    def test_late_results_do_not_decide_the_probe(self):
+        late = self.breaker.allow_request()
+        self.record_failures(4)
+        self.clock.now += 5
+        probe = self.breaker.allow_request()
+
+        # Sent while the breaker was still closed; neither closes nor reopens it
+        self.breaker.record_success(late, 0.01)
+        self.assertEqual(self.breaker.state, STATE_HALF_OPEN)
+        self.breaker.record_failure(late, 0.01)
+        self.assertEqual(self.breaker.state, STATE_HALF_OPEN)
+        self.assertIsNone(self.breaker.allow_request())
+
+        self.breaker.record_failure(probe, 0.1)
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+
+    def test_failed_probes_double_the_backoff_up_to_the_maximum(self):
+        self.record_failures(4)
+        for open_for in (10, 15, 15):
+            self.clock.now += self.breaker.snapshot()['retry_in']
+            self.breaker.record_failure(self.breaker.allow_request(), 0.1)
+            self.assertEqual(self.breaker.snapshot()['retry_in'], open_for)
+            self.clock.now += open_for - 0.1
+            self.assertEqual(self.breaker.state, STATE_OPEN)
+            self.clock.now += 0.1
+
+        # A successful probe closes the breaker and resets the backoff
+        self.breaker.record_success(self.breaker.allow_request(), 0.01)
+        self.record_failures(4)
+        self.assertEqual(self.breaker.snapshot()['retry_in'], 5)
+
+    def test_snapshot_reports_latency_percentiles(self):
+        for latency in range(1, 11):
+            self.breaker.record_success(self.breaker.allow_request(), latency / 1000)
+
+        snapshot = self.breaker.snapshot()
+        self.assertEqual(snapshot['latency_ms'], {'p50': 5.0, 'p95': 10.0, 'p99': 10.0})
+        self.assertEqual(snapshot['failure_rate'], 0.0)
+        self.assertEqual(snapshot['requests'], 10)
+
+    def test_shared_snapshot_decays_to_half_open(self):
+        self.assertIsNone(shared_snapshot())
+        published = datetime(2025, 3, 10, 12, 0)
+        with mock.patch('django.utils.timezone.now', return_value=published):
+            self.record_failures(4)
+
+        for seconds, state, retry_in, unavailable in (
+            (0, STATE_OPEN, 5, 5), (2.5, STATE_OPEN, 2.5, 3), (5, STATE_HALF_OPEN, 0, None)
+        ):
+            with mock.patch('django.utils.timezone.now', return_value=published + timedelta(seconds=seconds)):
+                snapshot = shared_snapshot()
+                self.assertEqual((snapshot['state'], snapshot['retry_in']), (state, retry_in))
+                self.assertEqual(homeio_unavailable(), unavailable)
+
+@override_settings(CACHES=TEST_CACHES)
+class LogCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user, self.home = create_home(devices_per_room=4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Four rows share every minute, so pages end in the middle of a minute
+        DeviceLog1Min.objects.bulk_create([
+            DeviceLog1Min(device=device, status=True, energy_usage=0.1, created_at=datetime(2025, 3, 10, 12, minute))
+            for minute in range(3) for device in Device.objects.order_by('id')
+        ])
+
+    def walk(self, order, page_size=5):
+        ids, url = [], f'/api/devicelogs1min/?order={order}&page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), page_size)
+            ids.extend(row['id'] for row in page['results'])
+            url = page['next']
+        return ids
+
+    def test_walk_has_no_duplicates_or_gaps_when_created_at_ties(self):
+        ascending = list(DeviceLog1Min.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        for page_size in (1, 3, 5, 12, 50):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk('asc', page_size), ascending)
+                self.assertEqual(self.walk('desc', page_size), ascending[::-1])
+
+    def test_newest_first_by_default(self):
+        results = self.client.get('/api/devicelogs1min/?page_size=2').json()['results']
+        newest = DeviceLog1Min.objects.order_by('-created_at', '-id')[:2]
+        self.assertEqual([row['id'] for row in results], [log.pk for log in newest])
+
+    def test_last_page_has_no_next_cursor(self):
+        page = self.client.get('/api/devicelogs1min/?page_size=12').json()
+        self.assertEqual(len(page['results']), 12)
+        self.assertIsNone(page['next'])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_invalid_cursor_returns_404(self):
+        for cursor in ('not-a-cursor', 'bm90IGEgY3Vyc29y', 'MjAyNS0xMy0wMXwx'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/api/devicelogs1min/?cursor={cursor}').status_code, 404)
+
+class LttbTests(SimpleTestCase):
+    def test_keeps_first_and_last_and_exactly_threshold_points(self):
+        xs = list(range(1000))
+        ys = [(x * 37) % 101 for x in xs]
+        for threshold in (3, 10, 99, 500, 999):
+            with self.subTest(threshold=threshold):
+                keep = lttb(xs, ys, threshold)
+                self.assertEqual(len(keep), threshold)
+                self.assertEqual(keep[0], 0)
+                self.assertEqual(keep[-1], len(xs) - 1)
+                self.assertEqual(keep, sorted(set(keep)))
+
+    def test_keeps_a_spike(self):
+        ys = [1.0] * 200
+        ys[123] = 50.0
+        self.assertIn(123, lttb(list(range(200)), ys, 10))
+
+    def test_short_series_are_returned_whole(self):
+        self.assertEqual(lttb([0, 1, 2], [5, 6, 7], 10), [0, 1, 2])
+        self.assertEqual(lttb(list(range(5)), [0] * 5, 2), list(range(5)))
+
+@override_settings(CACHES=TEST_CACHES)
+class BucketSeriesTests(TestCase):
+    def setUp(self):
+        self.user, self.home = create_home(devices_per_room=1)
+        self.device = Device.objects.get()
+        # One row a minute from 12:50 to 13:19, worth its minute of the hour
+        start = datetime(2025, 3, 10, 12, 50)
+        DeviceLog1Min.objects.bulk_create([
+            DeviceLog1Min(
+                device=self.device, status=True, created_at=start + timedelta(minutes=offset),
+                energy_usage=float((start + timedelta(minutes=offset)).minute)
+            )
+            for offset in range(30)
+        ])
+
+    def series(self, bucket):
+        return bucket_series(DeviceLog1Min.objects.filter(device=self.device), 'energy_usage', bucket)
+
+    def test_five_minute_slots(self):
+        points = self.series('5m')
+        self.assertEqual(
+            [point['start'] for point in points],
+            [datetime(2025, 3, 10, 12, 50) + timedelta(minutes=5 * n) for n in range(6)]
+        )
+        self.assertTrue(all(point['count'] == 5 for point in points))
+        self.assertEqual(points[0]['total'], 50 + 51 + 52 + 53 + 54)
+        self.assertEqual((points[2]['min'], points[2]['peak']), (0, 4))
+
+    def test_fifteen_minute_slots_across_the_hour(self):
+        points = self.series('15m')
+        self.assertEqual(
+            [(point['start'], point['count']) for point in points],
+            [
+                (datetime(2025, 3, 10, 12, 45), 10),
+                (datetime(2025, 3, 10, 13, 0), 15),
+                (datetime(2025, 3, 10, 13, 15), 5),
+            ]
+        )
+        self.assertEqual(points[1]['total'], sum(range(15)))
+        self.assertAlmostEqual(points[0]['avg'], sum(range(50, 60)) / 10)
+
+    def test_one_point_per_minute_without_bucket(self):
+        self.assertEqual(len(self.series(None)), 30)
+
+    def test_series_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/api/devicelogs1min/?device={self.device.pk}&bucket=15m&max_points=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['points']), 3)
+        self.assertEqual(response.json()['total'], sum(range(50, 60)) + sum(range(20)))
+        self.assertEqual(client.get('/api/devicelogs1min/?bucket=7m').status_code, 400)
+
+class PackedSeriesTests(SimpleTestCase):
+    start = datetime(2025, 3, 10, 12, 0)
+
+    def minute(self, offset):
+        return self.start + timedelta(minutes=offset)
+
+    def test_round_trip_with_gaps_and_statuses(self):
+        data = pack_series([
+            (self.minute(0), 0.5, True),
+            (self.minute(1), 1.25, False),
+            (self.minute(3), 2.0, True),
+            (self.minute(9), 0.0, True),
+        ], 60, with_status=True)
+
+        start, step, values, statuses = unpack_series(data)
+        self.assertEqual(datetime.utcfromtimestamp(start), self.start)
+        self.assertEqual(step, 60)
+        self.assertEqual(len(values), 10)
+        self.assertEqual([values[i] for i in (0, 1, 3, 9)], [0.5, 1.25, 2.0, 0.0])
+        self.assertTrue(all(math.isnan(values[i]) for i in (2, 4, 5, 6, 7, 8)))
+        self.assertEqual(statuses, [True, False, False, True, False, False, False, False, False, True])
+        self.assertEqual(len(data), 24 + 4 * 10 + 2)
+
+    def test_rows_sharing_a_step_are_merged(self):
+        data = pack_series([
+            (self.minute(0), 0.5, False),
+            (self.minute(0), 0.25, True),
+            (self.minute(1), 1.0, False),
+            (self.minute(1), 1.0, False),
+        ], 60, with_status=True)
+
+        _, _, values, statuses = unpack_series(data)
+        self.assertEqual(values, [0.75, 2.0])
+        self.assertEqual(statuses, [True, False])
+
+    def test_daily_series_of_dates_without_statuses(self):
+        data = pack_series([(date(2025, 3, 1), 4.5), (date(2025, 3, 3), 1.5)], 86400)
+
+        start, step, values, statuses = unpack_series(data)
+        self.assertEqual(datetime.utcfromtimestamp(start), datetime(2025, 3, 1))
+        self.assertEqual((step, values[0], values[2], statuses), (86400, 4.5, 1.5, None))
+        self.assertTrue(math.isnan(values[1]))
+
+    def test_empty_series(self):
+        self.assertEqual(unpack_series(pack_series([], 60)), (0, 60, [], None))
+
+    def test_too_long_and_invalid_series_are_rejected(self):
+        with self.assertRaises(SeriesTooLong):
+            pack_series([(self.minute(0), 1.0), (self.minute(10), 1.0)], 60, max_values=10)
+        with self.assertRaises(ValueError):
+            unpack_series(b'JSON' + pack_series([], 60)[4:])
+
+@override_settings(CACHES=TEST_CACHES)
+class PackedSeriesEndpointTests(TestCase):
+    def test_minute_logs_as_packed_series(self):
+        user, home = create_home(devices_per_room=2)
+        DeviceLog1Min.objects.bulk_create([
+            DeviceLog1Min(device=device, status=on, energy_usage=0.5, created_at=datetime(2025, 3, 10, 12, minute))
+            for minute in range(3) for device, on in zip(Device.objects.order_by('id'), (True, False))
+        ])
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get('/api/devicelogs1min/?format=bin')
+
+        self.assertEqual(response.status_code, 200)
+        start, step, values, statuses = unpack_series(response.content)
+        self.assertEqual(datetime.utcfromtimestamp(start), datetime(2025, 3, 10, 12, 0))
+        self.assertEqual((step, values, statuses), (60, [1.0, 1.0, 1.0], [True, True, True]))
+
+@override_settings(CACHES=TEST_CACHES)
+class ExportErrorTests(TestCase):
+    def setUp(self):
+        self.user, self.home = create_home()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertJSONError(self, response, status_code):
+        self.assertEqual(response.status_code, status_code)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('error', response.json())
+
+    def test_unknown_export_is_a_json_error(self):
+        for export_format in ('csv', 'ndjson'):
+            self.assertJSONError(self.client.get(f'/api/exports/heating/?format={export_format}'), 404)
+
+    def test_invalid_parameters_are_json_errors(self):
+        for export_format in ('csv', 'ndjson'):
+            response = self.client.get(f'/api/exports/device/?format={export_format}&start_date=2025-13-01')
+            self.assertJSONError(response, 400)
+        self.assertJSONError(self.client.get('/api/exports/room/?format=ndjson&ids=1,kitchen'), 400)
+
+    def test_export_still_streams_csv(self):
+        response = self.client.get('/api/exports/device/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+
+    @override_settings(PACKED_SERIES_MAX_VALUES=2)
+    def test_packed_series_error_is_json(self):
+        Device.objects.update(is_unlocked=True)
+        for minute in (0, 5):
+            run_tick(datetime(2025, 3, 10, 12, minute))
+
+        response = self.client.get('/api/devicelogs1min/?format=bin')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+@override_settings(CACHES=TEST_CACHES)
+class HomeIORoomCatalogueTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user, self.home = create_home(rooms=2)
+        self.other_user, self.other_home = create_home('other')
+        self.client = APIClient()
+
+    def unlocked(self, **params):
+        response = self.client.get('/api/homeio-rooms/', params)
+        self.assertEqual(response.status_code, 200)
+        return [room['is_unlocked'] for room in response.json()]
+
+    def unlock(self, home, zone):
+        room = Room.objects.get(smart_home=home, home_io_room__zone=zone)
+        room.is_unlocked = True
+        room.save()
+
+    def test_unlock_status_is_reported_per_home(self):
+        self.unlock(self.other_home, 'B')
+
+        self.assertEqual(self.unlocked(smart_home=self.home.pk), [False, False])
+        self.assertEqual(self.unlocked(smart_home=self.other_home.pk), [False, True])
+        # Without a home, any home's room for the layout room counts
+        self.assertEqual(self.unlocked(), [True, True])
+
+    def test_list_is_cached_per_home_until_a_room_changes(self):
+        self.unlocked(smart_home=self.home.pk)
+        self.unlocked(smart_home=self.other_home.pk)
+
+        # Only the home lookup runs on a hit
+        with self.assertNumQueries(1):
+            self.assertEqual(self.unlocked(smart_home=self.home.pk), [False, False])
+
+        self.unlock(self.home, 'A')
+
+        self.assertEqual(self.unlocked(smart_home=self.home.pk), [True, False])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.unlocked(smart_home=self.other_home.pk), [False, False])
+
+    def test_unknown_home_is_refused_without_touching_the_cache(self):
+        for value in ('abc', '9999'):
+            with self.subTest(smart_home=value):
+                response = self.client.get('/api/homeio-rooms/', {'smart_home': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIsNone(get_cache().get(f'version:homeio_rooms:{value}'))
+        self.assertEqual(get_cache().get('stats:homeio_rooms:misses'), None)
+
+@override_settings(CACHES=TEST_CACHES)
+class RunningTotalBackfillTests(TestCase):
+    minute = datetime(2025, 3, 10, 12, 0)
+
+    def setUp(self):
+        self.user, self.home = create_home(rooms=2)
+        self.roomless = Device.objects.create(
+            name='Spare plug', room=None, supported_device=SupportedDevice.objects.first()
+        )
+        Device.objects.update(is_unlocked=True, status=True)
+        Device.objects.filter(pk=Device.objects.order_by('id').first().pk).update(status=False)
+        run_tick(self.minute - timedelta(days=1))
+        for minute in range(3):
+            run_tick(self.minute + timedelta(minutes=minute))
+
+    def counters(self):
+        return {
+            model.__name__: sorted(model.objects.values_list(*fields))
+            for model, fields in (
+                (DeviceRunningTotal, ('device_id', 'date', 'energy_usage', 'on_energy_usage', 'minutes', 'on_minutes')),
+                (RoomRunningTotal, ('room_id', 'date', 'energy_usage', 'on_minutes')),
+                (HomeRunningTotal, ('home_id', 'date', 'energy_usage', 'energy_generation', 'on_minutes')),
+            )
+        }
+
+    def backfill(self):
+        migration = importlib.import_module('api.migrations.0023_backfill_running_totals')
+        with mock.patch('django.utils.timezone.now', return_value=self.minute + timedelta(minutes=5)):
+            migration.backfill_running_totals(apps, None)
+
+    def assertCountersEqual(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for name in first:
+            self.assertEqual(len(first[name]), len(second[name]), name)
+            for row, expected in zip(first[name], second[name]):
+                self.assertEqual(row[:2], expected[:2])
+                for value, expected_value in zip(row[2:], expected[2:]):
+                    self.assertAlmostEqual(value, expected_value)
+
+    def test_backfill_recomputes_the_counters_of_the_minute_logs(self):
+        expected = self.counters()
+        for model in (DeviceRunningTotal, RoomRunningTotal, HomeRunningTotal):
+            model.objects.all().delete()
+
+        self.backfill()
+
+        self.assertCountersEqual(self.counters(), expected)
+
+    def test_backfill_overwrites_counters_the_tick_already_wrote(self):
+        expected = self.counters()
+        RoomRunningTotal.objects.update(energy_usage=0.0)
+
+        self.backfill()
+        self.backfill()
+
+        self.assertCountersEqual(self.counters(), expected)
+
+@override_settings(CACHES=TEST_CACHES)
+class RoomListQueryTests(TestCase):
+    minute = datetime(2025, 3, 10, 12, 0)
+
+    def setUp(self):
+        self.user, self.home = create_home(rooms=3, devices_per_room=3)
+        Device.objects.update(is_unlocked=True, status=True)
+        run_tick(self.minute)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_rooms(self, queries, **params):
+        with mock.patch('django.utils.timezone.now', return_value=self.minute), self.assertNumQueries(queries):
+            response = self.client.get('/api/rooms/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_room_list_runs_a_fixed_number_of_queries(self):
+        # Rooms with their names and usage, then their devices
+        rooms = self.list_rooms(2)
+        self.assertEqual(len(rooms), 3)
+        # Home access check, rooms, devices
+        self.list_rooms(3, smart_home=self.home.pk)
+
+        # More rooms and devices cost no more queries
+        extra = Room.objects.create(name='Annex', smart_home=self.home, home_io_room=HomeIORoom.objects.first())
+        for number in range(3):
+            Device.objects.create(name=f'Lamp {number}', room=extra, supported_device=SupportedDevice.objects.first())
+        self.assertEqual(len(self.list_rooms(3, smart_home=self.home.pk)), 4)
+
+        room = rooms[0]
+        self.assertEqual(room['smart_home_name'], self.home.name)
+        self.assertEqual(room['home_io_room_name'], Room.objects.get(pk=room['id']).home_io_room.name)
+        self.assertEqual(len(room['devices']), 3)
+        self.assertAlmostEqual(
+            room['daily_usage'],
+            RoomRunningTotal.objects.get(room_id=room['id'], date=self.minute.date()).energy_usage
+        )
+
+@override_settings(CACHES=TEST_CACHES, LOG_RETENTION_DAYS=30, LOG_PRUNE_PAUSE_SECONDS=0)
+class MinuteLogETagTests(TestCase):
+    minute = datetime(2025, 3, 10, 12, 0)
+
+    def setUp(self):
+        get_cache().clear()
+        self.user, self.home = create_home()
+        Device.objects.update(is_unlocked=True, status=True)
+        self.tick(self.minute)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tick(self, minute):
+        with self.captureOnCommitCallbacks(execute=True):
+            run_tick(minute)
+
+    def get(self, etag=None, url='/api/roomlogs1min/'):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def assertChanged(self, etag):
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_unchanged_logs_are_answered_with_304(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.get(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        # Another query string is another response
+        response = self.client.get('/api/roomlogs1min/?date=2025-03-10', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_tick_changes_the_etag(self):
+        etag = self.get()['ETag']
+        self.tick(self.minute + timedelta(minutes=1))
+        self.assertChanged(etag)
+
+    def test_room_log_repair_changes_the_etag(self):
+        etag = self.get()['ETag']
+        DeviceLog1Min.objects.update(energy_usage=1.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            aggregate_device_to_room_logs(self.minute)
+
+        etag = self.assertChanged(etag)
+        self.assertEqual(self.get(etag).status_code, 304)
+
+    def test_retention_purge_changes_the_etag(self):
+        for table in DailyRollupStatus.ROLLUP_TABLES:
+            DailyRollupStatus.mark(self.minute.date(), table)
+        etag = self.get()['ETag']
+
+        report = prune_minute_logs(today=self.minute.date() + timedelta(days=31))
+
+        self.assertEqual(report['RoomLog1Min'], Room.objects.count())
+        self.assertChanged(etag)
+
+    def test_purge_without_deletions_keeps_the_etag(self):
+        etag = self.get()['ETag']
+        prune_minute_logs(today=self.minute.date() + timedelta(days=1))
+        self.assertEqual(self.get(etag).status_code, 304)
+
+@override_settings(CACHES=TEST_CACHES, LOG_RETENTION_DAYS=30, LOG_PRUNE_CHUNK_SIZE=2, LOG_PRUNE_PAUSE_SECONDS=0)
+class RetentionTests(TestCase):
+    confirmed_day = date(2025, 1, 1)
+    deferred_day = date(2025, 1, 2)
+
+    def setUp(self):
+        self.user, self.home = create_home()
+        Device.objects.update(is_unlocked=True, status=True)
+        for day, ticks in ((self.confirmed_day, 5), (self.deferred_day, 2)):
+            for minute in range(ticks):
+                run_tick(datetime.combine(day, datetime.min.time()) + timedelta(hours=12, minutes=minute))
+        for table in DailyRollupStatus.ROLLUP_TABLES:
+            DailyRollupStatus.mark(self.confirmed_day, table)
+        # Only the room rollup of the second day is done; the others were deferred
+        DailyRollupStatus.mark(self.deferred_day, 'room_logs')
+        # A day inside the retention window is never touched
+        run_tick(datetime(2025, 2, 5, 12, 0))
+
+    def prune(self, kept=True):
+        if not kept:
+            return prune_minute_logs(today=date(2025, 2, 5))
+        with self.assertLogs('api.retention', 'WARNING') as logs:
+            report = prune_minute_logs(today=date(2025, 2, 5))
+        self.assertIn('Keeping DeviceLog1Min rows for 2025-01-02', logs.output[0])
+        return report
+
+    def test_only_confirmed_rollups_release_their_sources(self):
+        report = self.prune()
+
+        self.assertEqual(report['DeviceLog1Min'], 5 * Device.objects.count())
+        self.assertEqual(report['RoomLog1Min'], 7 * Room.objects.count())
+        self.assertEqual(report['MinuteTick'], 5)
+        self.assertEqual(report['RoomRunningTotal'], 2 * Room.objects.count())
+        self.assertEqual(report['DeviceRunningTotal'], Device.objects.count())
+        self.assertEqual(report['HomeRunningTotal'], 1)
+
+        self.assertFalse(MinuteTick.objects.filter(minute__date=self.confirmed_day).exists())
+        for model in (DeviceRunningTotal, RoomRunningTotal, HomeRunningTotal):
+            self.assertFalse(model.objects.filter(date=self.confirmed_day).exists())
+
+        # The deferred rollups can still be run from the minute logs, totals and ticks
+        self.assertEqual(MinuteTick.objects.filter(minute__date=self.deferred_day).count(), 2)
+        self.assertEqual(DeviceLog1Min.objects.for_day(self.deferred_day).count(), 2 * Device.objects.count())
+        self.assertEqual(EnergyGeneration1Min.objects.for_day(self.deferred_day).count(), 2)
+        self.assertTrue(DeviceRunningTotal.objects.filter(date=self.deferred_day).exists())
+        self.assertTrue(HomeRunningTotal.objects.filter(date=self.deferred_day).exists())
+        self.assertFalse(RoomLog1Min.objects.for_day(self.deferred_day).exists())
+        self.assertFalse(RoomRunningTotal.objects.filter(date=self.deferred_day).exists())
+
+        self.assertEqual(RoomLog1Min.objects.for_day(date(2025, 2, 5)).count(), Room.objects.count())
+        self.assertTrue(MinuteTick.objects.filter(minute__date=date(2025, 2, 5)).exists())
+
+        # Nothing is left to delete until the rollups are confirmed
+        self.assertFalse(any(self.prune().values()))
+        for table in ('device_logs', 'energy_generation'):
+            DailyRollupStatus.mark(self.deferred_day, table)
+        self.assertEqual(self.prune(kept=False)['MinuteTick'], 2)
+
+    def test_rows_are_deleted_in_chunks(self):
+        day_logs = DeviceLog1Min.objects.for_day(self.confirmed_day)
+        rows = day_logs.count()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(delete_in_chunks(day_logs, 'created_at'), rows)
+
+        deletes = [query for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), math.ceil(rows / 2))
+        self.assertFalse(day_logs.exists())
+
+@override_settings(CACHES=TEST_CACHES)
+class DashboardSummaryTests(TestCase):
+    now = datetime(2025, 3, 10, 12, 30)
+
+    def setUp(self):
+        get_cache().clear()
+        self.user, self.home = create_home(rooms=2, devices_per_room=4)
+        Device.objects.update(is_unlocked=True, status=True)
+        for minute in range(2):
+            run_tick(datetime(2025, 3, 9, 12, minute))
+        rebuild_day(date(2025, 3, 9))
+        with self.captureOnCommitCallbacks(execute=True):
+            for minute in range(3):
+                run_tick(datetime(2025, 3, 10, 12, minute))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def dashboard(self, **params):
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            return self.client.get('/api/dashboard/', params)
+
+    def test_summary_totals(self):
+        data = self.dashboard(home=self.home.pk).json()
+
+        today_logs = RoomLog1Min.objects.for_day(self.now.date())
+        self.assertAlmostEqual(data['today_usage'], sum(today_logs.values_list('energy_usage', flat=True)))
+        self.assertAlmostEqual(
+            data['yesterday_usage'],
+            sum(RoomLog1Min.objects.for_day(date(2025, 3, 9)).values_list('energy_usage', flat=True))
+        )
+        generation = sum(EnergyGeneration1Min.objects.for_day(self.now.date()).values_list(
+            'energy_generation', flat=True
+        ))
+        self.assertAlmostEqual(data['energy_generation']['today'], generation)
+        self.assertAlmostEqual(data['energy_generation']['net_today'], generation - data['today_usage'])
+
+        self.assertEqual(len(data['room_summary']), Room.objects.count())
+        for room in data['room_summary']:
+            self.assertAlmostEqual(
+                room['usage'], sum(today_logs.filter(room_id=room['id']).values_list('energy_usage', flat=True))
+            )
+        usages = [device['usage'] for device in data['device_summary']]
+        self.assertEqual(len(usages), 5)
+        self.assertEqual(usages, sorted(usages, reverse=True))
+
+    def test_summary_costs_three_queries_whatever_the_home_size(self):
+        with self.assertNumQueries(3):
+            self.assertEqual(self.dashboard(home=self.home.pk).status_code, 200)
+
+        room = Room.objects.create(name='Annex', smart_home=self.home, home_io_room=HomeIORoom.objects.first())
+        for number in range(5):
+            Device.objects.create(
+                name=f'Lamp {number}', room=room, supported_device=SupportedDevice.objects.first(),
+                is_unlocked=True, status=True
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            run_tick(datetime(2025, 3, 10, 12, 3))
+
+        with self.assertNumQueries(3):
+            data = self.dashboard(home=self.home.pk).json()
+        self.assertEqual(len(data['room_summary']), 3)
+
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.computed = []
+
+    def compute(self, value='data'):
+        def compute():
+            self.computed.append(value)
+            return value
+        return compute
+
+    def test_hit_after_miss_and_stats(self):
+        for _ in range(3):
+            self.assertEqual(cached_response('dashboard', 1, self.compute()), 'data')
+        cached_response('dashboard', 2, self.compute())
+
+        self.assertEqual(self.computed, ['data', 'data'])
+        stats = get_stats()['endpoints']['dashboard']
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(get_stats()['endpoints']['homeio_rooms']['hits'], 0)
+
+    def test_params_and_missing_data(self):
+        cached_response('room_daily_usage', 1, self.compute(), {'room': 1})
+        cached_response('room_daily_usage', 1, self.compute(), {'room': 2})
+        self.assertEqual(len(self.computed), 2)
+
+        # None, e.g. for a missing home, is not cached
+        for _ in range(2):
+            self.assertIsNone(cached_response('dashboard', 1, lambda: self.computed.append(None)))
+        self.assertEqual(len(self.computed), 4)
+
+    def test_tick_watermark_invalidates_entries(self):
+        cached_response('dashboard', 1, self.compute('before'))
+        set_watermark(datetime(2025, 3, 10, 12, 1))
+
+        self.assertEqual(cached_response('dashboard', 1, self.compute('after')), 'after')
+        self.assertEqual(cached_response('dashboard', 1, self.compute('later')), 'after')
+
+    def test_version_bump_invalidates_entries(self):
+        def cached(value):
+            return cached_response('homeio_rooms', 'all', self.compute(value), version=data_version(['catalogue']))
+
+        cached('before')
+        self.assertEqual(cached('unchanged'), 'before')
+        bump_version('catalogue')
+        self.assertEqual(cached('after'), 'after')
+        # Bumping another scope keeps the entry
+        bump_version('supported_devices')
+        self.assertEqual(cached('later'), 'after')
+
+    def test_dashboard_is_served_from_cache_until_the_next_tick(self):
+        user, home = create_home()
+        Device.objects.update(is_unlocked=True, status=True)
+        now = datetime(2025, 3, 10, 12, 0)
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            run_tick(now)
+
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            first = client.get('/api/dashboard/', {'home': home.pk}).json()
+            with self.assertNumQueries(0):
+                self.assertEqual(client.get('/api/dashboard/', {'home': home.pk}).json(), first)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                run_tick(now + timedelta(minutes=1))
+            second = client.get('/api/dashboard/', {'home': home.pk}).json()
+
+        self.assertGreater(second['today_usage'], first['today_usage'])
+
+async def idle_watcher(broker):
+    """Stands in for live.watch_ticks in tests that publish events themselves."""
+
+def parse_events(payload):
+    """(event, data) pairs of a server-sent event payload."""
+    events = []
+    for frame in payload.decode().split('\n\n'):
+        if frame.startswith('event: '):
+            event, data = frame.split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+@override_settings(LIVE_POLL_SECONDS=0, LIVE_HEARTBEAT_SECONDS=0.01)
+class LiveEventTests(SimpleTestCase):
+    def test_event_framing(self):
+        payload = format_event('tick', {'minute': datetime(2025, 3, 10, 12, 1), 'usage': 0.5})
+
+        self.assertTrue(payload.startswith(b'event: tick\ndata: {'))
+        self.assertTrue(payload.endswith(b'\n\n'))
+        self.assertEqual(parse_events(payload), [('tick', {'minute': '2025-03-10T12:01:00', 'usage': 0.5})])
+
+    @mock.patch('api.live.watch_ticks', idle_watcher)
+    def test_broker_delivers_per_home_and_from_other_threads(self):
+        async def scenario():
+            broker = LocalBroker(queue_size=4)
+            queue, other = broker.subscribe(1), broker.subscribe(2)
+            broker.publish(1, 'device', {'id': 5})
+            # A synchronous view publishes from a worker thread
+            await asyncio.get_running_loop().run_in_executor(None, broker.publish, 1, 'device', {'id': 6})
+            await asyncio.sleep(0)
+            messages = [queue.get_nowait() for _ in range(queue.qsize())]
+            broker.unsubscribe(1, queue)
+            return messages, other.qsize(), broker.home_ids()
+
+        messages, other_size, home_ids = asyncio.run(scenario())
+        self.assertEqual(parse_events(b''.join(messages)), [('device', {'id': 5}), ('device', {'id': 6})])
+        self.assertEqual(other_size, 0)
+        self.assertEqual(home_ids, [2])
+
+    @mock.patch('api.live.watch_ticks', idle_watcher)
+    def test_slow_client_gets_a_resync(self):
+        async def scenario():
+            broker = LocalBroker(queue_size=2)
+            queue = broker.subscribe(1)
+            for number in range(3):
+                broker.publish(1, 'device', {'id': number})
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(parse_events(b''.join(asyncio.run(scenario()))), [('resync', {})])
+
+    def test_broker_publishes_committed_ticks(self):
+        watermarks = iter(['2025-03-10T12:00:00', '2025-03-10T12:00:00', '2025-03-10T12:01:00'])
+
+        def get_watermark():
+            return next(watermarks, '2025-03-10T12:01:00')
+
+        def deltas(minute, home_ids):
+            return {home_id: {'minute': minute, 'usage': 0.25 * home_id} for home_id in home_ids}
+
+        async def scenario():
+            broker = LocalBroker()
+            queue = broker.subscribe(2)
+            message = await asyncio.wait_for(queue.get(), 5)
+            broker.unsubscribe(2, queue)
+            await asyncio.wait_for(broker._watcher, 5)
+            return message
+
+        with mock.patch('api.live.get_watermark', get_watermark), mock.patch('api.live.tick_deltas', deltas):
+            message = asyncio.run(scenario())
+        self.assertEqual(parse_events(message), [('tick', {'minute': '2025-03-10T12:01:00', 'usage': 0.5})])
+
+    @mock.patch('api.live.watch_ticks', idle_watcher)
+    def test_stream_starts_with_retry_and_keeps_alive(self):
+        async def scenario():
+            broker = LocalBroker()
+            with mock.patch('api.live.get_broker', return_value=broker):
+                stream = event_stream(3)
+                chunks = [await stream.__anext__(), await stream.__anext__()]
+                broker.publish(3, 'device', {'id': 9})
+                chunks.append(await stream.__anext__())
+                await stream.aclose()
+            return chunks, broker.home_ids()
+
+        chunks, home_ids = asyncio.run(scenario())
+        self.assertEqual(chunks[:2], [b'retry: 5000\n\n', b': keep-alive\n\n'])
+        self.assertEqual(parse_events(chunks[2]), [('device', {'id': 9})])
+        self.assertEqual(home_ids, [])
+
+@override_settings(CACHES=TEST_CACHES)
+class TickDeltaTests(TestCase):
+    def test_deltas_of_a_tick_per_home(self):
+        user, home = create_home(rooms=2)
+        other_user, other_home = create_home('other')
+        Device.objects.update(is_unlocked=True, status=True)
+        minute = datetime(2025, 3, 10, 12, 0)
+        run_tick(minute)
+
+        with self.assertNumQueries(3):
+            deltas = tick_deltas(minute, [home.pk])
+
+        delta = deltas[home.pk]
+        self.assertEqual(list(deltas), [home.pk])
+        self.assertEqual(len(delta['rooms']), Room.objects.filter(smart_home=home).count())
+        self.assertEqual(len(delta['devices']), Device.objects.filter(room__smart_home=home).count())
+        self.assertAlmostEqual(delta['usage'], sum(room['energy_usage'] for room in delta['rooms']))
+        self.assertAlmostEqual(
+            delta['generation'], EnergyGeneration1Min.objects.get(home=home).energy_generation
+        )
+
+@override_settings(CACHES=TEST_CACHES, HOME_IO_API_URL='http://homeio.test')
+class HomeIOServiceTests(SimpleTestCase):
+    def setUp(self):
+        get_cache().clear()
+        room = HomeIORoom(name='Hall', zone='A')
+        self.devices = {
+            device_type: Device(
+                name=device_type, status=True, analogue_value=None,
+                supported_device=SupportedDevice(type=device_type, number=number, home_io_room=room)
+            )
+            for number, device_type in enumerate(('lighting', 'heating', 'shades', 'alarm'), start=1)
+        }
+        self.service = HomeIOService()
+        self.service.breaker = CircuitBreaker()
+        self.service.session = mock.Mock()
+        self.service.session.get.side_effect = self.answer
+        self.urls = []
+
+    def apply_many(self, commands):
+        with self.assertLogs('api.home_io.home_io_services', 'INFO'):
+            return self.service.apply_many(commands)
+
+    def answer(self, url, timeout):
+        self.urls.append(url)
+        if '/swh/' in url:
+            return mock.Mock(status_code=500, text='error')
+        if '/strs/' in url:
+            raise ConnectionError('connection reset')
+        return mock.Mock(status_code=200)
+
+    def test_apply_many_reports_each_command_in_order(self):
+        broken = Device(name='broken', status=True)  # no supported device to build a URL from
+        results = self.apply_many([
+            (self.devices['lighting'], 'state'),
+            (self.devices['heating'], 'state'),
+            (self.devices['alarm'], 'state'),
+            (broken, 'state'),
+            (self.devices['shades'], 'state'),
+            (self.devices['lighting'], 'analogue'),
+        ])
+
+        # Sent, failed with 500, not supported, not buildable, connection error, nothing to send
+        self.assertEqual(results, [True, False, None, False, False, None])
+        self.assertEqual(sorted(self.urls), [
+            'http://homeio.test/strs/3/up/A', 'http://homeio.test/swh/turn_on/A', 'http://homeio.test/swl/turn_on/1/A'
+        ])
+        for call in self.service.session.get.call_args_list:
+            self.assertEqual(call.kwargs['timeout'], self.service.timeout)
+        snapshot = self.service.breaker.snapshot()
+        self.assertEqual((snapshot['requests'], snapshot['failure_rate']), (3, round(2 / 3, 3)))
+
+    def test_apply_many_without_requests_sends_nothing(self):
+        self.assertEqual(self.apply_many([(self.devices['alarm'], 'state')]), [None])
+        self.service.session.get.assert_not_called()
+
+    def test_open_breaker_refuses_requests(self):
+        self.service.breaker = CircuitBreaker(min_requests=1, failure_rate=0.5)
+        self.apply_many([(self.devices['heating'], 'state')])
+
+        self.assertEqual(self.apply_many([(self.devices['lighting'], 'state')] * 3), [False] * 3)
+        self.assertEqual(len(self.urls), 1)
+
+    @override_settings(HOME_IO_POOL_SIZE=3)
+    def test_bulk_commands_share_one_thread_pool(self):
+        with mock.patch('api.home_io.home_io_services._executor', None):
+            executor = get_executor()
+            self.assertIs(get_executor(), executor)
+            self.assertEqual(executor._max_workers, 3)
+            with mock.patch.object(executor, 'submit', wraps=executor.submit) as submit:
+                self.apply_many([(self.devices['lighting'], 'state')] * 5)
+                self.apply_many([(self.devices['lighting'], 'analogue')] * 2)
+            executor.shutdown()
+        self.assertEqual(submit.call_count, 5)
+
+@override_settings(CACHES=TEST_CACHES)
+class TrackedFieldsTests(TestCase):
+    def setUp(self):
+        self.user, self.home = create_home()
+        self.device_id = Device.objects.order_by('id').values_list('id', flat=True).first()
+
+    def test_snapshot_from_db_and_changed_fields(self):
+        device = Device.objects.get(pk=self.device_id)
+
+        self.assertEqual((device.initial_value('status'), device.initial_value('analogue_value')), (False, 10))
+        self.assertEqual(device.changed_fields, [])
+
+        device.status = True
+        device.analogue_value = 10
+        self.assertEqual(device.changed_fields, ['status'])
+        self.assertFalse(device.initial_value('status'))
+
+        device.save()
+        self.assertEqual(device.changed_fields, [])
+        self.assertTrue(device.initial_value('status'))
+
+    def test_unloaded_and_new_instances_count_as_changed(self):
+        device = Device.objects.only('id', 'name').get(pk=self.device_id)
+        self.assertFalse(device.has_loaded('status'))
+        self.assertEqual(device.changed_fields, ['status', 'analogue_value'])
+
+        device.refresh_from_db(fields=['status'])
+        self.assertEqual(device.changed_fields, ['analogue_value'])
+        self.assertTrue(Device(name='New').has_changed('status'))
+
+    def test_save_compares_without_a_query_and_noop_save_queues_nothing(self):
+        device = Device.objects.select_related(*DEVICE_DETAILS_RELATED).get(pk=self.device_id)
+
+        # The update alone: the pre_save check needs no read of the old row
+        with self.assertNumQueries(1):
+            device.save(update_fields=['name'])
+        device.save()
+        self.assertFalse(HomeIOCommand.objects.exists())
+
+        device.status = True
+        device.save()
+        self.assertEqual(HomeIOCommand.objects.filter(device=device).count(), 1)
+
+    def test_only_updated_fields_are_snapshotted(self):
+        device = Device.objects.get(pk=self.device_id)
+        device.status = True
+        device.analogue_value = 20
+        device.save(update_fields=['analogue_value'])
+
+        self.assertEqual(device.changed_fields, ['status'])
@@ -0,0 +1,51 @@
+"""
+Calendar periods as half-open [start, end) timestamp ranges.
+
+Filtering the log tables with created_at__date wraps the column in a date function,
+so the database cannot use the created_at indexes. Comparing the raw column against
+the bounds returned here keeps every day, week and month query index friendly.
+"""
+import calendar
+from datetime import date, datetime, time, timedelta
+
+class InvalidDate(ValueError):
+    """A date parameter that is not a valid 'YYYY-MM-DD' date."""
+
+def as_date(value):
+    """
+    Accept a date or an ISO 'YYYY-MM-DD' string (as sent in query parameters).
+
+    Raises InvalidDate for a string that is not a valid date; the viewsets answer
+    it with 400 (see InvalidDateMixin).
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidDate(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+def day_bounds(day):
+    """Half-open [start, end) datetime range covering one calendar day."""
+    start = datetime.combine(as_date(day), time.min)
+    return start, start + timedelta(days=1)
+
+def days_bounds(first_day, last_day):
+    """Half-open [start, end) datetime range covering first_day through last_day inclusive."""
+    return day_bounds(first_day)[0], day_bounds(last_day)[1]
+
+def week_bounds(day):
+    """Half-open [start, end) datetime range covering the Monday-to-Sunday week containing day."""
+    monday = as_date(day) - timedelta(days=as_date(day).weekday())
+    return days_bounds(monday, monday + timedelta(days=6))
+
+def month_bounds(year, month):
+    """First and last date of a calendar month."""
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, 1), date(year, month, last_day)
+
+def month_datetime_bounds(year, month):
+    """Half-open [start, end) datetime range covering a calendar month."""
+    return days_bounds(*month_bounds(year, month))
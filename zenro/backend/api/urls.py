@@ -13,7 +13,8 @@ from .views import (
     EnergyGeneration1MinViewSet, EnergyGenerationDailyViewSet, EnergyGenerationMonthlyViewSet,
     UserProfileViewSet, current_user_info, join_smart_home,
     generate_recovery_codes, list_recovery_codes, reset_password_with_code,
-    validate_recovery_code
+    validate_recovery_code, cache_stats, export_logs, live_events, HomeIOCommandViewSet, SceneViewSet,
+    homeio_health
 )
 
 # Create a router and register our viewsets with it
@@ -27,6 +28,8 @@ router.register(r'devices', DeviceViewSet)
 router.register(r'rooms', RoomViewSet)
 router.register(r'supporteddevices', SupportedDeviceViewSet)  
 router.register(r'homeio-rooms', HomeIORoomViewSet, basename='homeio-rooms')
+router.register(r'homeio-commands', HomeIOCommandViewSet, basename='homeio-commands')
+router.register(r'scenes', SceneViewSet, basename='scenes')
 
 # Energy & device log models (read-only - GET)
 router.register(r'energy-generation', EnergyGeneration1MinViewSet, basename='energy-generation')
@@ -52,9 +55,13 @@ urlpatterns = [
     
     # Dashboard and analytics
     path('dashboard/', dashboard_summary, name='dashboard'), 
+    path('cache-stats/', cache_stats, name='cache-stats'),
+    path('exports/<str:kind>/', export_logs, name='export-logs'),
+    path('live/', live_events, name='live-events'),
     
     # HomeIO control
     path('homeio/control/', HomeIOControlView.as_view(), name='homeio-control'), 
+    path('homeio/health/', homeio_health, name='homeio-health'),
     path('unlock-room/', UnlockRoomView.as_view(), name='unlock-room'),
     path('add-device/', AddDeviceView.as_view(), name='add-device'),
     path('devices/<int:pk>/control/', DeviceControlView.as_view(), name='device-control'),
@@ -1,11 +1,12 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework import viewsets, status, permissions
-import datetime
-from rest_framework.decorators import api_view, permission_classes, authentication_classes, action
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, action, renderer_classes
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
-from django.db import models, IntegrityError
+from django.db import models, IntegrityError, transaction
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from datetime import timedelta
@@ -14,7 +15,7 @@ from .models import (
     DeviceLogDaily, DeviceLogMonthly, RoomLogDaily, 
     RoomLogMonthly, Room, HomeIORoom, RoomLog1Min, DeviceLog1Min,
     EnergyGeneration1Min, EnergyGenerationDaily, EnergyGenerationMonthly,
-    UserProfile, RecoveryCode
+    UserProfile, RecoveryCode, DeviceRunningTotal, RoomRunningTotal, HomeRunningTotal, HomeIOCommand, Scene
 )
 from .serializers import (
     DeviceLogMonthlySerializer, UserSerializer, SmartHomeSerializer, SupportedDeviceSerializer, 
@@ -23,13 +24,40 @@ from .serializers import (
     RoomLog1MinSerializer, HomeIORoomSerializer, RoomLogMonthlySerializer, 
     EnergyGeneration1MinSerializer, EnergyGenerationDailySerializer, 
     EnergyGenerationMonthlySerializer, DeviceControlSerializer,
-    UserProfileSerializer, SmartHomeListSerializer, JoinHomeSerializer
+    UserProfileSerializer, SmartHomeListSerializer, JoinHomeSerializer, HomeIOCommandSerializer,
+    BatchControlSerializer, SceneSerializer
 )
-from .home_io.home_io_services import HomeIOService
+from .home_io.home_io_services import HomeIOService, DEVICE_DETAILS_RELATED
+from .home_io.circuit_breaker import shared_snapshot, homeio_unavailable, STATE_OPEN
+from .cache import cached_response, data_version, get_stats
+from .mixins import (
+    TimeSeriesMixin, PackedSeriesMixin, ConditionalGetMixin, InvalidDateMixin, conditional_get
+)
+from .pagination import LogCursorPagination
+from .renderers import CSVRenderer, NDJSONRenderer
+from .exports import EXPORTS, export_rows, stream_export, export_filename
+from .live import event_stream
+from .device_control import apply_device_actions
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django_filters import rest_framework as filters
 from rest_framework import viewsets, status, permissions, filters as drf_filters
 from django.contrib.auth.hashers import check_password
 
+def _subquery_value(queryset, field):
+    """Scalar subquery for one field of the first matching row, 0 when there is none."""
+    return Coalesce(
+        models.Subquery(queryset.values(field)[:1], output_field=models.FloatField()),
+        0.0
+    )
+
+def _subquery_sum(queryset, group_field, field):
+    """Scalar subquery summing a field over the rows of one group, 0 when there are none."""
+    total = queryset.order_by().values(group_field).annotate(total=models.Sum(field)).values('total')
+    return Coalesce(models.Subquery(total, output_field=models.FloatField()), 0.0)
+
 class UserViewSet(viewsets.ModelViewSet):
     """
     Handles CRUD operations for User model including their profile.
@@ -183,21 +211,65 @@ class SmartHomeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(available_homes, many=True)
         return Response(serializer.data)
 
-class SupportedDeviceViewSet(viewsets.ModelViewSet):
+class SupportedDeviceViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     Handles CRUD operations for SupportedDevice model.
+    GET requests support If-None-Match until a supported device changes.
     """
     queryset = SupportedDevice.objects.all()
     serializer_class = SupportedDeviceSerializer
+    version_scopes = ['supported_devices']
 
 # ViewSet for handling Device CRUD operations
 class DeviceViewSet(viewsets.ModelViewSet):
     """
     Handles CRUD operations for Device model.
+    batch_control(request):
+        Applies many device actions, or a stored scene, in one request.
     """
     queryset = Device.objects.all()
     serializer_class = DeviceSerializer
 
+    @action(detail=False, methods=['post'], url_path='batch-control')
+    def batch_control(self, request):
+        """
+        Control many devices in one request.
+        
+        POST /api/devices/batch-control/
+        
+        Request Body:
+        - actions (list, optional): {device or room, status and/or analogue_value}
+        - scene (integer, optional): ID of a stored scene whose actions run first
+        
+        Permissions are checked once for all targets, every change is saved in one
+        transaction and the HomeIO commands are queued in the outbox together (see
+        api/device_control.py). Returns the result of each device: queued, saved,
+        unchanged, unsupported, forbidden or not_found. While the HomeIO circuit
+        breaker is open the commands are queued all the same, and the response is
+        202 with the breaker state in 'homeio' (null otherwise).
+        """
+        serializer = BatchControlSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        actions = []
+        scene_id = serializer.validated_data.get('scene')
+        if scene_id is not None:
+            scene = get_object_or_404(
+                Scene.objects.filter(
+                    models.Q(smart_home__creator=request.user) | models.Q(smart_home__members=request.user)
+                ).distinct(),
+                pk=scene_id
+            )
+            actions.extend(scene.actions)
+        actions.extend(serializer.validated_data.get('actions', []))
+        
+        delay = _homeio_delay()
+        return Response(
+            {**apply_device_actions(request.user, actions), 'homeio': delay},
+            status=status.HTTP_202_ACCEPTED if delay else status.HTTP_200_OK
+        )
+
 # ViewSet for handling Room CRUD operations
 class RoomViewSet(viewsets.ModelViewSet):
     """
@@ -206,6 +278,8 @@ class RoomViewSet(viewsets.ModelViewSet):
         Returns filtered queryset of rooms based on user's smart home access.
         Ensures users can only access rooms in smart homes they own or are members of.
         Returns empty queryset on errors or invalid smart_home_id.
+        Home and HomeIO room names are joined, devices prefetched and today's usage
+        annotated, so a list costs the same few queries however many rooms it has.
     add_device(request, pk=None):
         Adds a new device to the specified room.
         Requires 'supported_device_id' and 'name' in request data.
@@ -213,7 +287,7 @@ class RoomViewSet(viewsets.ModelViewSet):
         Returns HTTP 400 if required data is missing or name is duplicate.
     daily_usage(request, pk=None):
         Retrieves the total energy usage for all devices in the room for the current day.
-        Aggregates DeviceLogDaily entries for all devices in the room.
+        Reads the room's running total for today, kept up to date by the minute tick.
         Returns date and total usage in the response.
     weekly_usage(request, pk=None):
         Calculates the total energy usage for the room over the current week.
@@ -226,7 +300,16 @@ class RoomViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         try:
-            queryset = super().get_queryset()
+            queryset = super().get_queryset().select_related(
+                'smart_home', 'home_io_room'
+            ).prefetch_related('devices').annotate(
+                today_usage=_subquery_value(
+                    RoomRunningTotal.objects.filter(
+                        room=models.OuterRef('pk'), date=timezone.now().date()
+                    ),
+                    'energy_usage'
+                )
+            )
             smart_home_id = self.request.query_params.get('smart_home')
             if smart_home_id:
                 try:
@@ -275,11 +358,14 @@ class RoomViewSet(viewsets.ModelViewSet):
         room = self.get_object()
         from django.utils import timezone
         today = timezone.now().date()
-        devices = room.devices.all()
-        total_usage = DeviceLogDaily.objects.filter(
-            device__in=devices, date=today
-        ).aggregate(models.Sum('total_energy_usage'))['total_energy_usage__sum'] or 0
-        return Response({'date': str(today), 'usage': total_usage})
+
+        def compute():
+            total_usage = RoomRunningTotal.objects.filter(
+                room=room, date=today
+            ).values_list('energy_usage', flat=True).first() or 0
+            return {'date': str(today), 'usage': total_usage}
+
+        return Response(cached_response('room_daily_usage', room.smart_home_id, compute, {'room': room.id}))
 
     @action(detail=True, methods=['GET'])
     def weekly_usage(self, request, pk=None):
@@ -289,25 +375,89 @@ class RoomViewSet(viewsets.ModelViewSet):
         today = timezone.now().date()
         start_of_week = today - timedelta(days=today.weekday())
         end_of_week = start_of_week + timedelta(days=6)
-        logs = RoomLogDaily.objects.filter(room=room, date__range=[start_of_week, end_of_week])
-        total_usage = logs.aggregate(models.Sum('total_energy_usage'))['total_energy_usage__sum'] or 0
-        return Response({'start_of_week': str(start_of_week), 'end_of_week': str(end_of_week), 'usage': total_usage})
 
-class DeviceLogDailyViewSet(viewsets.ReadOnlyModelViewSet):
+        def compute():
+            logs = RoomLogDaily.objects.filter(room=room, date__range=[start_of_week, end_of_week])
+            total_usage = logs.aggregate(models.Sum('total_energy_usage'))['total_energy_usage__sum'] or 0
+            return {'start_of_week': str(start_of_week), 'end_of_week': str(end_of_week), 'usage': total_usage}
+
+        return Response(cached_response('room_weekly_usage', room.smart_home_id, compute, {'room': room.id}))
+
+class DeviceLogDailyViewSet(ConditionalGetMixin, PackedSeriesMixin, viewsets.ReadOnlyModelViewSet):
     """
     Handles read-only operations for DeviceLogDaily model.
+    get_queryset():
+        Filters by ?device=, ?start_date= and ?end_date= when given.
+        ?format=bin returns the daily totals as a packed series (see PackedSeriesMixin).
+        List and retrieve support If-None-Match until the rollups next write.
+    logs(request, pk=None):
+        Returns the per-minute logs behind a daily summary. They are loaded
+        from DeviceLog1Min on request rather than stored in the daily row.
     """
     queryset = DeviceLogDaily.objects.all()
     serializer_class = DeviceLogDailySerializer
+    version_scopes = ['log_rollups']
+    packed_time_field = 'date'
+    packed_value_field = 'total_energy_usage'
+    packed_step = 86400
 
-class RoomLogDailyViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        device_id = self.request.query_params.get('device')
+        if device_id:
+            queryset = queryset.filter(device_id=device_id)
+        start_date = self.request.query_params.get('start_date')
+        if start_date:
+            queryset = queryset.filter(date__gte=start_date)
+        end_date = self.request.query_params.get('end_date')
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+        return queryset
+
+    @action(detail=True, methods=['GET'])
+    def logs(self, request, pk=None):
+        """Get the 1-minute logs for this device and day."""
+        daily_log = self.get_object()
+        logs = DeviceLog1Min.objects.for_day(daily_log.date).filter(
+            device_id=daily_log.device_id
+        ).order_by('created_at').values_list('created_at', 'status', 'energy_usage')
+        return Response([
+            {
+                'timestamp': created_at.isoformat(),
+                'status': log_status,
+                'energy_usage': energy_usage
+            } for created_at, log_status, energy_usage in logs
+        ])
+
+class RoomLogDailyViewSet(ConditionalGetMixin, PackedSeriesMixin, viewsets.ReadOnlyModelViewSet):
     """
     Handles read-only operations for RoomLogDaily model.
+    get_queryset():
+        Filters by ?room=, ?start_date= and ?end_date= when given.
+        ?format=bin returns the daily totals as a packed series (see PackedSeriesMixin).
+        List and retrieve support If-None-Match until the rollups next write.
     """
     queryset = RoomLogDaily.objects.all()
     serializer_class = RoomLogDailySerializer
+    version_scopes = ['log_rollups']
+    packed_time_field = 'date'
+    packed_value_field = 'total_energy_usage'
+    packed_step = 86400
 
-class DeviceLog1MinViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        room_id = self.request.query_params.get('room')
+        if room_id:
+            queryset = queryset.filter(room_id=room_id)
+        start_date = self.request.query_params.get('start_date')
+        if start_date:
+            queryset = queryset.filter(date__gte=start_date)
+        end_date = self.request.query_params.get('end_date')
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+        return queryset
+
+class DeviceLog1MinViewSet(InvalidDateMixin, ConditionalGetMixin, PackedSeriesMixin, TimeSeriesMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for querying device energy usage logs at 1-minute intervals.
     Provides energy usage data recorded for each device.
@@ -316,11 +466,20 @@ class DeviceLog1MinViewSet(viewsets.ReadOnlyModelViewSet):
     - device: Filter by device ID
     - start_date: Filter by start date (YYYY-MM-DD)
     - end_date: Filter by end date (YYYY-MM-DD)
+    - page_size, order, cursor: Keyset pagination (see LogCursorPagination)
+    - bucket, max_points: Return a chart series instead of rows (see TimeSeriesMixin)
+    - format=bin: Return a packed binary series (see PackedSeriesMixin)
+    
+    GET requests support If-None-Match until the next minute tick commits.
     """
     serializer_class = DeviceLog1MinSerializer
+    pagination_class = LogCursorPagination
+    series_value_field = 'energy_usage'
+    packed_value_field = 'energy_usage'
+    packed_status_field = 'status'
     
     def get_queryset(self):
-        queryset = DeviceLog1Min.objects.all().order_by('-created_at')
+        queryset = DeviceLog1Min.objects.all()
         
         # Filter by device if specified
         device_id = self.request.query_params.get('device')
@@ -328,28 +487,31 @@ class DeviceLog1MinViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(device_id=device_id)
             
         # Filter by date range if specified
-        start_date = self.request.query_params.get('start_date')
-        if start_date:
-            queryset = queryset.filter(created_at__date__gte=start_date)
-                
-        end_date = self.request.query_params.get('end_date')
-        if end_date:
-            queryset = queryset.filter(created_at__date__lte=end_date)
+        queryset = queryset.for_dates(
+            self.request.query_params.get('start_date'),
+            self.request.query_params.get('end_date')
+        )
             
-        # Limit results to prevent performance issues
-        return queryset[:1000]  # Limit to 1000 most recent records
+        return queryset
 
-class RoomLog1MinViewSet(viewsets.ReadOnlyModelViewSet):
+class RoomLog1MinViewSet(InvalidDateMixin, ConditionalGetMixin, PackedSeriesMixin, TimeSeriesMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for querying room energy usage logs at 1-minute intervals.
     Provides aggregated energy usage data for each room.
     
     Query parameters:
     - room: Filter by room ID
-    - start_date: Filter by start date (YYYY-MM-DD)
-    - end_date: Filter by end date (YYYY-MM-DD)
+    - date: Filter by day (YYYY-MM-DD)
+    - page_size, order, cursor: Keyset pagination (see LogCursorPagination)
+    - bucket, max_points: Return a chart series instead of rows (see TimeSeriesMixin)
+    - format=bin: Return a packed binary series (see PackedSeriesMixin)
+    
+    GET requests support If-None-Match until the next minute tick commits.
     """
     serializer_class = RoomLog1MinSerializer
+    pagination_class = LogCursorPagination
+    series_value_field = 'energy_usage'
+    packed_value_field = 'energy_usage'
     filter_backends = [filters.DjangoFilterBackend]
     filterset_fields = ['room', 'created_at']
     
@@ -362,21 +524,18 @@ class RoomLog1MinViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(room_id=room_id)
             
         if date_str:
-            date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-            next_day = date + datetime.timedelta(days=1)
-            queryset = queryset.filter(
-                created_at__gte=datetime.datetime.combine(date, datetime.time.min),
-                created_at__lt=datetime.datetime.combine(next_day, datetime.time.min)
-            )
+            queryset = queryset.for_day(date_str)
             
         return queryset
 
-class DeviceLogMonthlyViewSet(viewsets.ReadOnlyModelViewSet):
+class DeviceLogMonthlyViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for querying device monthly energy usage logs.
+    GET requests support If-None-Match until the rollups next write.
     """
     queryset = DeviceLogMonthly.objects.all()
     serializer_class = DeviceLogMonthlySerializer
+    version_scopes = ['log_rollups']
     
     def get_queryset(self):
         queryset = DeviceLogMonthly.objects.all()
@@ -397,12 +556,14 @@ class DeviceLogMonthlyViewSet(viewsets.ReadOnlyModelViewSet):
             
         return queryset
 
-class RoomLogMonthlyViewSet(viewsets.ReadOnlyModelViewSet):
+class RoomLogMonthlyViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for querying room monthly energy usage logs.
+    GET requests support If-None-Match until the rollups next write.
     """
     queryset = RoomLogMonthly.objects.all()
     serializer_class = RoomLogMonthlySerializer
+    version_scopes = ['log_rollups']
     
     def get_queryset(self):
         queryset = RoomLogMonthly.objects.all()
@@ -426,11 +587,57 @@ class RoomLogMonthlyViewSet(viewsets.ReadOnlyModelViewSet):
 class HomeIORoomViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for querying available HomeIO room layouts.
+    
+    Query parameters:
+    - smart_home: Report is_unlocked for this home, i.e. whether it has an unlocked
+      Room for the layout room. Without it a layout room counts as unlocked when
+      any home has a Room for it.
+    
+    is_unlocked is annotated with one EXISTS subquery, and the list is cached per
+    home until one of its rooms (or the layout itself) changes. The same versions
+    give the ETag for If-None-Match requests.
     """
     queryset = HomeIORoom.objects.all().order_by('unlock_order')
     serializer_class = HomeIORoomSerializer
     permission_classes = [AllowAny]  # Allow frontend to view room layouts without auth
 
+    def home_scope(self):
+        """
+        The id of the home named by ?smart_home=, or 'all' without one. Anything but
+        the id of an existing home is refused with 400 before the cache is touched,
+        so arbitrary values cannot create cache entries.
+        """
+        if hasattr(self, '_home_scope'):
+            return self._home_scope
+        smart_home_id = self.request.query_params.get('smart_home')
+        if not smart_home_id:
+            self._home_scope = 'all'
+            return self._home_scope
+        try:
+            smart_home_id = int(smart_home_id)
+        except ValueError:
+            raise ValidationError({'error': f"Invalid smart_home '{smart_home_id}'"})
+        if not SmartHome.objects.filter(pk=smart_home_id).exists():
+            raise ValidationError({'error': f"Unknown smart_home {smart_home_id}"})
+        self._home_scope = smart_home_id
+        return self._home_scope
+
+    def get_queryset(self):
+        rooms = Room.objects.filter(home_io_room=models.OuterRef('pk'))
+        scope = self.home_scope()
+        if scope != 'all':
+            rooms = rooms.filter(smart_home_id=scope, is_unlocked=True)
+        return super().get_queryset().annotate(is_unlocked=models.Exists(rooms))
+
+    def list(self, request, *args, **kwargs):
+        scope = self.home_scope()
+        version = data_version(['homeio_rooms:catalogue', f'homeio_rooms:{scope}'])
+        return conditional_get(request, version, lambda: Response(cached_response(
+            'homeio_rooms', scope,
+            lambda: super(HomeIORoomViewSet, self).list(request, *args, **kwargs).data,
+            version=version
+        )))
+
 class HomeIOControlView(APIView):
     """
     Handles HomeIO control operations.
@@ -534,11 +741,23 @@ class DeviceControlView(APIView):
     - analogue_value (integer, optional): Set device's intensity (0-10)
     
     Either status or analogue_value must be provided.
+    
+    The change is saved together with a command in the HomeIO outbox, which the
+    run_homeio_outbox worker sends in the background, so the response does not
+    wait for HomeIO. It is 202 Accepted with the device and the command_id to poll
+    at /api/homeio-commands/{command_id}/, or 200 with command_id null when the
+    change needs no HomeIO command. While the HomeIO circuit breaker is open the
+    command is queued all the same and 'homeio' reports the breaker state and the
+    seconds until HomeIO is retried (it is null otherwise).
     """
     permission_classes = [IsAuthenticated]
     
     def post(self, request, pk):
-        device = get_object_or_404(Device, pk=pk)
+        # The room and HomeIO details are read for the permission check and the
+        # HomeIO request, so load them with the device
+        device = get_object_or_404(
+            Device.objects.select_related('room__smart_home', *DEVICE_DETAILS_RELATED), pk=pk
+        )
         
         # Check if user has access to the device's smart home
         smart_home = device.room.smart_home
@@ -563,24 +782,122 @@ class DeviceControlView(APIView):
             if analogue_value is not None:
                 device.analogue_value = analogue_value
                 
-            device.save()  # This will trigger the pre_save signal
+            # The signals queue the HomeIO command; commit it with the change
+            with transaction.atomic():
+                device.save()
             
-            # Return the updated device
+            # Return the updated device and the queued command, if any
+            command = getattr(device, 'homeio_command', None)
             return Response(
-                DeviceSerializer(device).data, 
-                status=status.HTTP_200_OK
+                {
+                    **DeviceSerializer(device).data,
+                    'command_id': command.id if command else None,
+                    'homeio': _homeio_delay(),
+                },
+                status=status.HTTP_202_ACCEPTED if command else status.HTTP_200_OK
             )
             
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class EnergyGeneration1MinViewSet(viewsets.ReadOnlyModelViewSet):
+class SceneViewSet(viewsets.ModelViewSet):
+    """
+    Handles CRUD operations for Scene model.
+    
+    Scenes are named lists of device actions for one smart home, run with
+    POST /api/devices/batch-control/ {"scene": id}.
+    
+    Query parameters:
+    - smart_home: Filter by smart home ID
+    
+    Only scenes of the user's smart homes are visible.
+    """
+    serializer_class = SceneSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Scene.objects.filter(
+            models.Q(smart_home__creator=user) | models.Q(smart_home__members=user)
+        ).distinct().order_by('name')
+        
+        smart_home_id = self.request.query_params.get('smart_home')
+        if smart_home_id:
+            queryset = queryset.filter(smart_home_id=smart_home_id)
+        return queryset
+    
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+class HomeIOCommandViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for polling HomeIO commands queued by device changes.
+    
+    GET /api/homeio-commands/{id}/ - Status of one command: pending, sending,
+    sent, failed or superseded (merged into a later command for the same device)
+    
+    Query parameters:
+    - device: Filter by device ID
+    
+    Only commands for devices in the user's smart homes are visible.
+    """
+    serializer_class = HomeIOCommandSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        user = self.request.user
+        queryset = HomeIOCommand.objects.filter(
+            models.Q(device__room__smart_home__creator=user) |
+            models.Q(device__room__smart_home__members=user)
+        ).distinct().order_by('-id')
+        
+        device_id = self.request.query_params.get('device')
+        if device_id:
+            queryset = queryset.filter(device_id=device_id)
+        return queryset
+
+class TickCachedListMixin:
+    """
+    Caches list responses until the next minute tick commits (see api/cache.py),
+    or until one of version_scopes is bumped when those are set.
+    
+    Set cache_endpoint to the endpoint name; the home query parameter and the
+    rest of the query string are part of the cache key.
+    """
+    cache_endpoint = None
+    version_scopes = None
+    
+    def list(self, request, *args, **kwargs):
+        data = cached_response(
+            self.cache_endpoint,
+            request.query_params.get('home'),
+            lambda: super(TickCachedListMixin, self).list(request, *args, **kwargs).data,
+            dict(request.query_params.lists()),
+            version=data_version(self.version_scopes)
+        )
+        return Response(data)
+
+class EnergyGeneration1MinViewSet(InvalidDateMixin, ConditionalGetMixin, PackedSeriesMixin, TickCachedListMixin, TimeSeriesMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for querying energy generation data at 1-minute intervals.
+    
+    Query parameters:
+    - home: Filter by home ID
+    - start_date: Filter by start date (YYYY-MM-DD)
+    - end_date: Filter by end date (YYYY-MM-DD)
+    - page_size, order, cursor: Keyset pagination (see LogCursorPagination)
+    - bucket, max_points: Return a chart series instead of rows (see TimeSeriesMixin)
+    - format=bin: Return a packed binary series (see PackedSeriesMixin)
+    
+    GET requests support If-None-Match until the next minute tick commits.
     """
+    cache_endpoint = 'energy_generation'
     serializer_class = EnergyGeneration1MinSerializer
+    pagination_class = LogCursorPagination
+    series_value_field = 'energy_generation'
+    packed_value_field = 'energy_generation'
     
     def get_queryset(self):
-        queryset = EnergyGeneration1Min.objects.all().order_by('-created_at')
+        queryset = EnergyGeneration1Min.objects.all()
         
         # Filter by home if specified
         home_id = self.request.query_params.get('home')
@@ -588,22 +905,21 @@ class EnergyGeneration1MinViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(home_id=home_id)
             
         # Filter by date range if specified
-        start_date = self.request.query_params.get('start_date')
-        if start_date:
-            queryset = queryset.filter(created_at__date__gte=start_date)
-                
-        end_date = self.request.query_params.get('end_date')
-        if end_date:
-            queryset = queryset.filter(created_at__date__lte=end_date)
+        queryset = queryset.for_dates(
+            self.request.query_params.get('start_date'),
+            self.request.query_params.get('end_date')
+        )
             
-        # Limit results to prevent performance issues
-        return queryset[:1000]  # Limit to 1000 most recent records
+        return queryset
 
-class EnergyGenerationDailyViewSet(viewsets.ReadOnlyModelViewSet):
+class EnergyGenerationDailyViewSet(ConditionalGetMixin, PackedSeriesMixin, TickCachedListMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for querying daily energy generation data.
+    Responses are cached, and support If-None-Match, until the rollups next write.
     """
+    cache_endpoint = 'energy_generation_daily'
     serializer_class = EnergyGenerationDailySerializer
+    version_scopes = ['log_rollups']
     
     def get_queryset(self):
         queryset = EnergyGenerationDaily.objects.all().order_by('-date')
@@ -624,11 +940,14 @@ class EnergyGenerationDailyViewSet(viewsets.ReadOnlyModelViewSet):
             
         return queryset
 
-class EnergyGenerationMonthlyViewSet(viewsets.ReadOnlyModelViewSet):
+class EnergyGenerationMonthlyViewSet(ConditionalGetMixin, TickCachedListMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for querying monthly energy generation data.
+    Responses are cached, and support If-None-Match, until the rollups next write.
     """
+    cache_endpoint = 'energy_generation_monthly'
     serializer_class = EnergyGenerationMonthlySerializer
+    version_scopes = ['log_rollups']
     
     def get_queryset(self):
         queryset = EnergyGenerationMonthly.objects.all()
@@ -649,6 +968,84 @@ class EnergyGenerationMonthlyViewSet(viewsets.ReadOnlyModelViewSet):
             
         return queryset
 
+def _dashboard_summary_data(request, home_id):
+    """
+    Build the dashboard summary for a home, or for the user's first home when
+    home_id is None. Returns None when there is no such home.
+    
+    The data comes from three queries whatever the size of the home: the home
+    with its today/yesterday totals as subqueries, the rooms with their running
+    totals, and the top devices.
+    """
+    today = timezone.now().date()
+    yesterday = today - timedelta(days=1)
+    
+    homes = SmartHome.objects.annotate(
+        # Today's usage and generation so far, kept up to date by the minute tick
+        today_usage=_subquery_value(
+            HomeRunningTotal.objects.filter(home=models.OuterRef('pk'), date=today), 'energy_usage'
+        ),
+        today_generation=_subquery_value(
+            HomeRunningTotal.objects.filter(home=models.OuterRef('pk'), date=today), 'energy_generation'
+        ),
+        yesterday_usage=_subquery_sum(
+            RoomLogDaily.objects.filter(room__smart_home=models.OuterRef('pk'), date=yesterday),
+            'room__smart_home', 'total_energy_usage'
+        ),
+        yesterday_generation=_subquery_value(
+            EnergyGenerationDaily.objects.filter(home=models.OuterRef('pk'), date=yesterday),
+            'total_energy_generation'
+        )
+    )
+    
+    home = None
+    if home_id:
+        home = get_object_or_404(homes, pk=home_id)
+    else:
+        # If no home specified, use the first one the user has access to
+        if request.user.is_authenticated:
+            home = homes.filter(
+                models.Q(creator=request.user) | models.Q(members=request.user)
+            ).first()
+        
+        if not home:
+            home = homes.first()
+    
+    if not home:
+        return None
+        
+    # Room-by-room breakdown, including rooms without usage today
+    room_summary = list(Room.objects.filter(smart_home_id=home.id).annotate(
+        usage=_subquery_value(
+            RoomRunningTotal.objects.filter(room=models.OuterRef('pk'), date=today), 'energy_usage'
+        )
+    ).values('id', 'name', 'usage'))
+    
+    # Get top energy-consuming devices
+    device_summary = [
+        {
+            'id': device['device'],
+            'name': device['device__name'],
+            'usage': device['energy_usage']
+        }
+        for device in DeviceRunningTotal.objects.filter(
+            device__room__smart_home_id=home.id,
+            date=today
+        ).values('device', 'device__name', 'energy_usage').order_by('-energy_usage')[:5]  # Top 5 devices
+    ]
+    
+    return {
+        'today_usage': home.today_usage,
+        'yesterday_usage': home.yesterday_usage,
+        'room_summary': room_summary,
+        'device_summary': device_summary,
+        'energy_generation': {
+            'today': home.today_generation,
+            'yesterday': home.yesterday_generation,
+            'net_today': home.today_generation - home.today_usage
+        }
+    }
+
 @api_view(['GET'])
 def dashboard_summary(request):
     """
@@ -656,6 +1053,9 @@ def dashboard_summary(request):
     
     GET /api/dashboard/?home={id} - Get energy summary for a specific home
     
+    Responses are cached until the next minute tick commits (see api/cache.py),
+    and requests with a matching If-None-Match get 304 without being recomputed.
+    
     Returns:
         - today_usage: Total energy usage across all rooms for today
         - yesterday_usage: Total energy usage across all rooms for yesterday
@@ -664,111 +1064,171 @@ def dashboard_summary(request):
         - energy_generation: Energy generation data including net usage
     """
     try:
-        today = timezone.now().date()
-        yesterday = today - timedelta(days=1)
-        
-        # Get home ID from query params or use first home
+        # Get home ID from query params; without one the home depends on the user
         home_id = request.query_params.get('home')
-        home = None
-        
-        if home_id:
-            home = get_object_or_404(SmartHome, pk=home_id)
-        else:
-            # If no home specified, use the first one the user has access to
-            if request.user.is_authenticated:
-                home = SmartHome.objects.filter(
-                    models.Q(creator=request.user) | models.Q(members=request.user)
-                ).first()
-            
-            if not home:
-                home = SmartHome.objects.first()
-                
-            if home:
-                home_id = home.id
-        
-        if not home:
-            return Response({'error': 'No smart homes found'}, status=status.HTTP_404_NOT_FOUND)
-            
-        # Calculate room info only for the selected home
-        rooms = Room.objects.filter(smart_home_id=home_id)
-        room_ids = rooms.values_list('id', flat=True)
-            
-        # Get today's room logs
-        today_logs = RoomLog1Min.objects.filter(
-            room_id__in=room_ids,
-            created_at__date=today
-        )
-        today_usage = today_logs.aggregate(models.Sum('energy_usage'))['energy_usage__sum'] or 0
-        
-        # Get yesterday's usage
-        yesterday_logs = RoomLogDaily.objects.filter(
-            room_id__in=room_ids,
-            date=yesterday
-        )
-        yesterday_usage = yesterday_logs.aggregate(models.Sum('total_energy_usage'))['total_energy_usage__sum'] or 0
-        
-        # Room-by-room breakdown
-        room_summary = []
-        for room in rooms:
-            room_logs = RoomLog1Min.objects.filter(room=room, created_at__date=today)
-            room_usage = room_logs.aggregate(models.Sum('energy_usage'))['energy_usage__sum'] or 0
-            if room_usage > 0 or True:  # Include all rooms regardless of usage
-                room_summary.append({
-                    'id': room.id,
-                    'name': room.name,
-                    'usage': room_usage
-                })
-        
-        # Get top energy-consuming devices
-        device_summary = []
-        devices = Device.objects.filter(room__smart_home_id=home_id)
-        device_ids = devices.values_list('id', flat=True)
-        
-        today_device_logs = DeviceLog1Min.objects.filter(
-            device_id__in=device_ids,
-            created_at__date=today
-        )
-        if today_device_logs.exists():
-            # Group by device and sum usage
-            top_devices = today_device_logs.values('device', 'device__name')\
-                .annotate(total=models.Sum('energy_usage'))\
-                .order_by('-total')[:5]  # Top 5 devices
-                
-            for device in top_devices:
-                device_summary.append({
-                    'id': device['device'],
-                    'name': device['device__name'],
-                    'usage': device['total']
-                })
-        
-        # Add energy generation data
-        today_gen = EnergyGeneration1Min.objects.filter(
-            home_id=home_id,
-            created_at__date=today
-        )
-        generation_today = today_gen.aggregate(models.Sum('energy_generation'))['energy_generation__sum'] or 0
+        cache_home = home_id or f"user-{request.user.id if request.user else None}"
         
-        yesterday_gen = EnergyGenerationDaily.objects.filter(
-            home_id=home_id,
-            date=yesterday
-        ).aggregate(models.Sum('total_energy_generation'))['total_energy_generation__sum'] or 0
+        def respond():
+            data = cached_response(
+                'dashboard', cache_home, lambda: _dashboard_summary_data(request, home_id)
+            )
+            if data is None:
+                return Response({'error': 'No smart homes found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(data)
         
-        return Response({
-            'today_usage': today_usage,
-            'yesterday_usage': yesterday_usage,
-            'room_summary': room_summary,
-            'device_summary': device_summary,
-            'energy_generation': {
-                'today': generation_today,
-                'yesterday': yesterday_gen,
-                'net_today': generation_today - today_usage
-            }
-        })
+        return conditional_get(request, data_version(), respond)
         
     except Exception as e:
         print(f"Error in dashboard_summary: {e}")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+def cache_stats(request):
+    """
+    Hit, miss and compute time counters of the response cache.
+    
+    GET /api/cache-stats/
+    """
+    return Response(get_stats())
+
+def _homeio_delay():
+    """
+    State of the HomeIO circuit breaker while it is open, else None. Changes are
+    still saved and their commands queued meanwhile; the outbox worker sends them
+    once HomeIO is back, so responses report the delay instead of refusing them.
+    """
+    retry_in = homeio_unavailable()
+    if retry_in is None:
+        return None
+    return {'state': STATE_OPEN, 'retry_in': retry_in}
+
+@api_view(['GET'])
+def homeio_health(request):
+    """
+    Health of the HomeIO host, as seen by the circuit breaker of the process that
+    last talked to it (usually the outbox worker).
+    
+    GET /api/homeio/health/
+    
+    Returns the breaker state (closed, open or half_open), the failure rate and
+    p50/p95/p99 latencies of the recent requests, and retry_in seconds while open.
+    The state is 'unknown' when no process has talked to HomeIO recently.
+    """
+    snapshot = shared_snapshot()
+    if snapshot is None:
+        return Response({'state': 'unknown'})
+    return Response(snapshot)
+
+def _live_user(token, home_id):
+    """
+    User of a live stream access token, or None when the token is invalid.
+    Raises PermissionError when the user has no access to the home.
+    """
+    authentication = JWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(token))
+    except (InvalidToken, TokenError):
+        return None
+    if not SmartHome.objects.filter(
+        models.Q(creator=user) | models.Q(members=user), id=home_id
+    ).exists():
+        raise PermissionError
+    return user
+
+async def live_events(request):
+    """
+    Server-sent event stream of a home's minute ticks and device changes.
+    
+    GET /api/live/?home={id}&token={access token}
+    
+    EventSource cannot send an Authorization header, so the JWT access token is
+    passed as a query parameter. Events (see api/live.py):
+        - tick: the committed minute's room, device and generation values
+        - device: a device's new state after it was changed
+        - resync: events were dropped because the client fell behind; refetch
+    """
+    # Under WSGI the never-ending stream would be read to the end before sending
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'Live events are only served by the ASGI application (backend.asgi)'},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+    
+    try:
+        home_id = int(request.GET.get('home', ''))
+    except ValueError:
+        return JsonResponse({'error': 'home is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        user = await sync_to_async(_live_user)(request.GET.get('token'), home_id)
+    except PermissionError:
+        return JsonResponse(
+            {'error': "You don't have access to this smart home"}, status=status.HTTP_403_FORBIDDEN
+        )
+    if user is None:
+        return JsonResponse({'error': 'Invalid or missing token'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    response = StreamingHttpResponse(event_stream(home_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _id_list(value):
+    """Parse a comma-separated id list from a query parameter, or None when absent."""
+    if not value:
+        return None
+    try:
+        return [int(part) for part in value.split(',')]
+    except ValueError:
+        raise ValueError(f"Invalid id list: {value}")
+
+@api_view(['GET'])
+@renderer_classes([CSVRenderer, NDJSONRenderer])
+def export_logs(request, kind):
+    """
+    Streams 1-minute log history as CSV or NDJSON.
+    
+    GET /api/exports/{device|room|generation}/
+    
+    Query parameters:
+    - format: csv (default) or ndjson; the Accept header works too
+    - start_date, end_date: Inclusive day range (YYYY-MM-DD)
+    - ids: Comma-separated device, room or home ids, depending on kind
+    - gzip: 1 to receive a gzip-compressed file
+    
+    Only homes the user created or joined are exported. Rows are streamed in
+    chunks, so memory use does not grow with the size of the range.
+    """
+    if kind not in EXPORTS:
+        return Response({'error': f"Unknown export '{kind}'"}, status=status.HTTP_404_NOT_FOUND)
+
+    home_ids = None
+    if not request.user.is_superuser:
+        home_ids = SmartHome.objects.filter(
+            models.Q(creator=request.user) | models.Q(members=request.user)
+        ).values('id')
+
+    export_format = request.accepted_renderer.format
+    compress = request.query_params.get('gzip') in ('1', 'true')
+    try:
+        fields, rows = export_rows(
+            kind,
+            request.query_params.get('start_date'),
+            request.query_params.get('end_date'),
+            entity_ids=_id_list(request.query_params.get('ids')),
+            home_ids=home_ids
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        stream_export(fields, rows, export_format, compress),
+        content_type='application/gzip' if compress else request.accepted_renderer.media_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(kind, export_format, compress)}"'
+    return response
+
 class UserProfileViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows user profiles to be viewed or edited.
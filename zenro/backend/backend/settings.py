@@ -3,6 +3,7 @@ Core Django settings for the backend project.
 Remember to rotate SECRET_KEY and disable DEBUG in production.
 """
 
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -84,6 +85,29 @@ DATABASES = {
 }
 
 
+# Cache used for API responses (see api/cache.py). File based by default so the
+# minute tick, which runs as a separate cron process, and the web server share the
+# tick watermark; point it at Redis or Memcached when running several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'zenro_cache',
+        'OPTIONS': {
+            # Culling deletes entries at random, so leave room for the watermark and versions
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Cache alias for API responses and how long an entry may live; entries also stop
+# being used as soon as the next minute tick commits
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 120
+# Lifetime of the version numbers keying data that changes on user actions; an
+# expired version restarts from the current time, which invalidates its entries
+CACHE_VERSION_TIMEOUT = 86400
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -168,13 +192,31 @@ CORS_ALLOW_ALL_ORIGINS = True  # For development only
 # - aggregate_room_logs: Daily aggregation of room energy usage data
 # - aggregate_device_logs: Daily aggregation of device energy usage data  
 # - generate_device_logs: Creates 1-minute device log entries
+# - prune_old_minute_logs: Deletes 1-minute logs past the retention window
 CRONJOBS = [ 
     ('02 00 * * *', 'api.scheduled_scripts.aggregate_energy_generation'), # Run at 00:02 every day
     ('05 00 * * *', 'api.scheduled_scripts.aggregate_room_logs'),   # Run at 00:05 every day
     ('07 00 * * *', 'api.scheduled_scripts.aggregate_device_logs'), # Run at 00:07 every day
     ('* * * * *', 'api.scheduled_scripts.generate_minute_data'),    # Run every minute
+    ('30 03 * * *', 'api.scheduled_scripts.prune_old_minute_logs'), # Run at 03:30 every day
+    ('45 * * * *', 'api.scheduled_scripts.retry_deferred_rollups'), # Run at minute 45 of every hour
 ]
 
+# How long a nightly rollup waits for the last minute tick of the day to be committed
+# before giving up, and how often it checks the tick ledger while waiting
+ROLLUP_TICK_WAIT_SECONDS = 120
+ROLLUP_TICK_POLL_SECONDS = 1
+# Days deferred for missing minute ticks are retried hourly, and rolled up from the
+# data there is once they ended this many hours ago
+ROLLUP_DEFER_HOURS = 6
+
+# Retention of the 1-minute log tables: days older than LOG_RETENTION_DAYS are deleted
+# once their daily rollups are confirmed, LOG_PRUNE_CHUNK_SIZE rows per transaction
+# with a short pause in between so the minute tick never waits long for the database
+LOG_RETENTION_DAYS = 90
+LOG_PRUNE_CHUNK_SIZE = 500
+LOG_PRUNE_PAUSE_SECONDS = 0.05
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -187,3 +229,44 @@ SWAGGER_SETTINGS = {
 
 # HomeIO Integration settings
 HOME_IO_API_URL = 'http://10.101.186.87:9797'  # Your Windows machine IP
+# Keep-alive connections kept open to HomeIO, which is also the number of concurrent
+# requests of bulk commands, and the connect and read timeouts of every request, in seconds
+HOME_IO_POOL_SIZE = 10
+HOME_IO_CONNECT_TIMEOUT = 2
+HOME_IO_READ_TIMEOUT = 5
+
+# HomeIO circuit breaker (see api/home_io/circuit_breaker.py): it opens when at least
+# MIN_REQUESTS of the last WINDOW requests were made and FAILURE_RATE of them failed,
+# then probes after OPEN_SECONDS, doubling up to MAX_OPEN_SECONDS while probes fail
+HOME_IO_BREAKER_WINDOW = 50
+HOME_IO_BREAKER_MIN_REQUESTS = 10
+HOME_IO_BREAKER_FAILURE_RATE = 0.5
+HOME_IO_BREAKER_OPEN_SECONDS = 5
+HOME_IO_BREAKER_MAX_OPEN_SECONDS = 60
+
+# HomeIO command outbox (see api/outbox.py): commands claimed per batch, how often an
+# idle worker checks for new ones, attempts before a command is marked failed, and
+# after how many seconds a command claimed by a worker that died is sent again
+HOME_IO_OUTBOX_BATCH_SIZE = 50
+HOME_IO_OUTBOX_POLL_SECONDS = 0.5
+HOME_IO_COMMAND_MAX_ATTEMPTS = 5
+HOME_IO_COMMAND_CLAIM_TIMEOUT = 60
+
+# Page size of the 1-minute log endpoints (see api/pagination.py); one day of one
+# device, room or home is 1440 rows
+LOG_PAGE_SIZE = 1000
+LOG_MAX_PAGE_SIZE = 10000
+
+# Rows fetched per round trip while streaming log exports (see api/exports.py)
+EXPORT_CHUNK_SIZE = 2000
+
+# Longest packed binary series served by the log endpoints (a leap year of minutes)
+PACKED_SERIES_MAX_VALUES = 527040
+
+# Live event streams (see api/live.py): broker class, events queued per connection,
+# how often the tick watermark is checked and how long an idle stream waits before
+# a keep-alive comment, in seconds
+LIVE_BROKER = 'api.live.LocalBroker'
+LIVE_QUEUE_SIZE = 16
+LIVE_POLL_SECONDS = 5
+LIVE_HEARTBEAT_SECONDS = 15
@@ -528,20 +528,17 @@ function RoomsPage() {
                 
                 switch (selectedPeriod) {
                     case 'day':
-                        // Fetch 1-minute logs for the selected day
-                        const minuteResponse = await api.get(`/devicelogs1min/?device=${selectedEnergyDevice}`);
+                        // Fetch the selected day's usage summed per hour on the server
+                        const minuteResponse = await api.get(
+                            `/devicelogs1min/?device=${selectedEnergyDevice}&start_date=${selectedDate}&end_date=${selectedDate}&bucket=1h`
+                        );
                         console.log("Day data response:", minuteResponse.data);
                         
-                        const dailyLogs = minuteResponse.data.filter(log => {
-                            const logDate = log.created_at.split('T')[0];
-                            return logDate === selectedDate;
-                        });
-                        
-                        // Group by hour (0-23)
+                        // Place the hourly points on the 0-23 axis (hours without data stay 0)
                         const hourlyData = Array(24).fill(0);
-                        dailyLogs.forEach(log => {
-                            const hour = new Date(log.created_at).getHours();
-                            hourlyData[hour] += parseFloat(log.energy_usage);
+                        minuteResponse.data.points.forEach(point => {
+                            const hour = new Date(point.start).getHours();
+                            hourlyData[hour] += point.total;
                         });
                         
                         labels = Array.from({length: 24}, (_, i) => `${i}:00`);
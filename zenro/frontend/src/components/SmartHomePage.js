@@ -254,20 +254,14 @@ function SmartHomePage() {
         
         switch (selectedPeriod) {
           case 'day':
-            // Fetch and filter minute-level logs
-            const response = await api.get(`/roomlogs1min/?room=${selectedEnergyRoom}`);
+            // Fetch the selected day's usage summed per hour on the server
+            const response = await api.get(`/roomlogs1min/?room=${selectedEnergyRoom}&date=${selectedDate}&bucket=1h`);
             
-            const dailyLogs = response.data.filter(log => {
-              // Get date as string in format "YYYY-MM-DD"
-              const createdAtDateString = log.created_at.split('T')[0];
-              return createdAtDateString === selectedDate;
-            });
-            
-            // Group logs by hour
+            // Place the hourly points on the 0-23 axis (hours without data stay 0)
             const hourlyData = Array(24).fill(0);
-            dailyLogs.forEach(log => {
-              const hour = new Date(log.created_at).getHours();
-              hourlyData[hour] += log.energy_usage;
+            response.data.points.forEach(point => {
+              const hour = new Date(point.start).getHours();
+              hourlyData[hour] += point.total;
             });
             
             labels = Array.from({length: 24}, (_, i) => `${i}:00`);
@@ -517,19 +511,16 @@ function SmartHomePage() {
         
         switch (selectedPeriod) {
           case 'day':
-            // Fetch minute-level generation logs for the selected day
-            const response = await api.get(`/energy-generation/?home=${smartHomeId}`);
-            
-            const dailyLogs = response.data.filter(log => {
-              const createdAtDateString = log.created_at.split('T')[0];
-              return createdAtDateString === selectedDate;
-            });
+            // Fetch the selected day's generation summed per hour on the server
+            const response = await api.get(
+              `/energy-generation/?home=${smartHomeId}&start_date=${selectedDate}&end_date=${selectedDate}&bucket=1h`
+            );
             
-            // Group logs by hour
+            // Place the hourly points on the 0-23 axis (hours without data stay 0)
             const hourlyData = Array(24).fill(0);
-            dailyLogs.forEach(log => {
-              const hour = new Date(log.created_at).getHours();
-              hourlyData[hour] += log.energy_generation;
+            response.data.points.forEach(point => {
+              const hour = new Date(point.start).getHours();
+              hourlyData[hour] += point.total;
             });
             
             labels = Array.from({length: 24}, (_, i) => `${i}:00`);